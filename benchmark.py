@@ -0,0 +1,60 @@
+from sys import argv
+from src.bench.SyntheticPackage import SyntheticPackage
+from src.bench.Benchmark import Benchmark, compare, print_comparison
+from src.bench.Startup import StartupBenchmark
+import json
+
+def print_help():
+    print("USAGE:\n\tbenchmark.py [-package <dir>] [-generate <dir>] [options...]")
+    print("DESCRIPTION:")
+    print("\t-package <dir>\t\tDiscord package to benchmark (defaults to the generated one)")
+    print("\t-generate <dir>\t\tGenerate a synthetic package in <dir> first")
+    print("\t-lang <code>\t\tLocale of the package folders (defaults to en)")
+    print("\t-messages <n>\t\tNumber of generated messages (defaults to 100000)")
+    print("\t-channels <n>\t\tNumber of generated channels (defaults to 50)")
+    print("\t-events <n>\t\tNumber of generated Activity events (defaults to 0)")
+    print("\t-seed <n>\t\tSeed of the generator (defaults to 0)")
+    print("\t-repeat <n>\t\tRuns per measure, the best one is kept (defaults to 3)")
+    print("\t-no-memory\t\tDon't record peak memory (saves one traced run per measure)")
+    print("\t-startup\t\tAlso time quickload's startup in fresh processes (time to first prompt and first result)")
+    print("\t-output <file>\t\tWrite the JSON report to <file> (defaults to stdout)")
+    print("\t-compare <file>\t\tPrint the speedup of each measure against a previous report")
+
+def get_option(name, default=None):
+    if name in argv and argv.index(name) + 1 < len(argv):
+        return argv[argv.index(name) + 1]
+    return default
+
+if "-h" in argv or "--help" in argv:
+    print_help()
+    exit(0)
+
+lang = get_option("-lang", "en")
+package = get_option("-package")
+generate = get_option("-generate")
+
+if generate:
+    generator = SyntheticPackage(
+        generate,
+        lang=lang,
+        channels=int(get_option("-channels", 50)),
+        messages=int(get_option("-messages", 100_000)),
+        events=int(get_option("-events", 0)),
+        seed=int(get_option("-seed", 0)))
+    package = package or generator.generate()
+
+if not package:
+    print_help()
+    exit(1)
+
+report = Benchmark(package, lang, repeat=int(get_option("-repeat", 3)), measure_memory="-no-memory" not in argv).run()
+if "-startup" in argv:
+    report["results"].extend(StartupBenchmark(package, lang, repeat=int(get_option("-repeat", 3))).run())
+
+if get_option("-compare"):
+    print_comparison(compare(json.loads(open(get_option("-compare"), "r").read()), report))
+
+if get_option("-output"):
+    open(get_option("-output"), "w").write(json.dumps(report, indent=2))
+else:
+    print(json.dumps(report, indent=2))
@@ -1,11 +1,19 @@
-from sys import argv
-import json
+from sys import argv, stdout
+from src.FieldProfiler import FieldProfiler
 
 def print_help():
-    print("USAGE:\n\tget_unique_fields.py -kwords <keyword...> -files <file...>")
+    print("USAGE:\n\tget_unique_fields.py -files <file|dir...> [-kwords <keyword...>] [options...]")
     print("DESCRIPTION:")
-    print("\t-kwords <keywords...>\tKeys to look for value uniqueness")
-    print("\t-files <file...>\tDiscord json archive to look into, these files have lines ending in a line feed and their entries aren't wrapped in a parent object")
+    print("\t-files <file|dir...>\tDiscord json archives to look into, these files have lines ending in a line feed and their entries aren't wrapped in a parent object")
+    print("\t-kwords <keywords...>\tKeys to profile (defaults to every key)")
+    print("\t-top <n>\t\tMost frequent values reported per key (defaults to 10)")
+    print("\t-values\t\t\tAlso list the sorted distinct values of each key")
+    print("\t-hll\t\t\tApproximate the distinct counts and frequent values with fixed size sketches (for huge logs)")
+    print("\t-workers <n>\t\tWorker processes (defaults to the number of CPUs)")
+    print("\t-chunk <MiB>\t\tSize of the file chunks handed to the workers (defaults to 32)")
+    print("\t-text\t\t\tPrint a readable summary instead of JSON")
+
+OPTIONS = ("-files", "-kwords", "-top", "-workers", "-chunk", "-values", "-hll", "-text")
 
 def parse_arguments():
     files = []
@@ -14,45 +22,44 @@ def parse_arguments():
     while i < len(argv):
         if argv[i] == "-files":
             i += 1
-            while i < len(argv) and argv[i] != "-kwords":
+            while i < len(argv) and argv[i] not in OPTIONS:
                 files.append(argv[i])
                 i += 1
         elif argv[i] == "-kwords":
             i += 1
-            while i < len(argv) and argv[i] != "-files":
+            while i < len(argv) and argv[i] not in OPTIONS:
                 keywords.append(argv[i])
                 i += 1
         else:
             i += 1
     return files, keywords
 
+def get_option(name, default=None):
+    if name in argv and argv.index(name) + 1 < len(argv):
+        return argv[argv.index(name) + 1]
+    return default
+
 
 
-if "-h" or "--help" in argv:
+if "-h" in argv or "--help" in argv:
     print_help()
     exit(0)
 
 files, whitelist_keys = parse_arguments()
 
-if not files or not whitelist_keys:
-    raise SyntaxError
-
-output = {}
-for file_name in files:
-    with open(file_name, "r") as file:
-        for line in file:
-            a = json.loads(line.strip("\n"))
-
-            for key, value in a.items():
-                if type(value) != str or key not in whitelist_keys:
-                    continue
-                if not key in output.keys():
-                    output[key] = []
-                if value in output[key]:
-                    continue
-                output[key].append(value)
+if not files:
+    print_help()
+    exit(1)
 
-for value in output.values():
-    value.sort()
+profiler = FieldProfiler(
+    files,
+    keys=whitelist_keys,
+    approximate="-hll" in argv,
+    workers=int(get_option("-workers", 0)) or None,
+    chunk_size=int(float(get_option("-chunk", 32)) * 2**20)).run()
 
-print(json.dumps(output, ensure_ascii=False))
+top = int(get_option("-top", 10))
+if "-text" in argv:
+    print(profiler.render(top))
+else:
+    profiler.write_json(stdout, top=top, values="-values" in argv)
@@ -0,0 +1,192 @@
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from collections import Counter, deque
+from datetime import datetime
+from array import array
+from src.Config import Config
+from src.Progress import ProgressSink, Task, sink
+from src.utils.JsonLines import CHUNK_SIZE, Chunk, find_jsonl_files, file_size, chunks, chunk_lines
+from src.utils.Instrumentation import METRICS
+from src.utils.Parallel import ordered_map
+
+import os
+import json
+import math
+
+"""
+    Activity event logs (Activity/analytics, Activity/reporting, ...): newline-delimited JSON events.
+
+    The files are split into line aligned chunks parsed by a process pool (byte ranges of the files, or the
+    bytes of ZIP members streamed from the archive). Each worker keeps only the
+    whitelisted fields and returns them dictionary encoded (a vocabulary and an array of codes per field),
+    the chunks are then merged in file order into one compact column per field.
+"""
+
+DEFAULT_FIELDS = ("event_type", "timestamp", "channel_id", "guild_id", "os", "browser", "device", "country_code", "city")
+
+type ChunkResult = Tuple[int, int, Dict[str, Tuple[List[Any], array]], array]
+
+
+class Column:
+    """Dictionary encoded column: values[codes[i]] is the value of row i, values[0] is always None (missing)"""
+    def __init__(self):
+        self.values: List[Any] = [None]
+        self.codes = array('I')
+        self._lookup: Dict[Any, int] = {None: 0}
+
+    def code(self, value: Any) -> int:
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def extend(self, values: List[Any], codes: array):
+        """Append rows encoded against another vocabulary"""
+        remap = array('I', (self.code(v) for v in values))
+        self.codes.extend(remap[c] for c in codes)
+
+    def counts(self) -> Dict[Any, int]:
+        return {self.values[code]: n for code, n in Counter(self.codes).most_common()}
+
+    def __getitem__(self, i: int) -> Any:
+        return self.values[self.codes[i]]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __repr__(self):
+        return f"<Column {len(self.codes)} rows, {len(self.values) - 1} distinct values>"
+
+
+def _parse_timestamp(value: Any) -> float:
+    # Exports quote the timestamps twice: "\"2021-03-04T12:34:56.789Z\""
+    if not isinstance(value, str):
+        return math.nan
+    try:
+        return datetime.fromisoformat(value.strip('"')).timestamp()
+    except ValueError:
+        return math.nan
+
+
+def _parse_chunk(chunk: Chunk, fields: Tuple[str, ...], event_types: Tuple[str, ...]) -> ChunkResult:
+    """Parse one chunk (runs in a worker process)
+
+    Returns (events kept, malformed lines, {field: (vocabulary, codes)}, timestamps)
+    """
+    columns = {field: Column() for field in fields if field != "timestamp"}
+    timestamps = array('d')
+    keep_time = "timestamp" in fields
+    # A line can only match if one of the event types appears in it, quoted: cheap test before decoding
+    needles = [json.dumps(t).encode() for t in event_types]
+    kept = errors = 0
+    for line in chunk_lines(chunk):
+        if needles and not any(needle in line for needle in needles):
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            errors += 1
+            continue
+        if event_types and event.get("event_type") not in event_types:
+            continue
+        kept += 1
+        for field, column in columns.items():
+            value = event.get(field)
+            if isinstance(value, (list, dict)):
+                value = json.dumps(value, ensure_ascii=False)
+            column.codes.append(column.code(value))
+        if keep_time:
+            timestamps.append(_parse_timestamp(event.get("timestamp")))
+    return kept, errors, {field: (column.values, column.codes) for field, column in columns.items()}, timestamps
+
+
+def _sized(sizes: deque, produced: Iterable[Chunk]) -> Iterator[Chunk]:
+    """The chunks, recording the size of each one as it is produced"""
+    for chunk in produced:
+        sizes.append(len(chunk) if isinstance(chunk, bytes) else chunk[2] - chunk[1])
+        yield chunk
+
+
+class ActivityRepo:
+    """Whitelisted fields of the Activity event logs, as columns
+
+    Args:
+        paths (Iterable[str]): Files or directories to load (defaults to the package's Activity folders)
+        fields (Iterable[str]): Fields to keep, the others are dropped while parsing
+        event_types (Iterable[str]): Only keep these events (all of them when empty)
+        workers (int): Size of the process pool (defaults to the number of CPUs, 1 parses in process)
+        chunk_size (int): Bytes parsed per task
+        progress (ProgressSink): Where parsing is reported, chunk by chunk (defaults to the current sink)
+    """
+    def __init__(self, paths: Iterable[str] | None = None, fields: Iterable[str] = DEFAULT_FIELDS, event_types: Iterable[str] = (),
+                 workers: int | None = None, chunk_size: int = CHUNK_SIZE, progress: ProgressSink | None = None):
+        self.fields = tuple(fields)
+        self.event_types = tuple(event_types)
+        self.files = find_jsonl_files(*(paths if paths is not None else (Config.ACTIVITY, Config.ACTIVITIES)))
+        self.columns: Dict[str, Column] = {field: Column() for field in self.fields if field != "timestamp"}
+        self.timestamps = array('d')
+        self.n_events = 0
+        self.n_errors = 0
+
+        size = sum(file_size(path) for path in self.files)
+        METRICS.count("activity.bytes", size)
+        # Chunks are produced lazily: members of a ZIP are decompressed as the pool consumes them
+        # Sizes of the chunks handed to the pool, popped as their results are merged
+        sizes = deque()
+        tasks = _sized(sizes, (chunk for path in self.files for chunk in chunks(path, chunk_size)))
+        parse = partial(_parse_chunk, fields=self.fields, event_types=self.event_types)
+        workers = min(workers or os.cpu_count() or 1, max(1, math.ceil(size / chunk_size)))
+        with METRICS.phase("activity.parse"), (progress or sink()).task("activity", size, "bytes") as task:
+            if workers == 1:
+                self._merge(map(parse, tasks), sizes, task)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    self._merge(ordered_map(pool, parse, tasks, 2 * workers), sizes, task)
+        METRICS.count("activity.events", self.n_events)
+
+    def _merge(self, results: Iterable[ChunkResult], sizes: deque, task: Task):
+        # Chunks come back in submission order, so rows stay in file order (and sizes pop in the same order)
+        with METRICS.phase("activity.merge"):
+            for kept, errors, columns, timestamps in results:
+                task.advance(sizes.popleft(), events=kept)
+                METRICS.count("activity.chunks")
+                self.n_events += kept
+                self.n_errors += errors
+                for field, (values, codes) in columns.items():
+                    self.columns[field].extend(values, codes)
+                self.timestamps.extend(timestamps)
+
+    def column(self, field: str) -> Column:
+        if field not in self.columns:
+            raise KeyError(f"Field '{field}' wasn't loaded (loaded: {', '.join(self.fields)})")
+        return self.columns[field]
+
+    def count_by(self, field: str) -> Dict[Any, int]:
+        """Number of events per value of a field, most frequent first"""
+        return self.column(field).counts()
+
+    def get_event_types(self) -> List[str]:
+        return [v for v in self.column("event_type").values if v is not None]
+
+    def row(self, i: int) -> Dict[str, Any]:
+        row = {field: column[i] for field, column in self.columns.items()}
+        if "timestamp" in self.fields:
+            ts = self.timestamps[i]
+            row["timestamp"] = None if math.isnan(ts) else datetime.fromtimestamp(ts)
+        return row
+
+    def get_n_events(self):
+        return self.n_events
+
+    def __len__(self):
+        return self.n_events
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self.row(i) for i in range(self.n_events))
+
+    def __repr__(self):
+        return f"<ActivityRepo containing {self.n_events} events from {len(self.files)} files ({len(self.fields)} fields)>"
+
+__all__ = ['ActivityRepo', 'Column', 'DEFAULT_FIELDS']
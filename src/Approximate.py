@@ -0,0 +1,210 @@
+from typing import Any, Dict, Hashable, List, Literal, Tuple
+from statistics import NormalDist
+from src.MessageRepo import Message
+from src.utils.Instrumentation import METRICS
+import src.Stat as s
+
+import math
+import time
+import random
+
+"""
+    Approximate evaluation of Stat queries, for exploring large packages interactively.
+
+    Every source of the environment is replaced by a sample, uniform or stratified (per channel or
+    per month, each stratum sampled at the same rate and holding at least one message). Each sampled
+    message carries a weight (stratum size / stratum sample size) and the Stat engine computes weighted
+    estimates of totals and averages (see "_weights" in ASTNode.eval).
+
+    Confidence intervals come from the random groups method: the sample is dealt into `replicates`
+    groups, the query is evaluated on each group alone (weights scaled up accordingly) and the spread of
+    those replicate estimates gives the variance of the full sample estimate. This works for any query
+    shape (ratios, percentages, per group results) at the cost of about one more pass over the sample.
+
+    Groups with no sampled message are missing from the result, so averages over small groups (per day,
+    per hour...) are overestimated at low rates: stratify per month or raise the rate for those.
+
+    This mode is never used unless explicitly asked for.
+"""
+
+type Strata = Literal["uniform", "channel", "month"]
+STRATA: Tuple[str, ...] = ("uniform", "channel", "month")
+REPLICATES = 20
+# Messages evaluated to measure the cost of a query when sizing a sample from a time budget
+PILOT_SIZE = 2000
+
+
+class Estimate:
+    """An approximate result and its confidence interval"""
+    def to_dict(self):
+        return {
+            "estimate": self.value,
+            "low": self.low,
+            "high": self.high,
+            "confidence": self.confidence
+        }
+
+    def __init__(self, value: float, stderr: float, confidence: float):
+        self.value = value
+        self.stderr = stderr
+        self.confidence = confidence
+        margin = NormalDist().inv_cdf((1 + confidence) / 2) * stderr
+        self.low = value - margin
+        self.high = value + margin
+
+    def __str__(self):
+        return f"~{self.value:.6g} ({self.confidence:.0%} CI {self.low:.6g} .. {self.high:.6g})"
+
+    def __repr__(self):
+        return f"<Estimate {self}>"
+
+
+class ApproximateResult:
+    """Result of an approximate query: a single Estimate or one Estimate per group label"""
+    def to_dict(self):
+        return {
+            "result": self.value.to_dict() if isinstance(self.value, Estimate) else {str(k): v.to_dict() for k, v in self.value.items()},
+            "sample_rate": self.rate,
+            "sampled": self.sampled,
+            "population": self.population,
+            "strata": self.strata,
+            "seconds": self.seconds
+        }
+
+    def __init__(self, value: 'Estimate | Dict[Hashable, Estimate]', rate: float, sampled: int, population: int, strata: str, seconds: float):
+        self.value = value
+        self.rate = rate
+        self.sampled = sampled
+        self.population = population
+        self.strata = strata
+        self.seconds = seconds
+
+    def __str__(self):
+        header = f"{self.rate:.2%} {self.strata} sample ({self.sampled} of {self.population} messages, {self.seconds * 1000:.0f} ms)"
+        if isinstance(self.value, Estimate):
+            return f"{self.value}\n{header}"
+        lines = [f"\t{label}: {estimate}" for label, estimate in self.value.items()]
+        return "\n".join([*lines, header])
+
+
+def _stratum(strata: str):
+    if strata == "channel":
+        return lambda m: m.channel.key
+    if strata == "month":
+        return lambda m: (m.timestamp.year, m.timestamp.month)
+    return None
+
+
+def strata_of(data: List[Message], strata: Strata = "uniform") -> List[List[int] | range]:
+    """Positions of the messages of each stratum"""
+    key = _stratum(strata)
+    if key is None:
+        return [range(len(data))]
+    groups: Dict[Any, List[int]] = {}
+    for i, message in enumerate(data):
+        groups.setdefault(key(message), []).append(i)
+    return list(groups.values())
+
+
+def sample(data: List[Message], rate: float, strata: 'Strata | List[List[int] | range]' = "uniform", rng: random.Random | None = None) -> Tuple[List[Message], Dict[int, float]]:
+    """Sample data at the given rate, returns the sampled messages (in data order) and their weights by message id
+
+    strata is either a strata name or the output of strata_of(data, ...)
+    """
+    rng = rng or random.Random()
+    if rate >= 1:
+        return list(data), {id(m): 1.0 for m in data}
+    groups = strata_of(data, strata) if isinstance(strata, str) else strata
+    picked: List[int] = []
+    weights: Dict[int, float] = {}
+    for positions in groups:
+        n = min(len(positions), max(1, round(rate * len(positions))))
+        chosen = rng.sample(positions, n)
+        weight = len(positions) / n
+        for i in chosen:
+            weights[id(data[i])] = weight
+        picked.extend(chosen)
+    picked.sort()
+    return [data[i] for i in picked], weights
+
+
+def _evaluate(node: 's.ASTNode', sources: Dict[str, List[Message]], weights: Dict[int, float]) -> Any:
+    return node.eval({**sources, "_weights": weights})
+
+
+def _flatten(result: Any) -> Dict[Hashable, float]:
+    if isinstance(result, s.Groups):
+        return dict(zip(result.labels, result))
+    if isinstance(result, (int, float)):
+        return {None: result}
+    raise ValueError("Only aggregated queries (average, total, ratio...) or per group counts can be approximated")
+
+
+def estimate(node: 's.ASTNode', env: 's.SourceEnvironment', rate: float | None = None, budget: float | None = None,
+             strata: Strata = "uniform", confidence: float = 0.95, replicates: int = REPLICATES, seed: int | None = None) -> ApproximateResult:
+    """Evaluate a parsed query on a sample of its sources
+
+    Args:
+        rate (float): Fraction of the messages sampled
+        budget (float): Seconds the evaluation should take, used to choose the rate when none is given
+        strata (str): "uniform", "channel" or "month"
+        confidence (float): Level of the confidence intervals
+        replicates (int): Random groups used to estimate the variance
+    """
+    if strata not in STRATA:
+        raise ValueError(f"Unknown strata '{strata}' (expected one of {', '.join(STRATA)})")
+    if rate is None and budget is None:
+        raise ValueError("Either a sample rate or a time budget is required")
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    sources = {name: value for name, value in env.items() if not name.startswith("_")}
+    population = len(sources.get("default", []))
+
+    data = sources.get("default", [])
+    with METRICS.phase("stat.sample"):
+        groups = strata_of(data, strata)
+    if rate is None:
+        rate = _rate_for_budget(node, sources, budget - (time.perf_counter() - start), rng, population)
+    rate = min(1.0, max(rate, 1 / max(1, population)))
+
+    # Collections are subsets of the default source: they keep the sampled messages of the default
+    # source with their weights (domain estimation), so a message has the same weight everywhere
+    with METRICS.phase("stat.sample"):
+        base, weights = sample(data, rate, groups, rng)
+        sampled = {name: base if name == "default" else [m for m in messages if id(m) in weights] for name, messages in sources.items()}
+
+    value = _flatten(_evaluate(node, sampled, weights))
+
+    # Random groups: deal every sampled message into one of the replicates
+    replicates = max(2, replicates)
+    group_of = {key: rng.randrange(replicates) for key in weights}
+    replicate_values: List[Dict[Hashable, float]] = []
+    for k in range(replicates):
+        subset = {name: [m for m in messages if group_of[id(m)] == k] for name, messages in sampled.items()}
+        scaled = {key: w * replicates for key, w in weights.items() if group_of[key] == k}
+        replicate_values.append(_flatten(_evaluate(node, subset, scaled)))
+
+    estimates: Dict[Hashable, Estimate] = {}
+    for label, v in value.items():
+        # A group missing from a replicate was estimated at 0 there
+        values = [r.get(label, 0) for r in replicate_values]
+        mean = sum(values) / replicates
+        variance = sum((x - mean) ** 2 for x in values) / (replicates * (replicates - 1))
+        estimates[label] = Estimate(v, math.sqrt(variance), confidence)
+
+    result = estimates[None] if list(estimates) == [None] else estimates
+    return ApproximateResult(result, rate, len(weights), population, strata, time.perf_counter() - start)
+
+
+def _rate_for_budget(node: 's.ASTNode', sources: Dict[str, List[Message]], budget: float, rng: random.Random, population: int) -> float:
+    """Time a pilot evaluation and pick the rate whose evaluations (estimate + replicates, ~2 passes) fit the remaining budget"""
+    if population == 0:
+        return 1.0
+    start = time.perf_counter()
+    base, weights = sample(sources.get("default", []), min(1.0, PILOT_SIZE / population), "uniform", rng)
+    _evaluate(node, {name: base if name == "default" else [m for m in messages if id(m) in weights] for name, messages in sources.items()}, weights)
+    elapsed = time.perf_counter() - start
+    per_message = elapsed / max(1, len(weights))
+    return max(0.0, budget - elapsed) / (2 * per_message * population) if per_message > 0 else 1.0
+
+__all__ = ['Estimate', 'ApproximateResult', 'estimate', 'sample', 'strata_of', 'STRATA']
@@ -0,0 +1,114 @@
+from typing import Dict, FrozenSet, Tuple
+from array import array
+from threading import Lock
+from src.utils.Interner import Interner
+
+"""
+    Attachments of the messages, parsed once when the messages are built.
+
+    The package lists the attachments of a message as a space separated string of CDN URLs. Each URL becomes
+    a row of the AttachmentTable of the repo loading the message, with three columns:
+        - the interned host of the URL (cdn.discordapp.com...)
+        - the interned extension of the file name (png, mp4...), mapped to a media type by MEDIA_TYPES
+        - a hash of the file name (case insensitive), to find a file sent several times
+    Each message holds its table and the range of its rows in it (Message.attachment_table and
+    attachment_rows): counting attachments is len() and type or host predicates compare small ints. The
+    table lives as long as the messages of its repo: loading a package again builds a new one, the old one
+    goes with the old messages. Hosts and extensions are interned in tables shared by every repo (HOSTS,
+    EXTENSIONS), so keys stay comparable between the messages of different packages. MessageIndex turns
+    the rows into posting sets per extension, host and file name, over the positions of the list it indexes.
+
+    The export has no file size, attachments can't be classed by size.
+"""
+
+MEDIA_TYPES = {
+    "image": ("png", "jpg", "jpeg", "gif", "webp", "bmp", "tif", "tiff", "heic", "avif", "svg"),
+    "video": ("mp4", "mov", "webm", "mkv", "avi", "m4v", "wmv"),
+    "audio": ("mp3", "ogg", "wav", "flac", "m4a", "opus", "aac"),
+    "text": ("txt", "md", "log", "json", "csv", "xml", "yml", "yaml", "py", "js", "html", "css"),
+    "document": ("pdf", "doc", "docx", "odt", "rtf", "xls", "xlsx", "ods", "ppt", "pptx", "odp"),
+    "archive": ("zip", "rar", "7z", "tar", "gz", "bz2", "xz")
+}
+# Extension -> media type
+EXTENSION_TYPES = {extension: kind for kind, extensions in MEDIA_TYPES.items() for extension in extensions}
+
+HOSTS = Interner()
+EXTENSIONS = Interner()
+
+NO_ATTACHMENTS = range(0)
+
+# (kind of key, names, size of the interner) -> keys, see extension_keys and host_keys
+_keys: Dict[Tuple[str, Tuple[str, ...], int], FrozenSet[int]] = {}
+
+
+def parse_url(url: str) -> Tuple[str, str, str]:
+    """Host, file name and extension (lowercased, "" when there is none) of an attachment URL"""
+    scheme, _, rest = url.partition("://")
+    if not rest:
+        rest = scheme
+    host, _, path = rest.partition("/")
+    name = path.split("?", 1)[0].split("#", 1)[0].rsplit("/", 1)[-1]
+    extension = name.rsplit(".", 1)[1].lower() if "." in name else ""
+    return host.rsplit("@", 1)[-1].split(":", 1)[0].lower(), name, extension
+
+
+def name_hash(name: str) -> int:
+    """Hash of a file name, only stable within a process"""
+    return hash(name.casefold()) & 0xFFFF_FFFF_FFFF_FFFF
+
+
+def extension_keys(*kinds: str) -> FrozenSet[int]:
+    """Keys of the extensions given (png...) or belonging to the media types given (image...), case insensitive"""
+    key = ("extension", kinds, len(EXTENSIONS))
+    if key not in _keys:
+        wanted = {kind.lower().lstrip(".") for kind in kinds}
+        _keys[key] = frozenset(i for i, extension in enumerate(EXTENSIONS.ids) if extension in wanted or EXTENSION_TYPES.get(extension) in wanted)
+    return _keys[key]
+
+
+def host_keys(*hosts: str) -> FrozenSet[int]:
+    """Keys of the hosts given or of their subdomains (discordapp.com matches cdn.discordapp.com)"""
+    key = ("host", hosts, len(HOSTS))
+    if key not in _keys:
+        wanted = tuple(host.lower() for host in hosts)
+        _keys[key] = frozenset(i for i, host in enumerate(HOSTS.ids) if any(host == w or host.endswith("." + w) for w in wanted))
+    return _keys[key]
+
+
+class AttachmentTable:
+    """Columns of the parsed attachments of a repo, a row per URL, rows are only ever appended"""
+    def __init__(self):
+        self.hosts = array('I')
+        self.extensions = array('I')
+        self.name_hashes = array('Q')
+        self._lock = Lock()
+
+    def add(self, raw: str) -> range:
+        """Append the attachments of a message, returns its rows"""
+        hosts, extensions, hashes = [], [], []
+        for url in raw.split():
+            host, name, extension = parse_url(url)
+            hosts.append(HOSTS.intern(host))
+            extensions.append(EXTENSIONS.intern(extension))
+            hashes.append(name_hash(name))
+        if not hosts:
+            return NO_ATTACHMENTS
+        with self._lock:
+            start = len(self.hosts)
+            self.hosts.extend(hosts)
+            self.extensions.extend(extensions)
+            self.name_hashes.extend(hashes)
+        return range(start, start + len(hosts))
+
+    def count_in(self, rows: range, column: str, keys: FrozenSet[int]) -> int:
+        """Rows of a message whose value in a column ("hosts", "extensions" or "name_hashes") is one of keys"""
+        values = getattr(self, column)
+        return sum(1 for row in rows if values[row] in keys)
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __repr__(self):
+        return f"<AttachmentTable {len(self.hosts)} attachments, {len(HOSTS)} hosts, {len(EXTENSIONS)} extensions>"
+
+__all__ = ['AttachmentTable', 'HOSTS', 'EXTENSIONS', 'MEDIA_TYPES', 'EXTENSION_TYPES', 'NO_ATTACHMENTS', 'parse_url', 'name_hash', 'extension_keys', 'host_keys']
@@ -2,38 +2,34 @@ from typing import Dict, Callable, List, Any
 from enum import Enum
 
 from src.Config import Config
-from src.MessageRepo import MessageRepo, Message
+from src.MessageRepo import Message
+from src.Federation import FederatedRepo, load_repo, account_label
 from src.Filter import Filter, FILTERS
 from src.FilterEngine import FilterEngine
 from src.CLI.CommandReturn import CommandReturn
+from src.CLI.CommandRegistry import CommandRegistry
+from src.Session import Session
 import src.Stat as s
 import src.utils.Strings as strings
 
 import os
-import runpy
 
 COMMAND_DIR_PATH = os.path.join(os.path.dirname(__file__), "commands")
+REGISTRY: CommandRegistry | None = None
 
 def fn_Help(args: List[str], env: Dict[str, Any]) -> CommandReturn:
-    command_list = [c for c in os.listdir(COMMAND_DIR_PATH) if c.split('.')[-1] == 'py']
-
     if len(args) == 1:
-        for file in command_list:
-            command = file.split('.')[0]
-            path = os.path.join(COMMAND_DIR_PATH, file)
-            ns = runpy.run_path(path)
-            print(f"\t{command:<20} {ns.get("SHORT_DESCRIPTION", "")}")
+        for command in REGISTRY:
+            print(f"\t{command.name:<20} {command.short_description}")
     else:
-        command = args[1]
-        if command + ".py" not in command_list:
+        command = REGISTRY.get(args[1])
+        if command is None:
             return CommandReturn.COMMAND_NOT_FOUND
-        path = os.path.join(COMMAND_DIR_PATH, command + ".py")
-        ns = runpy.run_path(path)
         print("USAGE:")
-        for usage in ns.get("USAGE", []):
+        for usage in command.usage:
             print("\t" + usage)
         print("DESCRIPTION:")
-        print(ns.get("DESCRIPTION", ""))
+        print(command.description)
     return CommandReturn.SUCCESS
 
 def fn_Quit(args: List[str], env: Dict[str, Any]) -> CommandReturn:
@@ -45,19 +41,18 @@ BUILTINS: Dict[str, Callable[[List[str], List[str]], Any]] = {
 }
 
 def run_command(args: List[str], env: Dict[str, Any]) -> int:
-    ns = runpy.run_path(os.path.join(COMMAND_DIR_PATH, args[0] + ".py"))
-    if ns.get("command", ""):
-        return ns["command"](args, env)
+    command = REGISTRY.get(args[0])
+    if command is not None and command.fn:
+        return command.fn(args, env)
 
 def run_command_or_builtin(args: List[str], env: Dict[str, Any]) -> int:
     ret_value: CommandReturn = CommandReturn.SUCCESS
-    command_list = [c.split('.')[0] for c in os.listdir(COMMAND_DIR_PATH) if c.split('.')[-1] == 'py']
     command = args[0]
 
 
     if command in BUILTINS:
         ret_value = BUILTINS[command](args, env)
-    elif command in command_list:
+    elif command in REGISTRY:
         ret_value = run_command(args, env)
     else:
         ret_value = CommandReturn.COMMAND_NOT_FOUND
@@ -65,13 +60,21 @@ def run_command_or_builtin(args: List[str], env: Dict[str, Any]) -> int:
     return ret_value
 
 
-def start():
-    repo = MessageRepo(Config.MESSAGES)
+def start(hot_reload: bool = False):
+    global REGISTRY
+    REGISTRY = CommandRegistry(COMMAND_DIR_PATH, hot_reload=hot_reload)
+    repo = load_repo()
+    session = Session(repo)
 
     print("\n\tWelcome to the F9 Quickload Command Line Interface.")
-    print(f"\tThe given path to the discord package is {Config.ROOT}.")
-    print(f"\tThe user this package belongs to is {Config.USER_DATA["username"]} (global name: {Config.USER_DATA["global_name"]}, id: {Config.USER_ID})")
-    print(f"\tThe package contains {repo.get_n_messages()} messages in {repo.get_n_channels()} channels.")
+    if isinstance(repo, FederatedRepo):
+        print(f"\t{repo.get_n_accounts()} packages are loaded together: {", ".join(config.ROOT for config in repo.configs)}.")
+        print(f"\tThe users they belong to are {", ".join(map(account_label, repo.accounts))}.")
+        print(f"\tThe packages contain {repo.get_n_messages()} messages in {repo.get_n_channels()} channels.")
+    else:
+        print(f"\tThe given path to the discord package is {Config.ROOT}.")
+        print(f"\tThe user this package belongs to is {Config.USER_DATA["username"]} (global name: {Config.USER_DATA["global_name"]}, id: {Config.USER_ID})")
+        print(f"\tThe package contains {repo.get_n_messages()} messages in {repo.get_n_channels()} channels.")
 
     print()
     print("If this is not your account, and if the owner of this account hasn't given you permission to exploit his data, please quit immediately and delete the archive.")
@@ -87,7 +90,7 @@ def start():
             line = input("> ")
             tokens = strings.tokenize(line)
             if len(tokens) > 0:
-                last_return = run_command_or_builtin(tokens, {})
+                last_return = run_command_or_builtin(tokens, session)
             if last_return == CommandReturn.QUIT:
                 break
             if last_return == CommandReturn.COMMAND_NOT_FOUND:
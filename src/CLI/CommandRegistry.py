@@ -0,0 +1,113 @@
+from typing import Dict, Callable, List, Any
+from types import ModuleType
+from src.CLI.CommandReturn import CommandReturn
+
+import os
+import importlib.util
+
+type CommandCallable = Callable[[List[str], Any], CommandReturn]
+
+class Command:
+    """A command module imported on first use and kept in memory"""
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.mtime: float = 0.0
+        self.module: ModuleType | None = None
+
+    def load(self):
+        """(Re)import the command module from its file"""
+        spec = importlib.util.spec_from_file_location(f"src.CLI.commands.{self.name}", self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.module = module
+        self.mtime = os.stat(self.path).st_mtime
+
+    def loaded(self) -> ModuleType:
+        if self.module is None:
+            self.load()
+        return self.module
+
+    def is_stale(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime != self.mtime
+        except FileNotFoundError:
+            return False
+
+    @property
+    def fn(self) -> CommandCallable | None:
+        return getattr(self.loaded(), "command", None)
+
+    @property
+    def usage(self) -> List[str]:
+        return getattr(self.loaded(), "USAGE", [])
+
+    @property
+    def short_description(self) -> str:
+        return getattr(self.loaded(), "SHORT_DESCRIPTION", "")
+
+    @property
+    def description(self) -> str:
+        return getattr(self.loaded(), "DESCRIPTION", "")
+
+    def __repr__(self):
+        return f"<Command '{self.name}' from {self.path}>"
+
+class CommandRegistry:
+    """Lists the commands of a directory, imports each one on first use and serves them from memory
+
+    When hot_reload is set, a command is re-imported whenever its file's mtime changes,
+    and the directory is rescanned whenever its own mtime changes (file added or removed).
+    """
+    def __init__(self, dir_path: str, hot_reload: bool = False):
+        self.dir_path = dir_path
+        self.hot_reload = hot_reload
+        self.commands: Dict[str, Command] = {}
+        self.dir_mtime: float = 0.0
+        self.scan()
+
+    def scan(self):
+        """Rescan the command directory, keeping already imported commands that didn't change"""
+        self.dir_mtime = os.stat(self.dir_path).st_mtime
+        commands: Dict[str, Command] = {}
+        for file in sorted(os.listdir(self.dir_path)):
+            name, _, ext = file.rpartition('.')
+            if ext != 'py' or not name:
+                continue
+            known = self.commands.get(name)
+            if known is not None and not known.is_stale():
+                commands[name] = known
+            else:
+                commands[name] = Command(name, os.path.join(self.dir_path, file))
+        self.commands = commands
+
+    def _check_reload(self):
+        if os.stat(self.dir_path).st_mtime != self.dir_mtime:
+            self.scan()
+
+    def get(self, name: str) -> Command | None:
+        if self.hot_reload:
+            self._check_reload()
+        command = self.commands.get(name)
+        if command is not None and self.hot_reload and command.is_stale():
+            command.load()
+        return command
+
+    def names(self) -> List[str]:
+        if self.hot_reload:
+            self._check_reload()
+        return list(self.commands.keys())
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return iter([self.get(name) for name in self.names()])
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __repr__(self):
+        return f"<CommandRegistry of {len(self.commands)} commands in {self.dir_path}{' (hot reload)' if self.hot_reload else ''}>"
+
+__all__ = ['Command', 'CommandRegistry']
@@ -0,0 +1,29 @@
+from typing import List
+from src.CLI.CommandReturn import CommandReturn
+from src.FilterParser import FilterSyntaxError
+from src.Session import Session, SessionError
+import src.utils.Strings as strings
+
+SHORT_DESCRIPTION: str = "Defines a named collection of messages from a filter expression"
+USAGE: List[str] = [
+    "define NAME FILTER...",
+]
+DESCRIPTION: str = "\tFilters the loaded messages and stores the matching ones as the collection NAME" \
+"\n\tAn existing collection with the same name is replaced" \
+"\n\n\tNAME\tThe name of the collection, usable in queries as #NAME (names are case insensitive)" \
+"\n\tFILTER\tA filter expression, filters are combined with & (and), | (or), ~ (not) and parenthesis" \
+"\n\t\tArguments containing spaces are written between quotes" \
+"\n\n\tExample:" \
+"\n\t\tdefine dms2023 IsDM & SentBetween(2023-01-01, 2024-01-01) & ~MessageContains('good night')"
+
+def command(args: List[str], env: Session) -> CommandReturn:
+    if len(args) < 3:
+        print("Usage: " + USAGE[0])
+        return CommandReturn.SUCCESS
+    try:
+        collection = env.define(args[1], strings.join_args(args, 2))
+    except (FilterSyntaxError, SessionError) as e:
+        print(f"define: {e}")
+        return CommandReturn.SUCCESS
+    print(f"{collection.name}: {len(collection)} messages")
+    return CommandReturn.SUCCESS
@@ -0,0 +1,17 @@
+from typing import List
+from src.CLI.CommandReturn import CommandReturn
+from src.Session import Session, SessionError
+
+SHORT_DESCRIPTION: str = "Drops collections from the dynamic environment"
+USAGE: List[str] = [
+    "drop NAME...",
+]
+DESCRIPTION: str = "\tRemoves the given collections along with the cached statistics computed from them"
+
+def command(args: List[str], env: Session) -> CommandReturn:
+    for name in args[1:]:
+        try:
+            env.drop(name)
+        except SessionError as e:
+            print(f"drop: {e}")
+    return CommandReturn.SUCCESS
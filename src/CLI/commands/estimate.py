@@ -0,0 +1,43 @@
+from typing import List
+from src.CLI.CommandReturn import CommandReturn
+from src.Session import Session, SessionError
+from src.Approximate import STRATA
+import src.Stat as s
+import src.utils.Strings as strings
+
+SHORT_DESCRIPTION: str = "Approximates a statistic on a sample of the messages"
+USAGE: List[str] = [
+    "estimate [--rate RATE | --budget SECONDS] [--strata STRATA] [--confidence LEVEL] [--seed N] QUERY...",
+]
+DESCRIPTION: str = "\tEvaluates QUERY like 'query' but on a random sample of the messages, and prints" \
+"\n\tthe estimate with its confidence interval (results are not cached)" \
+"\n\n\t--rate RATE\t\tFraction of the messages sampled (defaults to 0.05)" \
+"\n\t--budget SECONDS\tPick the largest sample evaluated within this time instead" \
+f"\n\t--strata STRATA\t\tSample each {', '.join(STRATA[1:])} separately, or the whole data at once with {STRATA[0]} (default)" \
+"\n\t--confidence LEVEL\tLevel of the confidence intervals (defaults to 0.95)" \
+"\n\t--seed N\t\tSeed of the sampler, to reproduce an estimate" \
+"\n\n\tExample:" \
+"\n\t\testimate --budget 0.5 --strata month the average number of words per day"
+
+OPTIONS = {"--rate": float, "--budget": float, "--strata": str, "--confidence": float, "--seed": int}
+
+def command(args: List[str], env: Session) -> CommandReturn:
+    options = {}
+    i = 1
+    try:
+        while i < len(args) and args[i] in OPTIONS:
+            options[args[i][2:]] = OPTIONS[args[i]](args[i + 1])
+            i += 2
+    except (IndexError, ValueError):
+        print("Usage: " + USAGE[0])
+        return CommandReturn.SUCCESS
+    if i >= len(args):
+        print("Usage: " + USAGE[0])
+        return CommandReturn.SUCCESS
+    if "rate" not in options and "budget" not in options:
+        options["rate"] = 0.05
+    try:
+        print(env.estimate(strings.join_args(args, i), **options))
+    except (s.ParseError, SessionError, ValueError) as e:
+        print(f"estimate: {e}")
+    return CommandReturn.SUCCESS
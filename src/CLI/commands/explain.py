@@ -0,0 +1,37 @@
+from typing import List
+from src.CLI.CommandReturn import CommandReturn
+from src.FilterParser import parse_filter, FilterSyntaxError
+from src.Session import Session, SessionError
+import src.Stat as s
+import src.utils.Strings as strings
+
+SHORT_DESCRIPTION: str = "Runs a filter or a query and shows where the time went"
+USAGE: List[str] = [
+    "explain filter FILTER...",
+    "explain plan FILTER...",
+    "explain query QUERY...",
+]
+DESCRIPTION: str = "\tEvaluates a filter expression or a natural language query (EXPLAIN ANALYZE)" \
+"\n\tand prints its tree with the time spent and the number of rows produced by each node" \
+"\n\t'explain plan' only prints the plan chosen for a filter: normalized tree, index lookups and scans" \
+"\n\twith their estimated rows and cost, without running it" \
+"\n\tQueries are evaluated without the session cache"
+
+def command(args: List[str], env: Session) -> CommandReturn:
+    if len(args) < 3 or args[1] not in ("filter", "plan", "query"):
+        print("Usage: " + " | ".join(USAGE))
+        return CommandReturn.SUCCESS
+    expr = strings.join_args(args, 2)
+    try:
+        if args[1] == "filter":
+            print(parse_filter(expr).explain_analyze(env.data))
+        elif args[1] == "plan":
+            print(env.engine.plan(parse_filter(expr)).explain())
+        else:
+            node = s.Parser(expr).parse()
+            if node is None:
+                raise s.ParseError(f"Could not parse '{expr}'")
+            print(node.explain_analyze(env.environment(Session.referenced_sources(node))))
+    except (FilterSyntaxError, SessionError, s.ParseError) as e:
+        print(f"explain: {e}")
+    return CommandReturn.SUCCESS
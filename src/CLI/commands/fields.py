@@ -0,0 +1,38 @@
+from typing import List
+from src.CLI.CommandReturn import CommandReturn
+from src.Config import Config
+from src.FieldProfiler import FieldProfiler
+from src.Session import Session
+
+SHORT_DESCRIPTION: str = "Profiles the keys of the package's JSON lines files"
+USAGE: List[str] = [
+    "fields [--hll] [--top N] [--keys KEY,...] [PATH...]",
+]
+DESCRIPTION: str = "\tProfiles the keys of newline-delimited JSON files (the Activity folders by default):" \
+"\n\tnumber of values, JSON types, number of distinct values and most frequent values of each key" \
+"\n\n\t--hll\t\tApproximate distinct counts and frequent values with fixed size sketches" \
+"\n\t--top N\t\tNumber of frequent values displayed per key (defaults to 5)" \
+"\n\t--keys KEY,...\tOnly profile these keys"
+
+def command(args: List[str], env: Session) -> CommandReturn:
+    paths, keys, top, approximate = [], [], 5, False
+    i = 1
+    try:
+        while i < len(args):
+            if args[i] == "--hll":
+                approximate = True
+            elif args[i] == "--top":
+                i += 1
+                top = int(args[i])
+            elif args[i] == "--keys":
+                i += 1
+                keys = [k for k in args[i].split(",") if k]
+            else:
+                paths.append(args[i])
+            i += 1
+    except (IndexError, ValueError):
+        print("Usage: " + USAGE[0])
+        return CommandReturn.SUCCESS
+    profiler = FieldProfiler(paths or [Config.ACTIVITY, Config.ACTIVITIES], keys=keys, approximate=approximate).run()
+    print(profiler.render(top))
+    return CommandReturn.SUCCESS
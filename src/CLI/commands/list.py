@@ -1,5 +1,6 @@
-from typing import List, Dict, Any
+from typing import List
 from src.CLI.CommandReturn import CommandReturn
+from src.Session import Session
 
 SHORT_DESCRIPTION: str = "Lists the content of the dynamic environment"
 USAGE: List[str] = [
@@ -8,9 +9,17 @@ USAGE: List[str] = [
 DESCRIPTION: str = "\tLists the content of the dynamic environment" \
 "\n\n\tTYPE\tThe type of the content to display" \
 "\n\n\tAvailable types are as follow:" \
-"\n\n\tcollections\tDifferent collections loaded along with the filters that they matched with"
+"\n\n\tcollections\tDifferent collections loaded along with the filters that they matched with" \
+"\n\tstats\t\tStatistics computed and cached during the session"
 
-def command(args: List[str], env: Dict[str, Any]) -> CommandReturn:
-    for elem in env:
-        print(elem)
+def command(args: List[str], env: Session) -> CommandReturn:
+    types = args[1:] or ["collections", "stats"]
+    if "collections" in types:
+        print("collections:")
+        for collection in env.collections.values():
+            print(f"\t#{collection.name:<20} {len(collection):>10} messages\t{collection.expression}")
+    if "stats" in types:
+        print("stats:")
+        for query, (result, _) in env.stats.items():
+            print(f"\t{query}: {result}")
     return CommandReturn.SUCCESS
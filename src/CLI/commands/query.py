@@ -0,0 +1,26 @@
+from typing import List
+from src.CLI.CommandReturn import CommandReturn
+from src.Session import Session, SessionError
+import src.Stat as s
+import src.utils.Strings as strings
+
+SHORT_DESCRIPTION: str = "Computes a statistic written in natural language"
+USAGE: List[str] = [
+    "query QUERY...",
+]
+DESCRIPTION: str = "\tParses QUERY with the natural language statistics parser and prints the result" \
+"\n\tCollections created with 'define' are referenced with 'in #NAME'" \
+"\n\tResults are cached until a collection they were computed from is redefined or dropped" \
+"\n\tText and regex arguments are written between double quotes and keep their case: matching \"\\D+\"" \
+"\n\n\tExample:" \
+"\n\t\tquery the average number of words per month in #dms2023"
+
+def command(args: List[str], env: Session) -> CommandReturn:
+    if len(args) < 2:
+        print("Usage: " + USAGE[0])
+        return CommandReturn.SUCCESS
+    try:
+        print(env.query(strings.join_args(args, 1)))
+    except (s.ParseError, SessionError, ValueError) as e:
+        print(f"query: {e}")
+    return CommandReturn.SUCCESS
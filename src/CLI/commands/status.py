@@ -1,12 +1,18 @@
-from typing import List, Dict, Any
+from typing import List
 from src.CLI.CommandReturn import CommandReturn
+from src.Session import Session
+from src.utils.Instrumentation import METRICS
 
 SHORT_DESCRIPTION: str = "Displays the status of the program"
 USAGE: List[str] = [
     "status",
 ]
-DESCRIPTION: str = "\tDisplays the status of the program"
+DESCRIPTION: str = "\tDisplays the status of the program" \
+"\n\tWhen running with --profile, also displays the time spent in each phase and the counters"
 
-def command(args: List[str], env: Dict[str, Any]) -> CommandReturn:
-    print("status")
+def command(args: List[str], env: Session) -> CommandReturn:
+    print(env.repo)
+    print(env)
+    if METRICS.enabled:
+        print(METRICS.report())
     return CommandReturn.SUCCESS
@@ -2,6 +2,7 @@ from enum import Enum
 from json import JSONEncoder
 from datetime import datetime
 from src.Config import Config
+from src.utils.Interner import USERS, CHANNELS, ACCOUNTS
 
 class Channel:
     class Type(Enum):
@@ -23,24 +24,40 @@ class Channel:
             'guild_id': self.guild_id
         }
 
-    def __init__(self, id: str, type: 'Channel.Type', name: str = "", recipient: list[str] = [], guild_id: str = ""):
+    def __init__(self, id: str, type: 'Channel.Type', name: str = "", recipient: list[str] = [], guild_id: str = "", user_id: str | None = None):
+        """user_id is the owner of the package the channel comes from (defaults to Config.USER_ID)"""
         self.type = type
         self.id = id
+        # Dense integer id
+        self.key = CHANNELS.intern(id)
         
         self.name = name
         self.recipients = []
         self.guild_id = ""
+        # Integer id of the guild (0 outside guilds), the join key with GuildRepo
+        self.guild_key = 0
+
+        owner = Config.USER_ID if user_id is None else user_id
+        # Interned id of the package owner: the account column of federated repos
+        self.account = ACCOUNTS.intern(owner)
 
         if type == Channel.Type.DM:
             if not recipient:
                 print(f"Channel id: {id}")
                 raise ValueError
-            self.recipients = [r for r in recipient if r != Config.USER_ID]
+            self.recipients = [r for r in recipient if r != owner]
         elif type == Channel.Type.GROUP_DM:
-            self.recipients = [r for r in recipient if r != Config.USER_ID]
+            self.recipients = [r for r in recipient if r != owner]
             self.name = name
         elif type == Channel.Type.GUILD:
             self.name = name
             self.guild_id = guild_id
+            self.guild_key = int(guild_id) if guild_id.isdigit() else 0
+
+        # Interned recipients: ChannelRecipients is a subset test instead of list searches
+        self.recipient_keys = frozenset(USERS.intern(r) for r in self.recipients)
+
+    def has_recipients(self, *recipients: str) -> bool:
+        return USERS.key_set(recipients) <= self.recipient_keys
 
 __all__ = ['Channel']
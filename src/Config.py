@@ -2,7 +2,38 @@
 
 import os
 import json
-from typing import List, Literal
+from functools import cache
+from typing import Dict, List, Literal
+
+# Config attribute -> key of the folder name in locale/{lang}.json
+PACKAGE_FOLDERS = {
+    "ACTIVITIES": "activities",
+    "ACTIVITY": "activity",
+    "ACCOUNT": "account",
+    "SUPPORT": "support",
+    "MESSAGES": "messages",
+    "ADS": "ads",
+    "GUILDS": "guilds"
+}
+
+@cache
+def _locale(lang: str) -> Dict[str, str]:
+    with open(f"locale/{lang}.json", "r") as file:
+        return json.loads(file.read())
+
+def package_paths(root: str, lang: str) -> Dict[str, str]:
+    """Paths of the folders of a package (Config attribute -> path), their names depend on the language of the package"""
+    locale_file = _locale(lang)
+    return {attr: os.path.join(root, locale_file[key]) for attr, key in PACKAGE_FOLDERS.items()}
+
+def detect_lang(root: str, default: str = "en") -> str:
+    """Language of a package, guessed from the name of its account folder"""
+    from src.PackageSource import exists
+    for name in sorted(os.listdir("locale")):
+        lang = name.removesuffix(".json")
+        if name.endswith(".json") and exists(package_paths(root, lang)["ACCOUNT"]):
+            return lang
+    return default
 
 class ReadOnlyMeta(type):
     """Metaclass to make class variables read-only after initialization"""
@@ -14,11 +45,17 @@ class ReadOnlyMeta(type):
         else:
             raise AttributeError(f"Cannot modify read-only Config attribute '{name}'")
 
+    def __getattr__(cls, name):
+        # Only reached for unset attributes: the user data is read on first access
+        if name in ("USER_DATA", "USER_ID"):
+            cls._load_user()
+            return type.__getattribute__(cls, name)
+        raise AttributeError(f"Config has no attribute '{name}'")
+
 class Config(metaclass=ReadOnlyMeta):
     ROOT = ""
     LANG = ""
-    USER_ID = ""
-    USER_DATA = {}
+    # USER_ID and USER_DATA are read from the package when first accessed
     ACTIVITIES = ""
     ACTIVITY = ""
     ACCOUNT = ""
@@ -27,37 +64,78 @@ class Config(metaclass=ReadOnlyMeta):
     ADS = ""
     GUILDS = ""
     MODE = "cli"
+    # Roots of the packages loaded together when there are several (see src.Federation), ROOT is the first one
+    MOUNTS: tuple = ()
 
     @staticmethod
-    def init(root: str = "package", lang :str = "en", mode: Literal["cli", "tui", "inline"] = "cli"):
+    def init(root: str = "package", lang :str = "en", mode: Literal["cli", "tui", "inline", "serve"] = "cli", mounts: List[str] = ()):
         """Initialize the environment for the program
 
         Args:
-            root (str): The root where the discord files are located (defaults to "package")
+            root (str): The root where the discord files are located, the extracted folder or the export ZIP (defaults to "package")
             lang (str): The ISO 639-1 locale code of the language the archive is in in order to load the proper files (defaults to "en")
-            mode (str): The mode the program will run as ("cli", "tui" or "inline", defaults to "cli")
+            mode (str): The mode the program will run as ("cli", "tui", "inline" or "serve", defaults to "cli")
+            mounts (list): Roots of every package to load together, root included (the language of the others is detected)
         """
         Config._initializing = True
         
         Config.ROOT = os.path.realpath(root)
         Config.LANG = lang
+        Config.MOUNTS = tuple(mounts)
 
-        if mode != "cli" and mode in ("tui", "inline"):
+        if mode != "cli" and mode in ("tui", "inline", "serve"):
             Config.MODE = mode
 
-        locale_file = json.loads(open(f"locale/{lang}.json", "r").read())
-
-        Config.ACTIVITIES = os.path.join(Config.ROOT, locale_file["activities"])
-        Config.ACTIVITY = os.path.join(Config.ROOT, locale_file["activity"])
-        Config.ACCOUNT = os.path.join(Config.ROOT, locale_file["account"])
-        Config.SUPPORT = os.path.join(Config.ROOT, locale_file["support"])
-        Config.MESSAGES = os.path.join(Config.ROOT, locale_file["messages"])
-        Config.ADS = os.path.join(Config.ROOT, locale_file["ads"])
-        Config.GUILDS = os.path.join(Config.ROOT, locale_file["guilds"])
-        
-        Config.USER_DATA = json.loads(open(os.path.join(Config.ACCOUNT, "user.json"), "r").read())
-        Config.USER_ID = Config.USER_DATA["id"]
+        for attr, path in package_paths(Config.ROOT, lang).items():
+            setattr(Config, attr, path)
         
+        # Forget the user of a previously loaded package
+        for name in ("USER_DATA", "USER_ID"):
+            if name in Config.__dict__:
+                delattr(Config, name)
+
         Config._initializing = False
 
-__all__ = ['Config']
+    @staticmethod
+    def _load_user():
+        from src.PackageSource import read
+        Config._initializing = True
+        try:
+            Config.USER_DATA = json.loads(read(os.path.join(Config.ACCOUNT, "user.json"))) if Config.ACCOUNT else {}
+            Config.USER_ID = Config.USER_DATA.get("id", "")
+        finally:
+            Config._initializing = False
+
+    @staticmethod
+    def package() -> 'PackageConfig':
+        """The package of Config as a PackageConfig"""
+        return PackageConfig(Config.ROOT, Config.LANG)
+
+class PackageConfig:
+    """Paths and owner of one package, with the same attributes as Config
+
+    Config describes the package of the run, PackageConfig instances describe any number of packages
+    side by side (see src.Federation). lang is detected from the package when not given.
+    """
+    def __init__(self, root: str, lang: str | None = None):
+        self.ROOT = os.path.realpath(root)
+        self.LANG = lang or detect_lang(self.ROOT)
+        for attr, path in package_paths(self.ROOT, self.LANG).items():
+            setattr(self, attr, path)
+        self._user_data: dict | None = None
+
+    @property
+    def USER_DATA(self) -> dict:
+        if self._user_data is None:
+            from src.PackageSource import read
+            self._user_data = json.loads(read(os.path.join(self.ACCOUNT, "user.json")))
+        return self._user_data
+
+    @property
+    def USER_ID(self) -> str:
+        return self.USER_DATA.get("id", "")
+
+    def __repr__(self):
+        return f"<PackageConfig {self.ROOT} ({self.LANG})>"
+
+__all__ = ['Config', 'PackageConfig', 'package_paths', 'detect_lang']
@@ -0,0 +1,142 @@
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+import os
+
+from src.Config import Config, PackageConfig
+from src.MessageRepo import MessageRepo, Message
+from src.Channel import Channel
+from src.Guild import GuildRepo
+from src.Progress import ProgressSink, sink
+from src.utils.Interner import ACCOUNTS
+
+"""
+    Several packages analyzed together (an account and its alts, the members of a team...)
+
+    FederatedRepo mounts N packages, each one with its own PackageConfig (root, language, owner), and stands
+    for a MessageRepo holding all of them: the messages of each package one after the other, in mount order,
+    each channel knowing its account (Channel.account, the interned user id of the package owner).
+    Filters, indexes and Stat queries run on it unchanged, across accounts;
+    InAccount ("from account ?" in queries) keeps some accounts and "per account" splits a query by account.
+    There is no per message account column: InAccount is a channel level filter (see CHANNEL_FILTERS in
+    src.Filter), evaluated once per channel run, and the index keeps a posting set per account.
+
+    Packages are loaded by a thread pool: file reads and ZIP decompression of a package overlap with the
+    decoding of the others, but JSON decoding and building the messages hold the GIL, so only one package
+    decodes at a time. A process pool would have to pickle every Message back to the parent, which takes
+    about twice as long as loading them.
+"""
+
+# Threads loading packages at once
+MAX_WORKERS = 8
+
+# Account key -> user data (user.json) of the package owner, for the names of the accounts
+PROFILES: Dict[int, dict] = {}
+_named: Dict[Tuple[str, ...], FrozenSet[int]] = {}
+
+
+def register(user_data: dict) -> int:
+    """Account key of a package owner, whose names are then accepted by account_keys"""
+    key = ACCOUNTS.intern(user_data.get("id", ""))
+    PROFILES[key] = user_data
+    _named.clear()
+    return key
+
+
+def _profiles() -> Dict[int, dict]:
+    # The package of Config is known without being mounted
+    if not PROFILES and Config.ROOT:
+        register(Config.USER_DATA)
+    return PROFILES
+
+
+def account_keys(*names: str) -> FrozenSet[int]:
+    """Keys of the accounts with one of these user ids, usernames or global names (case insensitive)"""
+    if names in _named:
+        return _named[names]
+    keys = set()
+    for name in names:
+        if name in ACCOUNTS:
+            keys.add(ACCOUNTS.get(name))
+            continue
+        folded = name.casefold()
+        keys.update(key for key, user in _profiles().items() if folded in (str(user.get("username", "")).casefold(), str(user.get("global_name", "")).casefold()))
+    _named[names] = frozenset(keys)
+    return _named[names]
+
+
+def account_label(key: int) -> str:
+    """Username of an account, followed by its user id when another account has the same username (the id alone when unknown)"""
+    profiles = _profiles()
+    username = profiles.get(key, {}).get("username")
+    if not username:
+        return ACCOUNTS[key]
+    if any(other != key and user.get("username") == username for other, user in profiles.items()):
+        return f"{username} ({ACCOUNTS[key]})"
+    return username
+
+
+class FederatedRepo:
+    """Messages of several packages, loaded in parallel, each channel knowing the account it comes from
+
+    packages are package roots (their language is detected) or PackageConfig. Guild names are looked up
+    in the Servers folders of every package: the merged GuildRepo is mounted as the default one.
+    Each package reports its loading to progress (defaults to the current sink), side by side.
+    """
+    def __init__(self, packages: Iterable[str | PackageConfig], progress: ProgressSink | None = None, workers: int | None = None):
+        self.configs: List[PackageConfig] = [p if isinstance(p, PackageConfig) else PackageConfig(p) for p in packages]
+        if not self.configs:
+            raise ValueError("No package to mount")
+        self.accounts: List[int] = []
+        for config in self.configs:
+            key = register(config.USER_DATA)
+            if key in self.accounts:
+                # Its messages would be counted twice
+                raise ValueError(f"Account {config.USER_ID} is mounted twice ({config.ROOT})")
+            self.accounts.append(key)
+
+        self.progress = progress or sink()
+        workers = workers or min(len(self.configs), MAX_WORKERS)
+        self.repos: List[MessageRepo]
+        if workers == 1:
+            self.repos = [self._load(config) for config in self.configs]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                self.repos = list(pool.map(self._load, self.configs))
+
+        self.messages: List[Message] = []
+        self.channels: List[Channel] = []
+        for repo in self.repos:
+            self.messages.extend(repo.messages)
+            self.channels.extend(repo.channels)
+
+        GuildRepo.mount(GuildRepo(*(config.GUILDS for config in self.configs)))
+
+    def _load(self, config: PackageConfig) -> MessageRepo:
+        return MessageRepo(config.MESSAGES, self.progress, user_id=config.USER_ID)
+
+    def get_messages(self):
+        return self.messages.copy()
+
+    def get_n_messages(self):
+        return len(self.messages)
+
+    def get_n_channels(self):
+        return len(self.channels)
+
+    def get_n_accounts(self):
+        return len(self.accounts)
+
+    def __repr__(self):
+        return f"<FederatedRepo containing {len(self.messages)} messages in {len(self.channels)} channels of {len(self.accounts)} accounts ({', '.join(map(account_label, self.accounts))})>"
+
+    def __iter__(self):
+        return iter(self.get_messages())
+
+
+def load_repo(progress: ProgressSink | None = None) -> MessageRepo | FederatedRepo:
+    """Messages of the run: the package of Config, or every package given to Config.init(mounts=...)"""
+    if len(Config.MOUNTS) > 1:
+        return FederatedRepo([PackageConfig(root, Config.LANG if os.path.realpath(root) == Config.ROOT else None) for root in Config.MOUNTS], progress)
+    return MessageRepo(Config.MESSAGES, progress)
+
+__all__ = ['FederatedRepo', 'register', 'account_keys', 'account_label', 'load_repo', 'PROFILES']
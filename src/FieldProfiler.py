@@ -0,0 +1,196 @@
+from typing import Any, Dict, Iterable, List, TextIO, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from functools import partial
+from src.utils.JsonLines import CHUNK_SIZE, Chunk, find_jsonl_files, file_size, chunks, chunk_lines
+from src.utils.Parallel import ordered_map
+from src.utils.Sketches import HyperLogLog, SpaceSaving
+from src.utils.Instrumentation import METRICS
+
+import os
+import json
+import math
+
+"""
+    Key profiler for the newline-delimited JSON files of the package: for every top level key,
+    the number of occurrences, the JSON types of its values, the number of distinct values and the most frequent ones.
+
+    Exact mode counts values in hash maps; approximate mode keeps a HyperLogLog sketch and a bounded
+    heavy hitters summary per key, so memory doesn't grow with the number of distinct values.
+    Both are computed per chunk in a process pool and merged.
+"""
+
+JSON_TYPES = {str: "string", int: "number", float: "number", bool: "boolean", type(None): "null", list: "array", dict: "object"}
+
+
+def _hashable(value: Any) -> Any:
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return value
+
+
+def _sort_key(value: Any) -> Tuple[str, Any]:
+    # Values of different types can't be compared
+    return (type(value).__name__, value if value is not None else 0)
+
+
+class KeyProfile:
+    def __init__(self, approximate: bool = False, capacity: int = 1000, precision: int = 14):
+        self.approximate = approximate
+        self.count = 0
+        self.types: Counter = Counter()
+        self.values: Counter | None = None if approximate else Counter()
+        self.sketch = HyperLogLog(precision) if approximate else None
+        self.heavy = SpaceSaving(capacity) if approximate else None
+
+    def add(self, value: Any):
+        self.count += 1
+        self.types[JSON_TYPES.get(type(value), "unknown")] += 1
+        value = _hashable(value)
+        if self.approximate:
+            self.sketch.add(value)
+            self.heavy.add(value)
+        else:
+            self.values[value] += 1
+
+    def merge(self, other: 'KeyProfile') -> 'KeyProfile':
+        self.count += other.count
+        self.types.update(other.types)
+        if self.approximate:
+            self.sketch.merge(other.sketch)
+            self.heavy.merge(other.heavy)
+        else:
+            self.values.update(other.values)
+        return self
+
+    @property
+    def distinct(self) -> int:
+        return len(self.sketch) if self.approximate else len(self.values)
+
+    def top(self, n: int) -> List[Tuple[Any, int]]:
+        if self.approximate:
+            # Guaranteed counts: the estimates minus their possible overcount
+            return [(value, count - self.heavy.errors[value]) for value, count in self.heavy.most_common(n)]
+        return self.values.most_common(n)
+
+    def sorted_values(self) -> List[Any]:
+        """Distinct values, sorted (exact mode only)"""
+        if self.approximate:
+            raise ValueError("Distinct values aren't kept in approximate mode")
+        return sorted(self.values, key=_sort_key)
+
+    def to_dict(self, top: int = 10):
+        return {
+            "count": self.count,
+            "distinct": self.distinct,
+            "approximate": self.approximate,
+            "types": dict(self.types.most_common()),
+            "top": self.top(top)
+        }
+
+
+def _profile_chunk(chunk: Chunk, keys: Tuple[str, ...], approximate: bool, capacity: int) -> Tuple[int, int, Dict[str, KeyProfile]]:
+    """Profile one chunk (runs in a worker process), returns (lines, malformed lines, profiles)"""
+    profiles: Dict[str, KeyProfile] = {}
+    lines = errors = 0
+    for line in chunk_lines(chunk):
+        lines += 1
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            errors += 1
+            continue
+        if not isinstance(entry, dict):
+            errors += 1
+            continue
+        for key, value in entry.items():
+            if keys and key not in keys:
+                continue
+            profile = profiles.get(key)
+            if profile is None:
+                profile = profiles[key] = KeyProfile(approximate, capacity)
+            profile.add(value)
+    return lines, errors, profiles
+
+
+class FieldProfiler:
+    """Profile the keys of JSON lines files
+
+    Args:
+        paths (Iterable[str]): Files or directories (every .json file under them), possibly inside a ZIP archive
+        keys (Iterable[str]): Keys to profile, all of them when empty
+        approximate (bool): Use sketches instead of exact counts
+        capacity (int): Counters kept per key for the frequent values in approximate mode
+        workers (int): Size of the process pool (defaults to the number of CPUs, 1 runs in process)
+        chunk_size (int): Bytes profiled per task
+    """
+    def __init__(self, paths: Iterable[str], keys: Iterable[str] = (), approximate: bool = False, capacity: int = 1000,
+                 workers: int | None = None, chunk_size: int = CHUNK_SIZE):
+        self.files = find_jsonl_files(*paths)
+        self.keys = tuple(keys)
+        self.approximate = approximate
+        self.capacity = capacity
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.profiles: Dict[str, KeyProfile] = {}
+        self.n_lines = 0
+        self.n_errors = 0
+
+    def run(self) -> 'FieldProfiler':
+        tasks = (chunk for path in self.files for chunk in chunks(path, self.chunk_size))
+        profile = partial(_profile_chunk, keys=self.keys, approximate=self.approximate, capacity=self.capacity)
+        workers = min(self.workers, max(1, math.ceil(sum(map(file_size, self.files)) / self.chunk_size)))
+        with METRICS.phase("profile.parse"):
+            if workers == 1:
+                self._merge(map(profile, tasks))
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    self._merge(ordered_map(pool, profile, tasks, 2 * workers))
+        return self
+
+    def _merge(self, results: Iterable[Tuple[int, int, Dict[str, KeyProfile]]]):
+        for lines, errors, profiles in results:
+            self.n_lines += lines
+            self.n_errors += errors
+            for key, profile in profiles.items():
+                if key in self.profiles:
+                    self.profiles[key].merge(profile)
+                else:
+                    self.profiles[key] = profile
+
+    def report(self, top: int = 10) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "lines": self.n_lines,
+            "malformed": self.n_errors,
+            "keys": {key: profile.to_dict(top) for key, profile in sorted(self.profiles.items())}
+        }
+
+    def write_json(self, file: TextIO, top: int = 10, values: bool = False):
+        """Write the report as JSON, one value at a time so that keys with millions of distinct values don't need a second copy in memory"""
+        file.write(f'{{"files": {json.dumps(self.files, ensure_ascii=False)}, "lines": {self.n_lines}, "malformed": {self.n_errors}, "keys": {{')
+        for i, (key, profile) in enumerate(sorted(self.profiles.items())):
+            entry = json.dumps(profile.to_dict(top), ensure_ascii=False)
+            file.write(f'{", " if i else ""}{json.dumps(key, ensure_ascii=False)}: {entry[:-1]}')
+            if values and not profile.approximate:
+                file.write(', "values": [')
+                for j, value in enumerate(profile.sorted_values()):
+                    file.write(f'{", " if j else ""}{json.dumps(value, ensure_ascii=False)}')
+                file.write(']')
+            file.write('}')
+        file.write('}}\n')
+
+    def render(self, top: int = 5) -> str:
+        lines = [f"{self.n_lines} lines in {len(self.files)} files ({self.n_errors} malformed)"]
+        for key, profile in sorted(self.profiles.items(), key=lambda x: -x[1].count):
+            types = ", ".join(f"{t} {n}" for t, n in profile.types.most_common())
+            distinct = f"{'~' if profile.approximate else ''}{profile.distinct}"
+            lines.append(f"\t{key:<32} {profile.count:>10} values {distinct:>10} distinct  ({types})")
+            for value, n in profile.top(top):
+                lines.append(f"\t\t{n:>10}  {str(value)[:80]}")
+        return "\n".join(lines)
+
+    def __repr__(self):
+        return f"<FieldProfiler {len(self.profiles)} keys over {self.n_lines} lines from {len(self.files)} files>"
+
+__all__ = ['FieldProfiler', 'KeyProfile']
@@ -1,10 +1,18 @@
 from src.MessageRepo import MessageRepo, Message
 from src.Channel import Channel
-from src.Guild import Guild
+from src.Guild import Guild, GuildRepo
+from src.Attachments import name_hash, extension_keys, host_keys
+from src.utils.Instrumentation import METRICS, PlanNode
+from src.utils.TermMatcher import term_matcher
+import src.Progress as progress
 from enum import Enum
 from typing import Set, Callable
 from datetime import datetime, date
+from itertools import groupby
+from functools import cache
+from operator import attrgetter
 import re
+import time
 
 # ============================================================================
 # HELPER FUNCTIONS FOR TYPE CONVERSION
@@ -37,6 +45,20 @@ def _match_regex(message, pattern):
 def _unpack_args(join_symbol, args):
     return f'{join_symbol}'.join(map(str, args))
 
+def _account_keys(*accounts):
+    from src.Federation import account_keys
+    return account_keys(*accounts)
+
+@cache
+def _near_duplicate_predicate(reference, *threshold):
+    # Texts only: a message id is looked up in the data being filtered, see PREPARED
+    from src.NearDuplicates import near_duplicate_predicate
+    return near_duplicate_predicate(reference, *threshold)
+
+def _prepared_near_duplicate(data, reference, *threshold):
+    from src.NearDuplicates import near_duplicate_predicate
+    return near_duplicate_predicate(reference, *threshold, data=data)
+
 USER_MENTION_PATTERN = re.compile(r"<@\d{17,20}>")
 CHANNEL_MENTION_PATTERN = USER_MENTION_PATTERN
 
@@ -46,42 +68,87 @@ type FilterCallableMultiple = Callable[[Message, list[str]], bool]
 type FilterAny = FilterCallableNoarg | FilterCallableSingle | FilterCallableMultiple
 
 class FILTERS(Enum):
-    AlwaysTrue: FilterCallableNoarg = lambda: True
+    AlwaysTrue: FilterCallableNoarg = lambda *_: True
     SentAfter: FilterCallableSingle = lambda message, timestamp: message.timestamp > _parse_datetime(timestamp)
     SentBefore: FilterCallableSingle = lambda message, timestamp: message.timestamp < _parse_datetime(timestamp)
     SentBetween: FilterCallableMultiple = lambda message, *periods: _parse_datetime(periods[0]) < message.timestamp < _parse_datetime(periods[1])
-    ChannelRecipients: FilterCallableMultiple = lambda message, *recipients: all(r in message.channel.recipients for r in recipients)
+    ChannelRecipients: FilterCallableMultiple = lambda message, *recipients: message.channel.has_recipients(*recipients)
     MentionsUser: FilterCallableMultiple = lambda message, *users: _match_regex(message, rf"<@({_unpack_args('|', users)})>")
     HasUserMention: FilterCallableNoarg = lambda message: _match_regex(message, USER_MENTION_PATTERN)
-    HasUserMentionCountGt: FilterCallableSingle = lambda message, count: len(re.match(USER_MENTION_PATTERN, message.content)) > count
-    HasUserMentionCountLt: FilterCallableSingle = lambda message, count: len(re.match(USER_MENTION_PATTERN, message.content)) < count
-    HasUserMentionCountEq: FilterCallableSingle = lambda message, count: len(re.match(USER_MENTION_PATTERN, message.content)) == count
+    HasUserMentionCountGt: FilterCallableSingle = lambda message, count: len(USER_MENTION_PATTERN.findall(message.content)) > _parse_int(count)
+    HasUserMentionCountLt: FilterCallableSingle = lambda message, count: len(USER_MENTION_PATTERN.findall(message.content)) < _parse_int(count)
+    HasUserMentionCountEq: FilterCallableSingle = lambda message, count: len(USER_MENTION_PATTERN.findall(message.content)) == _parse_int(count)
     MentionsChannel: FilterCallableMultiple = lambda message, *channels: _match_regex(message, rf"<#{_unpack_args('|', channels)}>")
-    HasChannemMentionCountGt: FilterCallableSingle = lambda message, count: len(re.match(CHANNEL_MENTION_PATTERN, message.content)) > count
-    HasChannemMentionCountLt: FilterCallableSingle = lambda message, count: len(re.match(CHANNEL_MENTION_PATTERN, message.content)) < count
-    HasChannemMentionCountEq: FilterCallableSingle = lambda message, count: len(re.match(CHANNEL_MENTION_PATTERN, message.content)) == count
+    HasChannemMentionCountGt: FilterCallableSingle = lambda message, count: len(CHANNEL_MENTION_PATTERN.findall(message.content)) > _parse_int(count)
+    HasChannemMentionCountLt: FilterCallableSingle = lambda message, count: len(CHANNEL_MENTION_PATTERN.findall(message.content)) < _parse_int(count)
+    HasChannemMentionCountEq: FilterCallableSingle = lambda message, count: len(CHANNEL_MENTION_PATTERN.findall(message.content)) == _parse_int(count)
     HasChannelMention: FilterCallableNoarg = lambda message: _match_regex(message, CHANNEL_MENTION_PATTERN)
     IsDM: FilterCallableNoarg = lambda message: message.channel.type == Channel.Type.DM
     IsGroupDM: FilterCallableNoarg = lambda message: message.channel.type == Channel.Type.GROUP_DM
     IsGuild: FilterCallableNoarg = lambda message: message.channel.type == Channel.Type.GUILD
-
-    MessageContains: FilterCallableMultiple = lambda message, *search: _match_regex(message, _unpack_args('|', search))
-    MessageLengthGt: FilterCallableSingle = lambda message, count: len(message.content) > count
-    MessageLengthGt: FilterCallableSingle = lambda message, count: len(message.content) < count
-    MessageLengthEq: FilterCallableSingle = lambda message, count: len(message.content) == count
+    InGuild: FilterCallableMultiple = lambda message, *guilds: message.channel.guild_key in GuildRepo.default().keys_named(*guilds)
+    InAccount: FilterCallableMultiple = lambda message, *accounts: message.channel.account in _account_keys(*accounts)
+
+    # Literal terms, all of them found in a single pass (see src.utils.TermMatcher), MessageRegex takes patterns
+    MessageContains: FilterCallableMultiple = lambda message, *search: term_matcher(search).search(message.content)
+    MessageContainsIgnoreCase: FilterCallableMultiple = lambda message, *search: term_matcher(search, True).search(message.content)
+    MessageLengthGt: FilterCallableSingle = lambda message, count: len(message.content) > _parse_int(count)
+    MessageLengthLt: FilterCallableSingle = lambda message, count: len(message.content) < _parse_int(count)
+    MessageLengthEq: FilterCallableSingle = lambda message, count: len(message.content) == _parse_int(count)
     MessageRegex: FilterCallableMultiple = lambda message, *regexes: all(_match_regex(message, regex) for regex in regexes)
 
-    HasAttachments: FilterCallableNoarg = lambda message: len(message.attachments) != 0
-    AttachmentCountGt: FilterCallableSingle = lambda message, count: len(message.attachments.split()) > count
-    AttachmentCountLt: FilterCallableSingle = lambda message, count: len(message.attachments.split()) < count
-    AttachmentCountEq: FilterCallableSingle = lambda message, count: len(message.attachments.split()) == count
+    HasAttachments: FilterCallableNoarg = lambda message: len(message.attachment_rows) != 0
+    AttachmentCountGt: FilterCallableSingle = lambda message, count: len(message.attachment_rows) > _parse_int(count)
+    AttachmentCountLt: FilterCallableSingle = lambda message, count: len(message.attachment_rows) < _parse_int(count)
+    AttachmentCountEq: FilterCallableSingle = lambda message, count: len(message.attachment_rows) == _parse_int(count)
+    HasAttachmentType: FilterCallableMultiple = lambda message, *kinds: message.attachment_table.count_in(message.attachment_rows, "extensions", extension_keys(*kinds)) != 0
+    HasAttachmentFrom: FilterCallableMultiple = lambda message, *hosts: message.attachment_table.count_in(message.attachment_rows, "hosts", host_keys(*hosts)) != 0
+    HasAttachmentNamed: FilterCallableMultiple = lambda message, *names: not {name_hash(name) for name in names}.isdisjoint(message.attachment_table.name_hashes[row] for row in message.attachment_rows)
 
     ContainsUrl: FilterCallableNoarg = lambda message: _match_regex(message, r'(?:https?://|www\.)[^\s<>]+')
 
+    # A message id or a text, and an optional similarity threshold (see src.NearDuplicates), looked up in the MinHash index when possible
+    IsNearDuplicateOf: FilterCallableMultiple = lambda message, reference, *threshold: _near_duplicate_predicate(reference, *threshold)(message)
+
+# Filters that only read message.channel: evaluated once per channel run instead of once per message.
+# They read the interned attributes of the Channel itself (type, guild_key, recipient keys, account), the
+# messages of a run share it, so there are no per message channel columns
+CHANNEL_FILTERS = {FILTERS.IsDM, FILTERS.IsGroupDM, FILTERS.IsGuild, FILTERS.InGuild, FILTERS.InAccount, FILTERS.ChannelRecipients}
+
+def _contains(matcher) -> Callable[[Message], bool]:
+    search = matcher.search
+    return lambda message: search(message.content)
+
+# Filters whose predicate is prepared once per scan instead of once per message (their matcher is looked up once):
+# FILTERS entry -> (data being scanned, args -> predicate of a message)
+PREPARED = {
+    FILTERS.MessageContains: lambda data, *terms: _contains(term_matcher(terms)),
+    FILTERS.MessageContainsIgnoreCase: lambda data, *terms: _contains(term_matcher(terms, True)),
+    FILTERS.IsNearDuplicateOf: _prepared_near_duplicate
+}
+
+def channel_runs(data: list[Message]) -> list[tuple[Channel, int, int]]:
+    """Maximal [start, end) ranges of consecutive messages sent in the same channel
+
+    MessageRepo loads messages channel by channel, so there is one run per channel for unfiltered data.
+    """
+    runs = []
+    start = 0
+    for channel, group in groupby(map(attrgetter("channel"), data)):
+        end = start + len(list(group))
+        runs.append((channel, start, end))
+        start = end
+    return runs
+
+@cache
+def _filter_names() -> dict:
+    """FILTERS entries -> names, built on first use"""
+    return {v: k for k, v in FILTERS.__dict__.items() if not k.startswith('_') and callable(v)}
+
 class Filter:
     def to_dict(self):
         return {
-            "type": next((k for k, v in FILTERS.__dict__.items() if v == self.func), "Unknown"),
+            "type": self.name,
             "params": [
                 arg for arg in self.args
             ]
@@ -91,14 +158,55 @@ class Filter:
         self.func: FILTERS = type
         self.args = (*args,)
         self.matching_indices: Set[int] = set()
+
+    @property
+    def name(self) -> str:
+        return _filter_names().get(self.func, "Unknown")
+
+    def __repr__(self):
+        return f"{self.name}({', '.join(map(str, self.args))})" if self.args else self.name
     
+    @property
+    def is_channel_level(self) -> bool:
+        return self.func in CHANNEL_FILTERS
+
+    def prepared(self, data: list[Message]) -> Callable[[Message], bool] | None:
+        """Predicate of the messages of data with the arguments bound, for the filters of PREPARED (None for the others)"""
+        if self.func not in PREPARED:
+            return None
+        return PREPARED[self.func](data, *self.args)
+
     def compute_matches(self, data: list[Message]):
-        self.matching_indices = set()
-        for i, message in enumerate(data):
-            if self.match(message):
-                self.matching_indices.add(i)
+        if self.is_channel_level:
+            return self._compute_channel_matches(data)
+        with METRICS.phase(f"filter.{self.name}" if METRICS.enabled else ""):
+            self.matching_indices = set()
+            match = self.prepared(data) or self.match
+            with progress.task(f"filter {self!r}", len(data), "messages") as task:
+                for block in task.ranges(len(data)):
+                    for i in block:
+                        if match(data[i]):
+                            self.matching_indices.add(i)
+        METRICS.count("filter.predicates_evaluated", len(data))
+        return self.matching_indices
+
+    def _compute_channel_matches(self, data: list[Message]):
+        with METRICS.phase(f"filter.{self.name}" if METRICS.enabled else ""):
+            self.matching_indices = set()
+            runs = channel_runs(data)
+            for _, start, end in runs:
+                # Any message of the run stands for its channel
+                if self.match(data[start]):
+                    self.matching_indices.update(range(start, end))
+        METRICS.count("filter.predicates_evaluated", len(runs))
         return self.matching_indices
 
+    def explain_analyze(self, data: list[Message]) -> PlanNode:
+        """Evaluate the filter and report its time and number of matches"""
+        start = time.perf_counter()
+        matches = self.compute_matches(data)
+        return PlanNode(f"Scan {self!r}", time.perf_counter() - start, len(matches))
+
     def match(self, message: Message):
         return self.func(message, *self.args)
     
@@ -113,7 +221,7 @@ class Filter:
 
     def __or__(self, other: 'Filter'):
         if self.func == FILTERS.AlwaysTrue:
-            return other
+            return self
         from src.FilterEngine import FilterGroup
         combined = FilterGroup(FilterGroup.Logic.OR)
         combined.filters.append(self)
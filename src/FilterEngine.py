@@ -1,6 +1,9 @@
 from src.Filter import *
 from enum import Enum
 from typing import Set, Callable, List, Dict
+from src.utils.Instrumentation import METRICS, PlanNode
+from array import array
+import time
 
 class FilterGroup:
     class Logic(Enum):
@@ -41,14 +44,26 @@ class FilterGroup:
         results = []
 
         for filter_obj in self.filters:
-            filter_obj.compute_matches(data)
-            results.append(filter_obj.matching_indices)
+            results.append(filter_obj.compute_matches(data))
 
         for subgroup in self.subgroups:
             results.append(subgroup.compute_matches(data))
-        
+
+        with METRICS.phase("filter.set_algebra"):
+            return self.combine(results, len(data))
+
+    def explain_analyze(self, data) -> PlanNode:
+        """Evaluate the group and report the time and number of matches of each node"""
+        start = time.perf_counter()
+        children = [child.explain_analyze(data) for child in (*self.filters, *self.subgroups)]
+        results = [child.matching_indices if isinstance(child, Filter) else child.indices for child in (*self.filters, *self.subgroups)]
+        self.indices = self.combine(results, len(data)) if children else set(range(len(data)))
+        return PlanNode(f"{self.logic.name}", time.perf_counter() - start, len(self.indices), children)
+
+    def combine(self, results: List[Set[int]], size: int) -> Set[int]:
+        """Merge the matches of the children according to the group's logic"""
         if not results:
-            return set(range(len(data)))
+            return set(range(size))
         
         if self.logic == FilterGroup.Logic.AND:
             res = results[0].copy()
@@ -61,7 +76,7 @@ class FilterGroup:
                 res |= indices
             return res
         else:
-            res = set(range(len(data)))
+            res = set(range(size))
             for indices in results:
                 res -= indices
             return res
@@ -81,7 +96,7 @@ class FilterGroup:
         return combined
 
     def __or__(self, other: 'FilterGroup | Filter'):
-        combined
+        combined = None
         if self.logic == FilterGroup.Logic.OR:
             combined = self
         else:
@@ -109,9 +124,27 @@ class FilterEngine:
     def __init__(self, data: list[dict]):
         self.data = data
         self.filters = Filter(FILTERS.AlwaysTrue)
+        self._index = None
+
+    @property
+    def index(self):
+        """Indexes over data, built on demand by the planner (data must not change afterwards)"""
+        if self._index is None:
+            from src.Index import MessageIndex
+            self._index = MessageIndex(self.data)
+        return self._index
+
+    def plan(self, filters: 'Filter | FilterGroup | None' = None):
+        """Normalized, cost-based execution plan of the given filters (the engine's filters by default)"""
+        from src.Planner import Planner
+        return Planner(self.index).plan(filters if filters is not None else self.filters)
     
-    def get_matching_indices(self) -> set[int]:
-        return self.filters.compute_matches(self.data)
+    def get_matching_indices(self, filters: 'Filter | FilterGroup | None' = None) -> set[int]:
+        return self.plan(filters).execute()
+
+    def get_sorted_indices(self, filters: 'Filter | FilterGroup | None' = None) -> array:
+        """Matching positions in message order, as a compact array (slicing a page out of it is cheap)"""
+        return array('I', sorted(self.get_matching_indices(filters)))
 
     def get_messages(self, limit: int | None = None, sort_key: Callable | str | None = None, reverse: bool = False):
         matching_indices = self.get_matching_indices()
@@ -130,6 +163,9 @@ class FilterEngine:
         
         return [self.data[i] for i in sorted_indices]
 
+    def explain_analyze(self) -> PlanNode:
+        return self.filters.explain_analyze(self.data)
+
     def filter_and_get_results(self, filters: Filter | FilterGroup) -> List[Dict]:
         self.filters = filters
         return self.get_messages()
@@ -0,0 +1,151 @@
+from typing import List, Tuple
+from functools import cache
+from src.Filter import Filter, FILTERS
+from src.FilterEngine import FilterGroup
+
+"""
+    Textual filter expressions, used wherever filters are typed by a user (CLI, batch files...)
+
+    Grammar (lowest to highest precedence):
+        expr    := and ('|' and)*
+        and     := not ('&' not)*
+        not     := '~' not | atom
+        atom    := '(' expr ')' | NAME | NAME '(' [arg (',' arg)*] ')'
+        arg     := bare word | 'single quoted' | "double quoted"
+
+    NAME is any entry of FILTERS (case insensitive), for example:
+        IsDM & SentAfter(2023-01-01) & ~MessageContains('lol', 'mdr')
+"""
+
+OPERATORS = "()&|~,"
+QUOTES = "'\""
+
+
+class FilterSyntaxError(Exception):
+    """Raised when a filter expression cannot be parsed"""
+    pass
+
+
+@cache
+def _filter_table() -> dict:
+    """Lowercased filter names -> FILTERS entries, built on the first parse"""
+    return {k.lower(): v for k, v in FILTERS.__dict__.items() if not k.startswith('_') and callable(v)}
+
+
+class FilterParser:
+    @staticmethod
+    def tokenize(expr: str) -> List[Tuple[str, str]]:
+        """Split an expression in (kind, value) tokens, kind being 'op', 'word' or 'str'"""
+        tokens: List[Tuple[str, str]] = []
+        current: str = ""
+        quote: str | None = None
+
+        for char in expr:
+            if quote:
+                if char == quote:
+                    tokens.append(("str", current))
+                    current = ""
+                    quote = None
+                else:
+                    current += char
+            elif char in QUOTES:
+                if current:
+                    tokens.append(("word", current))
+                    current = ""
+                quote = char
+            elif char in OPERATORS or char.isspace():
+                if current:
+                    tokens.append(("word", current))
+                    current = ""
+                if not char.isspace():
+                    tokens.append(("op", char))
+            else:
+                current += char
+
+        if quote:
+            raise FilterSyntaxError(f"Unterminated quote in '{expr}'")
+        if current:
+            tokens.append(("word", current))
+        return tokens
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        self.tokens = FilterParser.tokenize(expr)
+        self.pos = 0
+
+    def peek(self) -> Tuple[str, str] | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def consume(self) -> Tuple[str, str] | None:
+        token = self.peek()
+        if token is not None:
+            self.pos += 1
+        return token
+
+    def expect(self, op: str):
+        token = self.consume()
+        if token != ("op", op):
+            raise FilterSyntaxError(f"Expected '{op}' in '{self.expr}', got {token[1] if token else 'end of expression'}")
+
+    def parse(self) -> Filter | FilterGroup:
+        if not self.tokens:
+            return Filter(FILTERS.AlwaysTrue)
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise FilterSyntaxError(f"Unexpected '{self.peek()[1]}' in '{self.expr}'")
+        return node
+
+    def parse_or(self) -> Filter | FilterGroup:
+        node = self.parse_and()
+        while self.peek() == ("op", "|"):
+            self.consume()
+            node = node | self.parse_and()
+        return node
+
+    def parse_and(self) -> Filter | FilterGroup:
+        node = self.parse_not()
+        while self.peek() == ("op", "&"):
+            self.consume()
+            node = node & self.parse_not()
+        return node
+
+    def parse_not(self) -> Filter | FilterGroup:
+        if self.peek() == ("op", "~"):
+            self.consume()
+            return ~self.parse_not()
+        return self.parse_atom()
+
+    def parse_atom(self) -> Filter | FilterGroup:
+        token = self.consume()
+        if token is None:
+            raise FilterSyntaxError(f"Unexpected end of expression in '{self.expr}'")
+        if token == ("op", "("):
+            node = self.parse_or()
+            self.expect(")")
+            return node
+        if token[0] != "word":
+            raise FilterSyntaxError(f"Unexpected '{token[1]}' in '{self.expr}'")
+
+        func = _filter_table().get(token[1].lower())
+        if func is None:
+            raise FilterSyntaxError(f"Unknown filter '{token[1]}'")
+
+        args: List[str] = []
+        if self.peek() == ("op", "("):
+            self.consume()
+            while self.peek() != ("op", ")"):
+                arg = self.consume()
+                if arg is None or arg[0] == "op":
+                    raise FilterSyntaxError(f"Expected an argument for '{token[1]}' in '{self.expr}'")
+                args.append(arg[1])
+                if self.peek() == ("op", ","):
+                    self.consume()
+            self.expect(")")
+        return Filter(func, *args)
+
+
+def parse_filter(expr: str) -> Filter | FilterGroup:
+    """Parse a textual filter expression into a Filter/FilterGroup tree"""
+    return FilterParser(expr).parse()
+
+__all__ = ['FilterParser', 'FilterSyntaxError', 'parse_filter']
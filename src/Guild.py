@@ -1,6 +1,120 @@
-class Guild:
-    def __init__(self, id: str, name: str):
-        self.name = name
-        self.id = id
-
-__all__ = ['Guild']
+from typing import Dict, FrozenSet, Iterator, Tuple
+from src.Config import Config
+from src.PackageSource import resolve
+import os
+import json
+
+class Guild:
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name
+        }
+
+    def __init__(self, id: str, name: str):
+        self.name = name
+        self.id = id
+        self.key = _to_key(id)
+
+    def __repr__(self):
+        return f'<Guild id={self.id} name={self.name!r}>'
+
+def _to_key(id: str | int) -> int:
+    """Integer form of a snowflake id, 0 when there is none"""
+    if isinstance(id, int):
+        return id
+    return int(id) if id and id.isdigit() else 0
+
+class GuildRepo:
+    """Guilds of the package (Servers/index.json), read on first use
+
+    Guilds are keyed by their integer id, like Channel.guild_key, so joining them to messages never compares strings.
+    Several Servers folders can be given (packages loaded together), a guild listed by more than one is the same guild.
+    """
+    _instances: Dict[str, 'GuildRepo'] = {}
+    # Replaces the repo of Config.GUILDS as the default, see mount()
+    _mounted: 'GuildRepo | None' = None
+
+    def __init__(self, dir_path: str, *more_paths: str):
+        self.origin_path = os.path.realpath(dir_path) if dir_path else ""
+        self.origin_paths = [self.origin_path, *(os.path.realpath(path) for path in more_paths)]
+        self._guilds: Dict[int, Guild] | None = None
+        self._by_name: Dict[str, FrozenSet[int]] = {}
+        self._named: Dict[Tuple[str, ...], FrozenSet[int]] = {}
+
+    @staticmethod
+    def default() -> 'GuildRepo':
+        """The repo of Config.GUILDS (or the mounted repo), shared by every caller"""
+        if GuildRepo._mounted is not None:
+            return GuildRepo._mounted
+        if Config.GUILDS not in GuildRepo._instances:
+            GuildRepo._instances[Config.GUILDS] = GuildRepo(Config.GUILDS)
+        return GuildRepo._instances[Config.GUILDS]
+
+    @staticmethod
+    def mount(repo: 'GuildRepo | None'):
+        """Make a repo the default one (None goes back to the repo of Config.GUILDS)"""
+        GuildRepo._mounted = repo
+
+    def _load(self) -> Dict[int, Guild]:
+        guilds = {}
+        for origin_path in filter(None, self.origin_paths):
+            source, root = resolve(origin_path)
+            index_path = source.join(root, "index.json")
+            if source.exists(index_path) and not source.is_dir(index_path):
+                for id, name in json.loads(source.read(index_path)).items():
+                    guild = Guild(id, name)
+                    guilds.setdefault(guild.key, guild)
+        by_name: Dict[str, set] = {}
+        for guild in guilds.values():
+            by_name.setdefault(guild.name.casefold(), set()).add(guild.key)
+        self._by_name = {name: frozenset(keys) for name, keys in by_name.items()}
+        return guilds
+
+    @property
+    def guilds(self) -> Dict[int, Guild]:
+        if self._guilds is None:
+            self._guilds = self._load()
+        return self._guilds
+
+    def get(self, id: str | int) -> Guild | None:
+        return self.guilds.get(_to_key(id))
+
+    def name_of(self, id: str | int) -> str:
+        guild = self.get(id)
+        return guild.name if guild is not None else str(id)
+
+    def label(self, id: str | int) -> str:
+        """Name of a guild, followed by its id when another guild has the same name"""
+        guild = self.get(id)
+        if guild is None:
+            return str(id)
+        if len(self._by_name[guild.name.casefold()]) > 1:
+            return f"{guild.name} ({guild.id})"
+        return guild.name
+
+    def keys_named(self, *names: str) -> FrozenSet[int]:
+        """Integer ids of the guilds with one of these names (case insensitive), ids are accepted as well"""
+        if names in self._named:
+            return self._named[names]
+        if self._guilds is None:
+            self._guilds = self._load()
+        keys = set()
+        for name in names:
+            keys |= self._by_name.get(name.casefold(), frozenset())
+            if name.isdigit():
+                keys.add(int(name))
+        self._named[names] = frozenset(keys)
+        return self._named[names]
+
+    def __len__(self):
+        return len(self.guilds)
+
+    def __iter__(self) -> Iterator[Guild]:
+        return iter(self.guilds.values())
+
+    def __repr__(self):
+        loaded = f"{len(self._guilds)} guilds" if self._guilds is not None else "not loaded"
+        return f"<GuildRepo at {', '.join(self.origin_paths)} ({loaded})>"
+
+__all__ = ['Guild', 'GuildRepo']
@@ -0,0 +1,264 @@
+from typing import List, Dict, Set, Callable, Any, Tuple
+from datetime import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import RLock
+from src.MessageRepo import Message
+from src.Channel import Channel
+from src.Guild import GuildRepo
+from src.Attachments import name_hash, extension_keys, host_keys
+from src.utils.Interner import USERS
+from src.Filter import Filter, FILTERS, _parse_datetime, _account_keys, channel_runs
+from src.utils.Instrumentation import METRICS
+import src.Progress as progress
+
+
+class MessageIndex:
+    """Secondary indexes over a list of messages, each one built on first use
+
+        - a timestamp column sorted along with the message positions, for time range filters (bisect)
+        - posting sets per channel type, per recipient, per guild, per account, and for messages with attachments
+          per attachment extension, host and file name (see src.Attachments)
+
+    Index positions are the positions in the indexed list, like FilterEngine's matching indices.
+    """
+    def __init__(self, data: List[Message]):
+        self.data = data
+        self._timestamps: List[datetime] | None = None
+        self._by_time: array | None = None
+        self._postings: Dict[Tuple[str, Any], Set[int]] = {}
+        self._channels_built = False
+        self._attachments_built = False
+        self._runs: List[Tuple[Channel, int, int]] | None = None
+        self._near_duplicates: 'NearDuplicateIndex | None' = None
+        # Indexes may be built from several worker threads (server mode)
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self.data)
+
+    # ─── Timestamps ──────────────────────────────────────────────────────
+
+    def _build_time_index(self):
+        # A single sort: the task only reports once it is done, when it took long enough
+        with METRICS.phase("index.build_time"), progress.task("index timestamps", len(self.data), "messages") as task:
+            order = sorted(range(len(self.data)), key=lambda i: self.data[i].timestamp)
+            self._by_time = array('I', order)
+            self._timestamps = [self.data[i].timestamp for i in order]
+            task.advance(len(self.data))
+
+    def _time_bounds(self, after: datetime | None, before: datetime | None) -> Tuple[int, int]:
+        """Positions in the sorted column of the messages strictly between after and before"""
+        if self._timestamps is None:
+            with self._lock:
+                if self._timestamps is None:
+                    self._build_time_index()
+        lo = bisect_right(self._timestamps, after) if after is not None else 0
+        hi = bisect_left(self._timestamps, before) if before is not None else len(self._timestamps)
+        return lo, max(lo, hi)
+
+    def time_range(self, after: datetime | None = None, before: datetime | None = None) -> Set[int]:
+        lo, hi = self._time_bounds(after, before)
+        return set(self._by_time[lo:hi])
+
+    def count_time_range(self, after: datetime | None = None, before: datetime | None = None) -> int:
+        lo, hi = self._time_bounds(after, before)
+        return hi - lo
+
+    # ─── Postings ────────────────────────────────────────────────────────
+
+    @property
+    def runs(self) -> List[Tuple[Channel, int, int]]:
+        """Consecutive messages of the same channel, see channel_runs"""
+        if self._runs is None:
+            with self._lock:
+                if self._runs is None:
+                    self._runs = channel_runs(self.data)
+        return self._runs
+
+    def _build_channel_postings(self):
+        with METRICS.phase("index.build_channels"), progress.task("index channels", len(self.data), "messages") as task:
+            for kind in Channel.Type:
+                self._postings[("type", kind)] = set()
+            for channel, start, end in self.runs:
+                task.advance(end - start)
+                positions = range(start, end)
+                self._postings.setdefault(("type", channel.type), set()).update(positions)
+                for recipient in channel.recipient_keys:
+                    self._postings.setdefault(("recipient", recipient), set()).update(positions)
+                if channel.guild_key:
+                    self._postings.setdefault(("guild", channel.guild_key), set()).update(positions)
+                self._postings.setdefault(("account", channel.account), set()).update(positions)
+        self._channels_built = True
+
+    def _build_attachment_postings(self):
+        with METRICS.phase("index.build_attachments"), progress.task("index attachments", len(self.data), "messages") as task:
+            postings = self._postings
+            with_attachments = postings[("attachments", None)] = set()
+            data = self.data
+            for block in task.ranges(len(data)):
+                for i in block:
+                    rows = data[i].attachment_rows
+                    if not rows:
+                        continue
+                    with_attachments.add(i)
+                    # Messages of a federation come from several repos, each with its table
+                    table = data[i].attachment_table
+                    extensions, hosts, hashes = table.extensions, table.hosts, table.name_hashes
+                    for row in rows:
+                        postings.setdefault(("extension", extensions[row]), set()).add(i)
+                        postings.setdefault(("host", hosts[row]), set()).add(i)
+                        postings.setdefault(("name", hashes[row]), set()).add(i)
+        self._attachments_built = True
+
+    def channel_scan(self, f: Filter) -> Set[int]:
+        """Matches of a channel level filter, evaluated once per channel run"""
+        METRICS.count("filter.predicates_evaluated", len(self.runs))
+        matches = set()
+        for _, start, end in self.runs:
+            if f.match(self.data[start]):
+                matches.update(range(start, end))
+        return matches
+
+    def _posting(self, key: Tuple[str, Any]) -> Set[int]:
+        if key[0] in ("type", "recipient", "guild", "account") and not self._channels_built:
+            with self._lock:
+                if not self._channels_built:
+                    self._build_channel_postings()
+        if key[0] in ("attachments", "extension", "host", "name") and not self._attachments_built:
+            with self._lock:
+                if not self._attachments_built:
+                    self._build_attachment_postings()
+        return self._postings.get(key, set())
+
+    def channel_type(self, kind: 'Channel.Type') -> Set[int]:
+        return self._posting(("type", kind))
+
+    def recipients(self, *recipients: str) -> Set[int]:
+        postings = sorted((self._posting(("recipient", USERS.get(r))) for r in recipients), key=len)
+        if not postings:
+            return set(range(len(self.data)))
+        result = postings[0].copy()
+        for posting in postings[1:]:
+            result &= posting
+        return result
+
+    def guilds(self, *keys: int) -> Set[int]:
+        postings = [self._posting(("guild", key)) for key in keys]
+        if len(postings) == 1:
+            return postings[0]
+        return set().union(*postings)
+
+    def accounts(self, *keys: int) -> Set[int]:
+        postings = [self._posting(("account", key)) for key in keys]
+        if len(postings) == 1:
+            return postings[0]
+        return set().union(*postings)
+
+    def with_attachments(self) -> Set[int]:
+        return self._posting(("attachments", None))
+
+    def _union(self, kind: str, keys) -> Set[int]:
+        postings = [self._posting((kind, key)) for key in keys]
+        if len(postings) == 1:
+            return postings[0]
+        return set().union(*postings)
+
+    def attachment_types(self, *kinds: str) -> Set[int]:
+        return self._union("extension", extension_keys(*kinds))
+
+    def attachment_hosts(self, *hosts: str) -> Set[int]:
+        return self._union("host", host_keys(*hosts))
+
+    def attachment_names(self, *names: str) -> Set[int]:
+        return self._union("name", {name_hash(name) for name in names})
+
+    # ─── Near duplicates ─────────────────────────────────────────────────
+
+    @property
+    def near_duplicates(self) -> 'NearDuplicateIndex':
+        """MinHash signatures and LSH bands of the messages (see src.NearDuplicates), signed on first use"""
+        if self._near_duplicates is None:
+            with self._lock:
+                if self._near_duplicates is None:
+                    from src.NearDuplicates import NearDuplicateIndex
+                    self._near_duplicates = NearDuplicateIndex(self.data)
+        return self._near_duplicates
+
+    def near_duplicates_of(self, reference: str, *threshold: str) -> Set[int]:
+        key = ("near_duplicates", reference, *threshold)
+        if key not in self._postings:
+            matches = set(self.near_duplicates.near_duplicates_of(reference, *threshold))
+            with self._lock:
+                self._postings[key] = matches
+        return self._postings[key]
+
+    # ─── Filters ─────────────────────────────────────────────────────────
+
+    def supports(self, f: Filter) -> bool:
+        return f.func in INDEXED_FILTERS
+
+    def lookup(self, f: Filter) -> Set[int]:
+        """Matching positions of an indexed filter (the returned set must not be modified)"""
+        METRICS.count("index.lookups")
+        return INDEXED_FILTERS[f.func][0](self, *f.args)
+
+    def estimate(self, f: Filter) -> int:
+        """Number of matches of an indexed filter, without building the result"""
+        return INDEXED_FILTERS[f.func][1](self, *f.args)
+
+    def __repr__(self):
+        built = [name for name, ok in (("time", self._timestamps is not None), ("channels", self._channels_built), ("attachments", self._attachments_built), ("near duplicates", self._near_duplicates is not None)) if ok]
+        return f"<MessageIndex over {len(self.data)} messages (built: {', '.join(built) or 'none'})>"
+
+
+# filter function -> (lookup, estimate)
+INDEXED_FILTERS: Dict[Callable, Tuple[Callable[..., Set[int]], Callable[..., int]]] = {
+    FILTERS.AlwaysTrue: (
+        lambda index: set(range(len(index))),
+        lambda index: len(index)),
+    FILTERS.SentAfter: (
+        lambda index, ts: index.time_range(after=_parse_datetime(ts)),
+        lambda index, ts: index.count_time_range(after=_parse_datetime(ts))),
+    FILTERS.SentBefore: (
+        lambda index, ts: index.time_range(before=_parse_datetime(ts)),
+        lambda index, ts: index.count_time_range(before=_parse_datetime(ts))),
+    FILTERS.SentBetween: (
+        lambda index, *periods: index.time_range(_parse_datetime(periods[0]), _parse_datetime(periods[1])),
+        lambda index, *periods: index.count_time_range(_parse_datetime(periods[0]), _parse_datetime(periods[1]))),
+    FILTERS.IsDM: (
+        lambda index: index.channel_type(Channel.Type.DM),
+        lambda index: len(index.channel_type(Channel.Type.DM))),
+    FILTERS.IsGroupDM: (
+        lambda index: index.channel_type(Channel.Type.GROUP_DM),
+        lambda index: len(index.channel_type(Channel.Type.GROUP_DM))),
+    FILTERS.IsGuild: (
+        lambda index: index.channel_type(Channel.Type.GUILD),
+        lambda index: len(index.channel_type(Channel.Type.GUILD))),
+    FILTERS.ChannelRecipients: (
+        lambda index, *recipients: index.recipients(*recipients),
+        lambda index, *recipients: min((len(index.recipients(r)) for r in recipients), default=len(index))),
+    FILTERS.InGuild: (
+        lambda index, *guilds: index.guilds(*GuildRepo.default().keys_named(*guilds)),
+        lambda index, *guilds: sum(len(index.guilds(key)) for key in GuildRepo.default().keys_named(*guilds))),
+    FILTERS.InAccount: (
+        lambda index, *accounts: index.accounts(*_account_keys(*accounts)),
+        lambda index, *accounts: sum(len(index.accounts(key)) for key in _account_keys(*accounts))),
+    FILTERS.HasAttachments: (
+        lambda index: index.with_attachments(),
+        lambda index: len(index.with_attachments())),
+    FILTERS.HasAttachmentType: (
+        lambda index, *kinds: index.attachment_types(*kinds),
+        lambda index, *kinds: len(index.attachment_types(*kinds))),
+    FILTERS.HasAttachmentFrom: (
+        lambda index, *hosts: index.attachment_hosts(*hosts),
+        lambda index, *hosts: len(index.attachment_hosts(*hosts))),
+    FILTERS.HasAttachmentNamed: (
+        lambda index, *names: index.attachment_names(*names),
+        lambda index, *names: len(index.attachment_names(*names))),
+    FILTERS.IsNearDuplicateOf: (
+        lambda index, reference, *threshold: index.near_duplicates_of(reference, *threshold),
+        lambda index, reference, *threshold: len(index.near_duplicates_of(reference, *threshold))),
+}
+
+__all__ = ['MessageIndex', 'INDEXED_FILTERS']
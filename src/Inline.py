@@ -0,0 +1,129 @@
+from typing import List, Dict, Any, TextIO
+from src.Config import Config
+from src.Federation import load_repo
+from src.FilterParser import FilterSyntaxError
+from src.Session import Session, SessionError
+from src.utils.Encoder import QuickloadEncoder
+import src.Stat as s
+
+import sys
+import csv
+import json
+import time
+
+"""
+    Inline (batch) mode: evaluates a whole script of definitions and queries over a single load
+
+    Script format, one statement per line:
+        # a comment
+        define NAME FILTER...           same syntax as the CLI 'define' command
+        QUERY...                        any natural language Stat query
+
+    Options:
+        --script FILE   read the script from FILE instead of stdin
+        --format FMT    'json' (default) or 'csv'
+        --output FILE   write the results to FILE instead of stdout
+"""
+
+FORMATS = ("json", "csv")
+CSV_FIELDS = ["line", "kind", "name", "statement", "result", "cached", "ms", "error"]
+
+
+def _get_option(argv: List[str], option: str, default: str | None = None) -> str | None:
+    if option in argv and argv.index(option) + 1 < len(argv):
+        return argv[argv.index(option) + 1]
+    return default
+
+
+def parse_script(lines: List[str]) -> List[Dict[str, Any]]:
+    """Turn script lines into statements: {"line", "kind" ('define' or 'query'), "name", "statement"}"""
+    statements = []
+    for number, raw in enumerate(lines, start=1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.split()[0] == "define":
+            parts = line.split(maxsplit=2)
+            statements.append({"line": number, "kind": "define", "name": parts[1] if len(parts) > 1 else "", "statement": parts[2] if len(parts) > 2 else ""})
+        else:
+            statements.append({"line": number, "kind": "query", "name": "", "statement": line})
+    return statements
+
+
+def _to_output(result: Any) -> Any:
+    """Grouped results keep their labels in the output"""
+    if isinstance(result, s.Groups):
+        return result.to_dict()
+    return result
+
+
+def run(session: Session, statements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Evaluate statements in order, sharing scans between queries, and time each one"""
+    results = []
+    with session.shared_scans():
+        for statement in statements:
+            entry = {**statement, "result": None, "cached": False, "ms": 0.0, "error": None}
+            start = time.perf_counter()
+            try:
+                if statement["kind"] == "define":
+                    entry["result"] = len(session.define(statement["name"], statement["statement"]))
+                else:
+                    entry["cached"] = Session.normalize(statement["statement"]) in session.stats
+                    entry["result"] = _to_output(session.query(statement["statement"]))
+            except (FilterSyntaxError, SessionError, s.ParseError, ValueError) as e:
+                entry["error"] = str(e)
+            entry["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            results.append(entry)
+    return results
+
+
+def write_json(out: TextIO, results: List[Dict[str, Any]], load_ms: float):
+    report = {
+        "package": Config.ROOT,
+        "packages": list(Config.MOUNTS) or [Config.ROOT],
+        "load_ms": round(load_ms, 3),
+        "total_ms": round(load_ms + sum(r["ms"] for r in results), 3),
+        "results": results
+    }
+    out.write(json.dumps(report, cls=QuickloadEncoder, ensure_ascii=False, indent=2))
+    out.write("\n")
+
+
+def write_csv(out: TextIO, results: List[Dict[str, Any]], load_ms: float):
+    writer = csv.DictWriter(out, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    writer.writerow({"line": 0, "kind": "load", "statement": Config.ROOT, "ms": round(load_ms, 3)})
+    for r in results:
+        row = {**r, "result": json.dumps(r["result"], cls=QuickloadEncoder, ensure_ascii=False) if r["result"] is not None else ""}
+        writer.writerow(row)
+
+
+def start(argv: List[str]):
+    fmt = _get_option(argv, "--format", "json")
+    if fmt not in FORMATS:
+        print(f"Unknown format '{fmt}', expected one of {', '.join(FORMATS)}", file=sys.stderr)
+        return 1
+
+    script_path = _get_option(argv, "--script")
+    if script_path:
+        with open(script_path, "r") as file:
+            statements = parse_script(file.readlines())
+    else:
+        statements = parse_script(sys.stdin.readlines())
+
+    load_start = time.perf_counter()
+    session = Session(load_repo())
+    load_ms = (time.perf_counter() - load_start) * 1000
+
+    results = run(session, statements)
+
+    output_path = _get_option(argv, "--output")
+    out = open(output_path, "w", newline="" if fmt == "csv" else None) if output_path else sys.stdout
+    try:
+        (write_json if fmt == "json" else write_csv)(out, results, load_ms)
+    finally:
+        if output_path:
+            out.close()
+    return 1 if any(r["error"] for r in results) else 0
+
+__all__ = ['start', 'run', 'parse_script']
@@ -3,13 +3,20 @@ import os
 from datetime import datetime
 from src.Config import Config
 from src.Channel import Channel
-from src.Spinner import Spinner
+from src.Attachments import AttachmentTable, NO_ATTACHMENTS
+from src.PackageSource import resolve
+from src.Progress import ProgressSink, sink
+from src.utils.Instrumentation import METRICS
 
 class Message(json.JSONEncoder):
-    def __init__(self, id: str, timestamp: str, content: str, attachments: str, channel: Channel):
+    def __init__(self, id: str, timestamp: str, content: str, attachments: str, channel: Channel, table: AttachmentTable | None = None):
         self.id = id
         self.content = content
         self.attachments = attachments
+        # Rows of the parsed attachments in the table of the repo (see src.Attachments), a message built
+        # outside of a repo gets a table of its own
+        self.attachment_table = table if table is not None else AttachmentTable()
+        self.attachment_rows = self.attachment_table.add(attachments) if attachments else NO_ATTACHMENTS
         self.timestamp = datetime.fromisoformat(timestamp)
         self.channel = channel
 
@@ -26,37 +33,56 @@ class Message(json.JSONEncoder):
         return f'<Message id={self.id} sent in channel_id={self.channel.id}>'
 
 class MessageRepo:
-    def __init__(self, dir_path: str, use_spinner: bool = True):
-        if use_spinner:
-            spinner = Spinner("")
-            spinner.start()
+    """Messages of the package, read from the extracted messages folder or straight from the export ZIP
+
+    Channels are loaded in name order, so both sources give the same messages in the same order.
+    workers is the number of threads reading (and decompressing) the channel files ahead of the decoding.
+    user_id is the owner of the package (defaults to Config.USER_ID), packages other than Config's pass theirs.
+    Loading is reported channel by channel to progress (defaults to the current sink, see src.Progress).
+    """
+    def __init__(self, dir_path: str, progress: ProgressSink | None = None, workers: int | None = None, user_id: str | None = None):
         self.messages = []
         self.channels = []
+        # Parsed attachments of the messages, freed with them
+        self.attachments = AttachmentTable()
         
         self.origin_path = os.path.realpath(dir_path)
-        self.context = json.loads(open(os.path.join(self.origin_path, "index.json"), "r").read())
+        source, root = resolve(self.origin_path)
+        self.context = json.loads(source.read(source.join(root, "index.json")))
 
-        for channel in [c for c in os.listdir(self.origin_path) if c != "index.json"]:
-            full_path = os.path.join(self.origin_path, channel)
-            channel_data = json.loads(open(os.path.join(full_path, "channel.json"), "r").read())
-            channel_messages = json.loads(open(os.path.join(full_path, "messages.json"), "r").read())
-            channel_obj = Channel(
-                channel_data["id"],
-                Channel.Type.get_type(channel_data["type"]),
-                name=channel_data.get("name", ""),
-                recipient=channel_data.get("recipients", ""),
-                guild_id=channel_data.get("guild", "")["id"] if channel_data.get("guild") else "")
-            self.channels.append(channel_obj)
-            for message in channel_messages:
-                message_obj = Message(
-                    message.get("ID", ""),
-                    message.get("Timestamp", ""),
-                    message.get("Contents", ""),
-                    message.get("Attachments", ""),
-                    channel_obj)
-                self.messages.append(message_obj)
-        if use_spinner:
-            spinner.stop("  ")
+        channels = [c for c in source.listdir(root) if c != "index.json"]
+        files = source.read_many((source.join(root, channel, name) for channel in channels for name in ("channel.json", "messages.json")), workers)
+        name = os.path.basename(os.path.dirname(self.origin_path)) or self.origin_path
+        with (progress or sink()).task(f"load {name}", len(channels), "channels") as task:
+            for _ in channels:
+                with METRICS.phase("load.read"):
+                    channel_raw = next(files)
+                    messages_raw = next(files)
+                with METRICS.phase("load.json_decode"):
+                    channel_data = json.loads(channel_raw)
+                    channel_messages = json.loads(messages_raw)
+                METRICS.count("load.bytes", len(channel_raw) + len(messages_raw))
+                METRICS.count("load.channels")
+                METRICS.count("load.messages", len(channel_messages))
+                channel_obj = Channel(
+                    channel_data["id"],
+                    Channel.Type.get_type(channel_data["type"]),
+                    name=channel_data.get("name", ""),
+                    recipient=channel_data.get("recipients", ""),
+                    guild_id=channel_data.get("guild", "")["id"] if channel_data.get("guild") else "",
+                    user_id=user_id)
+                self.channels.append(channel_obj)
+                with METRICS.phase("load.build_messages"):
+                    for message in channel_messages:
+                        message_obj = Message(
+                            message.get("ID", ""),
+                            message.get("Timestamp", ""),
+                            message.get("Contents", ""),
+                            message.get("Attachments", ""),
+                            channel_obj,
+                            self.attachments)
+                        self.messages.append(message_obj)
+                task.advance(messages=len(channel_messages), bytes=len(channel_raw) + len(messages_raw))
 
     def get_messages(self):
         return self.messages.copy()
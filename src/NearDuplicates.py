@@ -0,0 +1,408 @@
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from itertools import compress, repeat
+from array import array
+from zlib import crc32
+from src.MessageRepo import Message
+from src.utils.Instrumentation import METRICS
+from src.utils.Parallel import ordered_map
+import src.Progress as progress
+
+import os
+import re
+import sys
+import struct
+import threading
+
+"""
+    Near duplicate messages (copypasta, repeated spam, bot-like messages) found without comparing every pair.
+
+    Each message gets a MinHash signature: its content is lowercased, its whitespace collapsed, and cut into
+    overlapping SHINGLE byte shingles, hashed with CRC32 (identical in every process, so signatures can be
+    computed by a process pool and cached on disk). Signatures use one permutation hashing: the hashes are
+    spread over PERMUTATIONS bins by their top bits and each bin keeps its lowest hash, empty bins borrow the
+    value of the next bin to their right (densification). One pass over the shingles stands for PERMUTATIONS
+    hash functions; two messages agree on a bin with a probability equal to the Jaccard similarity of their
+    shingle sets. Bins keep the low 16 bits of their hash.
+
+    Signatures are cut into BANDS bands of 4 bins, each read as one 64 bit value (the bins of a band are
+    BANDS apart: neighbouring bins of a short message often borrowed the same value). Messages sharing a
+    band are candidates (LSH banding: a pair with similarity s becomes one with probability
+    1 - (1 - s^4)^16, above 0.99 from s = 0.7), and candidates are kept if their estimated similarity
+    reaches the threshold. Finding the candidates is a pass per band in C (Counter, compress), only the
+    colliding messages are handled in Python.
+
+    Clusters link near duplicates transitively (union-find). Within a bucket of messages sharing a band,
+    each member is verified against one member of every cluster the bucket met so far (up to REPRESENTATIVES
+    of them), not against every other member: two members similar to each other but not to the representative
+    of their cluster are only linked through it, or through another band they share.
+
+    Messages with fewer than MIN_SHINGLES distinct shingles get no signature: every "lol" would be a near
+    duplicate of every other one.
+
+    A reference is a message id (a snowflake, ID_PATTERN) looked up in the messages being filtered, or a text.
+
+    Signature tables are computed once per message list (MessageIndex.near_duplicates) and, once a cache
+    directory is set (quickload --signature-cache DIR), saved to a file named after the fingerprint of the
+    contents: the next run over the same messages loads them instead.
+"""
+
+# Bytes per shingle
+SHINGLE = 5
+# Bins of a signature (top bits of the hashes), BANDS bands of PERMUTATIONS // BANDS bins
+PERMUTATIONS = 64
+BANDS = 16
+# Distinct shingles a message needs to be signed
+MIN_SHINGLES = 8
+DEFAULT_THRESHOLD = 0.8
+# References made of 17 to 20 digits are message ids, never texts
+ID_PATTERN = re.compile(r"\d{17,20}")
+# Clusters a band bucket verifies its members against, see _clusters
+REPRESENTATIVES = 16
+# Messages signed per task, lists shorter than PARALLEL_MIN are signed in process
+BLOCK = 16384
+PARALLEL_MIN = 100_000
+
+_BIN_SHIFT = 32 - (PERMUTATIONS.bit_length() - 1)
+# Bins stored band by band, a band takes bins BANDS apart
+_ORDER = [b * BANDS + j for j in range(BANDS) for b in range(PERMUTATIONS // BANDS)]
+_EMPTY = 1 << 32
+# Added to a borrowed value per bin crossed, so that empty bins don't all repeat the same value
+_ROTATION = 0x9E3779B1
+_MAGIC = b"F9QLSIG1"
+_HEADER = struct.Struct("<8s4IQIB")
+
+_cache_dir: str | None = None
+
+
+def set_cache_dir(path: str | None):
+    """Save signature tables in (and load them from) a directory, None disables the cache"""
+    global _cache_dir
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+    _cache_dir = path
+
+
+def parse_threshold(value: str | float) -> float:
+    """'0.8' -> 0.8, thresholds are Jaccard similarities in (0, 1]"""
+    try:
+        threshold = float(value)
+    except (TypeError, ValueError):
+        threshold = -1.0
+    if not 0 < threshold <= 1:
+        raise ValueError(f"Invalid similarity threshold '{value}' (expected a number between 0 and 1)")
+    return threshold
+
+
+def _shingles(content: str) -> set:
+    data = " ".join(content.lower().split()).encode()
+    return {crc32(data[i:i + SHINGLE]) for i in range(len(data) - SHINGLE + 1)}
+
+
+def signature(content: str) -> array | None:
+    """MinHash signature of a message content (PERMUTATIONS 16 bit values), None when it is too short"""
+    hashes = _shingles(content)
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    # Highest first: the dict keeps the last (lowest) hash of each bin
+    descending = sorted(hashes, reverse=True)
+    bins = dict(zip(map(_BIN_SHIFT.__rrshift__, descending), descending))
+    values = list(map(bins.get, range(PERMUTATIONS), repeat(_EMPTY)))
+    if len(bins) < PERMUTATIONS:
+        # Walk leftwards from a filled bin, carrying the value of the closest filled bin on the right
+        start = max(bins)
+        carry = values[start]
+        for step in range(1, PERMUTATIONS):
+            i = (start - step) % PERMUTATIONS
+            if values[i] == _EMPTY:
+                carry = values[i] = carry + _ROTATION
+            else:
+                carry = values[i]
+    return array('H', [values[i] & 0xFFFF for i in _ORDER])
+
+
+# 16 bit lanes: all bits but the top one, the top one
+_LOW = int.from_bytes(b"\xff\x7f" * PERMUTATIONS, "little")
+_HIGH = int.from_bytes(b"\x00\x80" * PERMUTATIONS, "little")
+_ROW = 2 * PERMUTATIONS
+
+
+def _similarity(a, b) -> float:
+    """Estimated Jaccard similarity of two signatures (bytes-like): the fraction of bins they agree on
+
+    Both are read as one integer and XOR-ed, the top bit of each 16 bit lane is then set for the lanes that
+    differ ((x & 0x7FFF) + 0x7FFF never carries out of its lane) and counted at once.
+    """
+    x = int.from_bytes(a, "little") ^ int.from_bytes(b, "little")
+    return (PERMUTATIONS - ((((x & _LOW) + _LOW) | x) & _HIGH).bit_count()) / PERMUTATIONS
+
+
+def _sign_block(contents: List[str]) -> Tuple[bytes, bytes]:
+    """Signatures of a block of contents (runs in a worker process): signed flags and values"""
+    signed = bytearray(len(contents))
+    values = array('H')
+    blank = array('H', bytes(2 * PERMUTATIONS))
+    for i, content in enumerate(contents):
+        sig = signature(content)
+        if sig is None:
+            values.extend(blank)
+        else:
+            signed[i] = 1
+            values.extend(sig)
+    return bytes(signed), values.tobytes()
+
+
+def _blocks(contents: Sequence[str]) -> Iterator[List[str]]:
+    for start in range(0, len(contents), BLOCK):
+        yield list(contents[start:start + BLOCK])
+
+
+class SignatureTable:
+    """Signatures of a list of messages, aligned with it, see the module documentation
+
+    values holds the PERMUTATIONS values of each message one after the other, signed[i] is 0 for the
+    messages without a signature (their values are zeros).
+    """
+    def __init__(self, signed: bytearray, values: array, fingerprint: int = 0):
+        self.signed = signed
+        self.values = values
+        self.fingerprint = fingerprint
+        self._bytes = memoryview(values).cast('B')
+        self._bands = self._bytes.cast('Q')
+
+    @staticmethod
+    def fingerprint_of(contents: Iterable[str]) -> int:
+        fingerprint = 0
+        for content in contents:
+            fingerprint = crc32(content.encode(), crc32(b"\0", fingerprint))
+        return fingerprint
+
+    @staticmethod
+    def compute(contents: Sequence[str], workers: int | None = None) -> 'SignatureTable':
+        """Sign every content, in a process pool for large lists (or load them from the cache directory)"""
+        with METRICS.phase("near_duplicates.fingerprint"):
+            fingerprint = SignatureTable.fingerprint_of(contents)
+        path = os.path.join(_cache_dir, f"signatures-{len(contents)}-{fingerprint:08x}.bin") if _cache_dir else None
+        if path is not None:
+            table = SignatureTable.load(path, len(contents), fingerprint)
+            if table is not None:
+                METRICS.count("near_duplicates.cache_hits")
+                return table
+
+        signed = bytearray()
+        values = array('H')
+        workers = min(workers or os.cpu_count() or 1, -(-len(contents) // BLOCK)) if len(contents) >= PARALLEL_MIN else 1
+        with METRICS.phase("near_duplicates.sign"), progress.task("sign messages", len(contents), "messages") as task:
+            pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+            try:
+                results = map(_sign_block, _blocks(contents)) if pool is None else ordered_map(pool, _sign_block, _blocks(contents), 2 * workers)
+                for block_signed, block_values in results:
+                    signed += block_signed
+                    values.frombytes(block_values)
+                    task.advance(len(block_signed))
+            finally:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+        table = SignatureTable(signed, values, fingerprint)
+        METRICS.count("near_duplicates.signed", sum(signed))
+        if path is not None:
+            table.save(path)
+        return table
+
+    def _header(self) -> bytes:
+        return _HEADER.pack(_MAGIC, SHINGLE, PERMUTATIONS, BANDS, MIN_SHINGLES, len(self), self.fingerprint, sys.byteorder == "little")
+
+    def save(self, path: str):
+        # Written aside and renamed: a concurrent run never reads half a file
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(self._header())
+            file.write(self.signed)
+            self.values.tofile(file)
+        os.replace(temporary, path)
+
+    @staticmethod
+    def load(path: str, n: int, fingerprint: int) -> 'SignatureTable | None':
+        """The table saved at path, None when it is missing or was computed on other messages or parameters"""
+        expected = SignatureTable(bytearray(n), array('H'), fingerprint)._header()
+        try:
+            with open(path, "rb") as file:
+                if file.read(_HEADER.size) != expected:
+                    return None
+                signed = bytearray(file.read(n))
+                values = array('H')
+                values.fromfile(file, n * PERMUTATIONS)
+        except (OSError, EOFError):
+            return None
+        return SignatureTable(signed, values, fingerprint)
+
+    def subset(self, positions: Sequence[int]) -> 'SignatureTable':
+        """Signatures of some messages, in the order of positions"""
+        values = array('H')
+        for i in positions:
+            values.extend(self.values[i * PERMUTATIONS:(i + 1) * PERMUTATIONS])
+        return SignatureTable(bytearray(map(self.signed.__getitem__, positions)), values)
+
+    def band(self, j: int) -> memoryview:
+        """Band j of every message (4 bins read as one 64 bit value), in place"""
+        return self._bands[j::BANDS]
+
+    def row(self, i: int) -> array | None:
+        """Signature of a message, None when it has none"""
+        return self.values[i * PERMUTATIONS:(i + 1) * PERMUTATIONS] if self.signed[i] else None
+
+    def similarity(self, i: int, j: int) -> float:
+        """Estimated Jaccard similarity of two signed messages"""
+        rows = self._bytes
+        return _similarity(rows[i * _ROW:(i + 1) * _ROW], rows[j * _ROW:(j + 1) * _ROW])
+
+    def similarity_to(self, sig: array, i: int) -> float:
+        """Estimated Jaccard similarity of a signature and a signed message"""
+        return _similarity(sig, self._bytes[i * _ROW:(i + 1) * _ROW])
+
+    def __len__(self):
+        return len(self.signed)
+
+    def __repr__(self):
+        return f"<SignatureTable {len(self)} messages, {sum(self.signed)} signed>"
+
+
+class NearDuplicateIndex:
+    """LSH index over the signatures of a list of messages: near duplicates of a message, clusters of near duplicates
+
+    Positions are positions in data, like MessageIndex positions. The signatures are computed (or loaded
+    from the cache directory) unless a table is given.
+    """
+    def __init__(self, data: Sequence[Message], table: SignatureTable | None = None, workers: int | None = None):
+        self.data = data
+        self.table = table if table is not None else SignatureTable.compute([m.content for m in data], workers)
+        self._clusters: Dict[float, List[List[int]]] = {}
+        self._positions: Dict[str, int] | None = None
+        self._lock = threading.Lock()
+
+    def position(self, message_id: str) -> int | None:
+        """Position of a message in data, from an id -> position map built on first use"""
+        if self._positions is None:
+            with self._lock:
+                if self._positions is None:
+                    self._positions = {message.id: i for i, message in enumerate(self.data)}
+        return self._positions.get(message_id)
+
+    def reference_signature(self, reference: str) -> array:
+        """Signature of a reference, a message id is looked up in data and its signature read from the table"""
+        if not ID_PATTERN.fullmatch(reference):
+            return reference_signature(reference)
+        position = self.position(reference)
+        if position is None:
+            raise ValueError(f"Unknown message id {reference}")
+        return _checked(self.table.row(position) if self.table.signed[position] else None, reference)
+
+    def near_duplicates_of(self, reference: str, threshold: str | float = DEFAULT_THRESHOLD) -> List[int]:
+        """Positions of the messages whose similarity with the reference reaches threshold (the reference message included)"""
+        threshold = parse_threshold(threshold)
+        sig = self.reference_signature(reference)
+        table = self.table
+        candidates = set()
+        with METRICS.phase("near_duplicates.query"):
+            for j, key in enumerate(memoryview(sig).cast('B').cast('Q')):
+                candidates.update(compress(range(len(table)), map(key.__eq__, table.band(j))))
+            signed = table.signed
+            matches = [i for i in candidates if signed[i] and table.similarity_to(sig, i) >= threshold]
+        METRICS.count("near_duplicates.candidates", len(candidates))
+        return sorted(matches)
+
+    def clusters(self, threshold: str | float = DEFAULT_THRESHOLD) -> List[List[int]]:
+        """Groups of at least two near duplicates (connected by similarities reaching threshold), largest first"""
+        threshold = parse_threshold(threshold)
+        if threshold not in self._clusters:
+            with self._lock:
+                if threshold not in self._clusters:
+                    self._clusters[threshold] = _clusters(self.table, threshold)
+        return self._clusters[threshold]
+
+    def __repr__(self):
+        return f"<NearDuplicateIndex over {len(self.table)} messages>"
+
+
+def _clusters(table: SignatureTable, threshold: float) -> List[List[int]]:
+    n = len(table)
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Pairs below the threshold, they usually share several bands
+    rejected = set()
+    with METRICS.phase("near_duplicates.cluster"), progress.task("cluster near duplicates", BANDS, "bands") as task:
+        for j in range(BANDS):
+            band = table.band(j)
+            counts = Counter(band)
+            # Values shared by several messages, found and located in C
+            shared = set(compress(counts, map((1).__lt__, counts.values())))
+            # The zeros of the messages without a signature (a signed band of zeros is missed)
+            shared.discard(0)
+            buckets: Dict[int, List[int]] = {}
+            for i in compress(range(n), map(shared.__contains__, band)):
+                buckets.setdefault(band[i], []).append(i)
+            for members in buckets.values():
+                # One member per cluster met in the bucket: each member is verified against those of the other clusters
+                representatives: List[int] = []
+                for i in members:
+                    for r in representatives:
+                        a, b = find(r), find(i)
+                        if a == b or (r, i) in rejected:
+                            continue
+                        if table.similarity(r, i) >= threshold:
+                            parent[b] = a
+                        else:
+                            rejected.add((r, i))
+                    if len(representatives) < REPRESENTATIVES and all(find(r) != find(i) for r in representatives):
+                        representatives.append(i)
+            task.advance()
+    groups: Dict[int, List[int]] = {}
+    for i in compress(range(n), table.signed):
+        groups.setdefault(find(i), []).append(i)
+    clusters = [members for members in groups.values() if len(members) > 1]
+    clusters.sort(key=lambda members: (-len(members), members[0]))
+    METRICS.count("near_duplicates.clusters", len(clusters))
+    return clusters
+
+
+def _checked(sig: array | None, reference: str) -> array:
+    if sig is None:
+        raise ValueError(f"'{reference[:40]}' is too short to have near duplicates ({MIN_SHINGLES} distinct {SHINGLE} byte shingles at least)")
+    return sig
+
+
+def reference_signature(reference: str, data: Sequence[Message] | None = None) -> array:
+    """Signature of a reference: a message id is looked up in data (ValueError when it isn't there), a text is signed"""
+    if not ID_PATTERN.fullmatch(reference):
+        return _checked(signature(reference), reference)
+    if data is None:
+        raise ValueError(f"Message id {reference} given without the messages to look it up in")
+    # One pass, filters signing every message they test cost far more
+    message = next((message for message in data if message.id == reference), None)
+    if message is None:
+        raise ValueError(f"Unknown message id {reference}")
+    return _checked(signature(message.content), reference)
+
+
+def near_duplicate_predicate(reference: str, threshold: str | float = DEFAULT_THRESHOLD, data: Sequence[Message] | None = None):
+    """Predicate of a message: whether it is a near duplicate of the reference (signs each message it tests)
+
+    data holds the messages being filtered, where a message id reference is looked up.
+    """
+    threshold = parse_threshold(threshold)
+    sig = reference_signature(reference, data)
+
+    def match(message: Message) -> bool:
+        other = signature(message.content)
+        return other is not None and _similarity(sig, other) >= threshold
+    return match
+
+__all__ = ['NearDuplicateIndex', 'SignatureTable', 'signature', 'reference_signature', 'near_duplicate_predicate', 'parse_threshold',
+           'set_cache_dir', 'DEFAULT_THRESHOLD', 'ID_PATTERN', 'PERMUTATIONS', 'BANDS', 'MIN_SHINGLES', 'SHINGLE']
@@ -0,0 +1,250 @@
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Set, Tuple
+
+import os
+import threading
+
+"""
+    Where the files of a package are read from: the extracted package directory or the export ZIP itself.
+
+    Paths stay regular paths (Config.MESSAGES, ...): a path going through a .zip file is read from the archive,
+    "exports/package.zip/messages/c123/messages.json" is the member "messages/c123/messages.json".
+    resolve() maps a path to its source and the path inside it, archives are opened once and shared.
+
+    Members are located with the central directory, read once when the archive is opened: any member is
+    read without scanning the archive. Batches of members are decompressed by a thread pool (zlib releases
+    the GIL) while the caller decodes the previous ones, and large members (activity logs) are streamed.
+
+    zipfile, zlib and the thread pool are only imported once an archive is opened: extracted packages don't pay for them.
+"""
+
+# Members read ahead of the consumer by read_many
+READ_AHEAD = 16
+
+
+class PackageSource:
+    """Read only access to the files of a package"""
+    # Default number of threads of read_many
+    READ_WORKERS = 1
+
+    def join(self, *parts: str) -> str:
+        return os.path.join(*parts)
+
+    def full_path(self, path: str) -> str:
+        """Path of a file of this source as accepted by resolve()"""
+        return path
+
+    def exists(self, path: str) -> bool:
+        raise NotImplementedError
+
+    def is_dir(self, path: str) -> bool:
+        raise NotImplementedError
+
+    def listdir(self, path: str) -> List[str]:
+        """Names of the entries of a directory, sorted"""
+        raise NotImplementedError
+
+    def walk_files(self, path: str) -> List[str]:
+        """Every file under a directory (or the path itself if it is a file), sorted"""
+        raise NotImplementedError
+
+    def size(self, path: str) -> int:
+        """Uncompressed size of a file"""
+        raise NotImplementedError
+
+    def read(self, path: str) -> bytes:
+        raise NotImplementedError
+
+    def open(self, path: str) -> BinaryIO:
+        """Binary stream over a file, read as it is consumed"""
+        raise NotImplementedError
+
+    def read_many(self, paths: Iterable[str], workers: int | None = None) -> Iterator[bytes]:
+        """Contents of several files, in order, read by a thread pool a few files ahead of the consumer"""
+        workers = workers or self.READ_WORKERS
+        if workers == 1:
+            yield from map(self.read, paths)
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        from src.utils.Parallel import ordered_map
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from ordered_map(pool, self.read, paths, max(READ_AHEAD, workers))
+
+
+class DirectorySource(PackageSource):
+    """Files of an extracted package, paths are regular file system paths"""
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def is_dir(self, path: str) -> bool:
+        return os.path.isdir(path)
+
+    def listdir(self, path: str) -> List[str]:
+        return sorted(os.listdir(path))
+
+    def walk_files(self, path: str) -> List[str]:
+        if os.path.isfile(path):
+            return [path]
+        return sorted(os.path.join(dir_path, name) for dir_path, _, names in os.walk(path) for name in names)
+
+    def size(self, path: str) -> int:
+        return os.path.getsize(path)
+
+    def read(self, path: str) -> bytes:
+        with open(path, "rb") as file:
+            return file.read()
+
+    def open(self, path: str) -> BinaryIO:
+        return open(path, "rb")
+
+    def __repr__(self):
+        return "<DirectorySource>"
+
+
+class ZipSource(PackageSource):
+    """Members of a ZIP archive, paths are relative to the archive root ("" is the root)
+
+    Archives holding a single top level folder (a zipped "package" directory) are rooted in that folder.
+    """
+    # Decompression runs in parallel, plain file reads are served by the page cache and don't gain from threads
+    READ_WORKERS = min(8, os.cpu_count() or 1)
+
+    def __init__(self, zip_path: str):
+        import zipfile
+        self.zip_path = os.path.realpath(zip_path)
+        self.archive = zipfile.ZipFile(self.zip_path)
+        self._lock = threading.Lock()
+        # One file handle per reading thread, members are read at their offset without sharing a position
+        self._local = threading.local()
+        # Central directory: member path -> ZipInfo, directory path -> names of its entries
+        self.members: Dict[str, 'zipfile.ZipInfo'] = {}
+        self.entries: Dict[str, Set[str]] = {"": set()}
+
+        infos = self.archive.infolist()
+        tops = {info.filename.split("/", 1)[0] for info in infos}
+        prefix = f"{tops.pop()}/" if len(tops) == 1 and all("/" in info.filename for info in infos) else ""
+        for info in infos:
+            name = info.filename[len(prefix):].strip("/")
+            if not name:
+                continue
+            if not info.is_dir():
+                self.members[name] = info
+            # Folders aren't always stored, they are implied by the members under them
+            parts = name.split("/")
+            for depth in range(len(parts)):
+                self.entries.setdefault("/".join(parts[:depth]), set()).add(parts[depth])
+
+    def join(self, *parts: str) -> str:
+        return "/".join(part.strip("/") for part in parts if part)
+
+    def full_path(self, path: str) -> str:
+        return os.path.join(self.zip_path, path) if path else self.zip_path
+
+    def _member(self, path: str) -> 'zipfile.ZipInfo':
+        member = self.members.get(path)
+        if member is None:
+            raise FileNotFoundError(f"No member '{path}' in {self.zip_path}")
+        return member
+
+    def exists(self, path: str) -> bool:
+        return path in self.members or path in self.entries
+
+    def is_dir(self, path: str) -> bool:
+        return path in self.entries
+
+    def listdir(self, path: str) -> List[str]:
+        if path not in self.entries:
+            raise FileNotFoundError(f"No folder '{path}' in {self.zip_path}")
+        return sorted(self.entries[path])
+
+    def walk_files(self, path: str) -> List[str]:
+        if path in self.members:
+            return [path]
+        prefix = f"{path}/" if path else ""
+        return sorted(name for name in self.members if name.startswith(prefix))
+
+    def size(self, path: str) -> int:
+        return self._member(path).file_size
+
+    def _handle(self) -> BinaryIO:
+        handle = getattr(self._local, "handle", None)
+        if handle is None:
+            handle = self._local.handle = open(self.zip_path, "rb")
+        return handle
+
+    def read(self, path: str) -> bytes:
+        import zlib
+        import struct
+        import zipfile
+        member = self._member(path)
+        if member.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or member.flag_bits & 0x1:
+            # Other compressions and encrypted members go through zipfile, one at a time
+            with self._lock:
+                return self.archive.read(member)
+        handle = self._handle()
+        handle.seek(member.header_offset)
+        header = handle.read(zipfile.sizeFileHeader)
+        if len(header) != zipfile.sizeFileHeader or header[:4] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"Bad local header for '{path}' in {self.zip_path}")
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        handle.seek(name_length + extra_length, os.SEEK_CUR)
+        data = handle.read(member.compress_size)
+        # zlib releases the GIL while inflating
+        if member.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -zlib.MAX_WBITS)
+        if zlib.crc32(data) != member.CRC:
+            raise zipfile.BadZipFile(f"Bad CRC-32 for '{path}' in {self.zip_path}")
+        return data
+
+    def open(self, path: str) -> BinaryIO:
+        """Stream over a member, only for the calling thread (the archive's zipfile handle isn't shared between threads)"""
+        return self.archive.open(self._member(path))
+
+    def __repr__(self):
+        return f"<ZipSource {self.zip_path} ({len(self.members)} members)>"
+
+
+DIRECTORY = DirectorySource()
+_archives: Dict[str, ZipSource] = {}
+
+
+def _archive(zip_path: str) -> ZipSource:
+    if zip_path not in _archives:
+        _archives[zip_path] = ZipSource(zip_path)
+    return _archives[zip_path]
+
+
+def _is_archive(path: str) -> bool:
+    return path.lower().endswith(".zip") and os.path.isfile(path)
+
+
+def resolve(path: str) -> Tuple[PackageSource, str]:
+    """The source holding a path and the path inside that source"""
+    path = os.path.realpath(path)
+    if os.path.exists(path) and not _is_archive(path):
+        return DIRECTORY, path
+    # Walk up to the archive the path goes through
+    archive = path
+    while not _is_archive(archive):
+        parent = os.path.dirname(archive)
+        if parent == archive or os.path.exists(archive):
+            return DIRECTORY, path
+        archive = parent
+    inner = os.path.relpath(path, archive)
+    return _archive(archive), "" if inner == "." else inner.replace(os.sep, "/")
+
+
+def is_archived(path: str) -> bool:
+    """Whether a path is read from a ZIP archive"""
+    return isinstance(resolve(path)[0], ZipSource)
+
+
+def read(path: str) -> bytes:
+    source, inner = resolve(path)
+    return source.read(inner)
+
+
+def exists(path: str) -> bool:
+    source, inner = resolve(path)
+    return source.exists(inner)
+
+__all__ = ['PackageSource', 'DirectorySource', 'ZipSource', 'resolve', 'is_archived', 'read', 'exists']
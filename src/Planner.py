@@ -0,0 +1,292 @@
+from typing import List, Set, Tuple, Any
+from src.Filter import Filter, FILTERS
+from src.FilterEngine import FilterGroup
+from src.Index import MessageIndex
+from src.utils.Instrumentation import METRICS
+import src.Progress as progress
+
+"""
+    Filter tree planner
+
+    1. normalize(): rewrites a Filter/FilterGroup tree into an equivalent, flatter one
+        - nested AND/OR groups of the same logic are flattened
+        - NOT is pushed down to the leaves with De Morgan's laws, double negations cancel out
+        - AlwaysTrue is removed from AND groups and absorbs OR groups
+        - duplicate children are folded, x & ~x and x | ~x are resolved
+    2. Planner.plan(): picks, for each leaf, between an index lookup and a scan, from cardinality
+       estimates (exact counts for indexed filters, sampled selectivity for the others), and orders
+       AND children so that the most selective ones run first and the next ones only probe their matches
+    3. Plan.execute(): evaluates the plan, Plan.explain() prints it
+"""
+
+# Relative cost of evaluating a predicate on one message (IsDM ~ 1)
+SCAN_COSTS = {
+    FILTERS.MentionsUser: 4, FILTERS.HasUserMention: 3, FILTERS.MentionsChannel: 4, FILTERS.HasChannelMention: 3,
+    FILTERS.HasUserMentionCountGt: 4, FILTERS.HasUserMentionCountLt: 4, FILTERS.HasUserMentionCountEq: 4,
+    FILTERS.HasChannemMentionCountGt: 4, FILTERS.HasChannemMentionCountLt: 4, FILTERS.HasChannemMentionCountEq: 4,
+    FILTERS.MessageContains: 4, FILTERS.MessageContainsIgnoreCase: 4, FILTERS.MessageRegex: 5, FILTERS.ContainsUrl: 3,
+    FILTERS.SentAfter: 2, FILTERS.SentBefore: 2, FILTERS.SentBetween: 3, FILTERS.InGuild: 2, FILTERS.InAccount: 2,
+    FILTERS.HasAttachmentType: 2, FILTERS.HasAttachmentFrom: 2, FILTERS.HasAttachmentNamed: 2,
+    # Signs every message it tests
+    FILTERS.IsNearDuplicateOf: 60,
+}
+DEFAULT_SCAN_COST = 1.5
+# Cost of producing one row from an index, relative to scanning one message
+INDEX_ROW_COST = 0.15
+SAMPLE_SIZE = 512
+
+# ─── Normalization ───────────────────────────────────────────────────────
+
+type Node = Filter | FilterGroup
+
+def _is_true(node: Node) -> bool:
+    return isinstance(node, Filter) and node.func == FILTERS.AlwaysTrue
+
+def _is_false(node: Node) -> bool:
+    return isinstance(node, FilterGroup) and node.logic == FilterGroup.Logic.NOT and len(node.filters) == 1 and not node.subgroups and _is_true(node.filters[0])
+
+def _true() -> Filter:
+    return Filter(FILTERS.AlwaysTrue)
+
+def _false() -> FilterGroup:
+    return ~_true()
+
+def _children(group: FilterGroup) -> List[Node]:
+    return [*group.filters, *group.subgroups]
+
+def _group(logic: 'FilterGroup.Logic', children: List[Node]) -> FilterGroup:
+    group = FilterGroup(logic)
+    for child in children:
+        (group.filters if isinstance(child, Filter) else group.subgroups).append(child)
+    return group
+
+def key(node: Node) -> Tuple:
+    """Structural key of a tree, equal for equivalent AND/OR groups whatever the order of their children"""
+    if isinstance(node, Filter):
+        return ("filter", node.func, tuple(map(str, node.args)))
+    return (node.logic.name, frozenset(key(c) for c in _children(node)))
+
+def _negate(node: Node) -> Node:
+    """Push a negation down to the leaves"""
+    if _is_true(node):
+        return _false()
+    if isinstance(node, Filter):
+        return _group(FilterGroup.Logic.NOT, [node])
+    children = _children(node)
+    if node.logic == FilterGroup.Logic.NOT:
+        # NOT groups are NOR: ~(~(a, b)) == a | b
+        return normalize(_group(FilterGroup.Logic.OR, children))
+    flipped = FilterGroup.Logic.OR if node.logic == FilterGroup.Logic.AND else FilterGroup.Logic.AND
+    return normalize(_group(flipped, [_negate(normalize(c)) for c in children]))
+
+def normalize(node: Node) -> Node:
+    """Return an equivalent tree in normal form (see module documentation), the input is left untouched"""
+    if isinstance(node, Filter):
+        return node
+
+    children = _children(node)
+    if node.logic == FilterGroup.Logic.NOT:
+        if not children:
+            return _false()
+        if len(children) == 1 and isinstance(children[0], Filter):
+            # A negated leaf is already in normal form
+            return _negate(children[0])
+        # NOT(a, b, ...) == ~a & ~b & ...
+        return normalize(_group(FilterGroup.Logic.AND, [_negate(normalize(c)) for c in children]))
+
+    is_and = node.logic == FilterGroup.Logic.AND
+    flat: List[Node] = []
+    for child in map(normalize, children):
+        if isinstance(child, FilterGroup) and child.logic == node.logic:
+            flat.extend(_children(child))
+        else:
+            flat.append(child)
+
+    folded: List[Node] = []
+    seen = set()
+    for child in flat:
+        if _is_true(child):
+            if is_and:
+                continue
+            return _true()
+        if _is_false(child):
+            if is_and:
+                return _false()
+            continue
+        k = key(child)
+        if k in seen:
+            continue
+        seen.add(k)
+        folded.append(child)
+
+    # x & ~x is empty, x | ~x is everything
+    for child in folded:
+        if isinstance(child, FilterGroup) and child.logic == FilterGroup.Logic.NOT and key(_children(child)[0]) in seen:
+            return _false() if is_and else _true()
+
+    if not folded:
+        return _true() if is_and else _false()
+    if len(folded) == 1:
+        return folded[0]
+    return _group(node.logic, folded)
+
+# ─── Planning ────────────────────────────────────────────────────────────
+
+class Plan:
+    """A node of an execution plan
+
+    kind is one of:
+        "index"  look the matches up in the MessageIndex
+        "scan"   test the predicate on every candidate message (once per channel for channel level filters)
+        "and", "or", "not" combine the children
+    """
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "filter": repr(self.filter) if self.filter is not None else None,
+            "estimated_rows": self.rows,
+            "cost": round(self.cost, 1),
+            "children": self.children
+        }
+
+    def __init__(self, kind: str, filter: Filter | None = None, rows: float = 0, cost: float = 0, children: List['Plan'] | None = None):
+        self.kind = kind
+        self.filter = filter
+        self.rows = rows
+        self.cost = cost
+        self.children = children or []
+        self.index: MessageIndex | None = None
+
+    def execute(self, candidates: Set[int] | None = None) -> Set[int]:
+        """Matching positions among candidates (all messages when None)"""
+        data = self.index.data
+        if self.kind == "index":
+            matches = self.index.lookup(self.filter)
+            # Index sets are shared, never hand them out
+            return set(matches) if candidates is None else candidates & matches
+        if self.kind == "scan":
+            if self.filter.is_channel_level:
+                matches = self.index.channel_scan(self.filter)
+                return matches if candidates is None else candidates & matches
+            with METRICS.phase(f"filter.{self.filter.name}" if METRICS.enabled else ""):
+                METRICS.count("filter.predicates_evaluated", len(data) if candidates is None else len(candidates))
+                func, args = self.filter.func, self.filter.args
+                prepared = self.filter.prepared(data)
+                pool = range(len(data)) if candidates is None else candidates
+                matches = set()
+                with progress.task(f"scan {self.filter!r}", len(pool), "messages") as task:
+                    for batch in task.batches(pool):
+                        if prepared is not None:
+                            matches.update(i for i in batch if prepared(data[i]))
+                        else:
+                            matches.update(i for i in batch if func(data[i], *args))
+                return matches
+        if self.kind == "not":
+            pool = set(range(len(data))) if candidates is None else candidates
+            return pool - self.children[0].execute(candidates)
+        if self.kind == "and":
+            result = candidates
+            for child in self.children:
+                result = child.execute(result)
+                if not result:
+                    return set()
+            return result if result is not None else set(range(len(data)))
+        # or
+        result: Set[int] = set()
+        for child in self.children:
+            pool = candidates
+            if child.kind != "index" and result:
+                # Only test what isn't already matched
+                pool = (set(range(len(data))) if candidates is None else candidates) - result
+            result |= child.execute(pool)
+        return result
+
+    def explain(self, depth: int = 0) -> str:
+        label = {"index": "IndexLookup", "scan": "Scan", "and": "AND", "or": "OR", "not": "NOT"}[self.kind]
+        if self.filter is not None:
+            label += f" {self.filter!r}"
+        line = f"{'  ' * depth}{'-> ' if depth else ''}{label}  (rows~{int(self.rows)}, cost~{self.cost:.0f})"
+        return "\n".join([line, *(c.explain(depth + 1) for c in self.children)])
+
+    def __str__(self):
+        return self.explain()
+
+    def __repr__(self):
+        return f"<Plan {self.kind} rows~{int(self.rows)} cost~{self.cost:.0f}>"
+
+
+class Planner:
+    def __init__(self, index: MessageIndex):
+        self.index = index
+        self._selectivity: dict = {}
+
+    def selectivity(self, f: Filter) -> float:
+        """Fraction of messages matching a filter: exact for indexed filters, sampled otherwise"""
+        n = len(self.index)
+        if n == 0:
+            return 0.0
+        if self.index.supports(f):
+            return self.index.estimate(f) / n
+        k = key(f)
+        if k not in self._selectivity:
+            data = self.index.data
+            step = max(1, n // SAMPLE_SIZE)
+            sample = range(0, n, step)
+            self._selectivity[k] = sum(1 for i in sample if f.match(data[i])) / len(sample)
+        return self._selectivity[k]
+
+    def plan(self, tree: Node, normalized: bool = False) -> Plan:
+        """Build the cheapest plan for a filter tree"""
+        if not normalized:
+            tree = normalize(tree)
+        plan = self._plan(tree, float(len(self.index)))
+        self._attach(plan)
+        return plan
+
+    def _attach(self, plan: Plan):
+        plan.index = self.index
+        for child in plan.children:
+            self._attach(child)
+
+    def _plan(self, node: Node, candidates: float) -> Plan:
+        n = len(self.index)
+        if isinstance(node, Filter):
+            rows = self.selectivity(node) * candidates
+            scan_cost = candidates * SCAN_COSTS.get(node.func, DEFAULT_SCAN_COST)
+            if node.is_channel_level:
+                # One evaluation per channel run, then the matching runs are expanded
+                scan_cost = len(self.index.runs) * DEFAULT_SCAN_COST + (self.selectivity(node) * n + (candidates if candidates < n else 0)) * INDEX_ROW_COST
+            if self.index.supports(node):
+                index_cost = self.selectivity(node) * n * INDEX_ROW_COST + (candidates if candidates < n else 0) * INDEX_ROW_COST
+                if index_cost <= scan_cost:
+                    return Plan("index", node, rows, index_cost)
+            return Plan("scan", node, rows, scan_cost)
+
+        children = _children(node)
+        if node.logic == FilterGroup.Logic.NOT:
+            # Only leaves are negated after normalization
+            child = self._plan(children[0], candidates)
+            return Plan("not", None, max(0.0, candidates - child.rows), child.cost + candidates * INDEX_ROW_COST, [child])
+
+        if node.logic == FilterGroup.Logic.AND:
+            # Greedy ordering: at each step, run the child with the lowest cost per discarded row
+            remaining = list(children)
+            planned: List[Plan] = []
+            rows, cost = candidates, 0.0
+            while remaining:
+                options = [(self._plan(c, rows), c) for c in remaining]
+                best, chosen = min(options, key=lambda o: o[0].cost / max(1e-9, rows - o[0].rows + 1))
+                remaining.remove(chosen)
+                planned.append(best)
+                cost += best.cost
+                rows = best.rows
+            return Plan("and", None, rows, cost, planned)
+
+        # OR: cheapest children first, the following ones only test what isn't matched yet
+        planned = sorted((self._plan(c, candidates) for c in children), key=lambda p: p.cost)
+        miss = 1.0
+        for p in planned:
+            miss *= 1 - (p.rows / candidates if candidates else 0)
+        return Plan("or", None, candidates * (1 - miss), sum(p.cost for p in planned), planned)
+
+__all__ = ['Planner', 'Plan', 'normalize', 'key']
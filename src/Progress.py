@@ -0,0 +1,266 @@
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, TypeVar
+from itertools import count, islice
+from contextlib import contextmanager
+import sys
+import json
+import time
+import threading
+
+"""
+    Progress of long operations: package loading, index building, long filter scans and statistics.
+
+    The code doing the work opens a Task on the current sink and advances it in batches (a channel file,
+    an Activity chunk, a block of BLOCK messages), never per message: advance() adds to counters and
+    reads the clock, reports only go out every `interval` seconds of the sink. Short tasks stay silent:
+    a task is only reported once it has run for an interval, so quick filters don't flood the sink.
+
+    Sinks decide where reports go:
+        - NullSink: nowhere, the default
+        - TerminalBar: one line rewritten in place (bar, percentage, rate, ETA), for the CLI
+        - JsonLinesSink: one JSON object per report, for servers and batch runs without a TTY
+    Entry points choose the sink with set_sink() (quickload --progress bar|json|none).
+
+    The same batches are the cancellation points of the work: inside cancellable(event), every task the
+    thread opens raises Cancelled from advance() once the event is set (the TUI drops stale filters so).
+"""
+
+T = TypeVar("T")
+
+# Messages handed to a scan between two advance() calls
+BLOCK = 65536
+
+_ids = count(1)
+# Cancellation event of the running thread, see cancellable()
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    """Raised by Task.advance() once the work it reports on is cancelled"""
+    pass
+
+
+class ProgressEvent:
+    """A report of a task, status is "start", "progress" or "end\""""
+    def __init__(self, task: 'Task', status: str, elapsed: float):
+        self.id = task.id
+        self.name = task.name
+        self.status = status
+        self.done = task.done
+        self.total = task.total
+        self.unit = task.unit
+        self.elapsed = elapsed
+        self.counters = dict(task.counters)
+
+    @property
+    def rate(self) -> float:
+        """Units done per second"""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def rates(self) -> Dict[str, float]:
+        """Counters per second (messages/s, bytes/s...)"""
+        return {name: value / self.elapsed if self.elapsed > 0 else 0.0 for name, value in self.counters.items()}
+
+    @property
+    def eta(self) -> float | None:
+        """Seconds left at the current rate, None without a total"""
+        if self.total is None or self.done == 0:
+            return None
+        return max(0.0, (self.total - self.done) / self.rate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task": self.name,
+            "id": self.id,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "unit": self.unit,
+            "elapsed_s": round(self.elapsed, 3),
+            "rate": round(self.rate, 1),
+            "eta_s": round(self.eta, 1) if self.eta is not None else None,
+            "counters": self.counters,
+            "rates": {name: round(rate, 1) for name, rate in self.rates.items()}
+        }
+
+    def __repr__(self):
+        return f"<ProgressEvent {self.name} {self.status} {self.done}/{self.total} {self.unit}>"
+
+
+class ProgressSink:
+    """Receives the reports of tasks, emit() may be called from several threads"""
+    # Seconds between two reports of a task
+    interval = 0.1
+    enabled = True
+
+    def emit(self, event: ProgressEvent):
+        raise NotImplementedError
+
+    def task(self, name: str, total: int | None = None, unit: str = "items") -> 'Task':
+        return Task(self, name, total, unit)
+
+
+class NullSink(ProgressSink):
+    """Drops every report"""
+    enabled = False
+    interval = float("inf")
+
+    def emit(self, event: ProgressEvent):
+        pass
+
+
+class TerminalBar(ProgressSink):
+    """Running tasks on a single line of a terminal, the line is cleared once they are all done"""
+    WIDTH = 20
+
+    def __init__(self, stream: TextIO | None = None, interval: float = 0.1):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active: Dict[int, ProgressEvent] = {}
+        self._drawn = 0
+
+    @staticmethod
+    def _amount(value: float) -> str:
+        for limit, suffix in ((1e9, "G"), (1e6, "M"), (1e3, "k")):
+            if value >= limit:
+                return f"{value / limit:.1f}{suffix}"
+        return f"{value:.0f}"
+
+    def render(self, event: ProgressEvent) -> str:
+        parts = [event.name]
+        if event.total:
+            filled = min(self.WIDTH, int(self.WIDTH * event.done / event.total))
+            parts.append(f"[{'#' * filled}{'-' * (self.WIDTH - filled)}] {100 * event.done / event.total:.0f}%")
+        parts.append(f"{self._amount(event.done)}{f'/{self._amount(event.total)}' if event.total else ''} {event.unit}")
+        parts.extend(f"{self._amount(rate)} {name}/s" for name, rate in event.rates.items())
+        if event.eta is not None:
+            parts.append(f"ETA {event.eta:.0f}s")
+        return " ".join(parts)
+
+    def emit(self, event: ProgressEvent):
+        with self._lock:
+            if event.status == "end":
+                self._active.pop(event.id, None)
+            else:
+                self._active[event.id] = event
+            line = " | ".join(self.render(e) for e in self._active.values())
+            self.stream.write(f"\r{line}{' ' * max(0, self._drawn - len(line))}" + ("\r" if not line else ""))
+            self.stream.flush()
+            self._drawn = len(line)
+
+
+class JsonLinesSink(ProgressSink):
+    """One JSON object per report"""
+    def __init__(self, stream: TextIO | None = None, interval: float = 1.0):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def emit(self, event: ProgressEvent):
+        line = json.dumps(event.to_dict())
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class Task:
+    """Progress of one operation, see the module documentation
+
+    Use it as a context manager, the task ends with the block:
+        with sink().task("load", total=len(files), unit="files") as task:
+            for file in files:
+                ...
+                task.advance(messages=n)
+    """
+    def __init__(self, sink: ProgressSink, name: str, total: int | None = None, unit: str = "items"):
+        self.sink = sink
+        self.id = next(_ids)
+        self.name = name
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.counters: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self._next = self.started + sink.interval
+        self._reported = False
+        self._cancel: threading.Event | None = getattr(_local, "cancel", None)
+
+    def advance(self, n: int = 1, **counters: int):
+        """n more units done, counters are added to the task's counters (messages, bytes...)"""
+        if self._cancel is not None and self._cancel.is_set():
+            raise Cancelled(self.name)
+        self.done += n
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        now = time.perf_counter()
+        if now >= self._next:
+            self._next = now + self.sink.interval
+            self._report("progress" if self._reported else "start", now)
+
+    def ranges(self, n: int, size: int = BLOCK) -> Iterator[range]:
+        """range(n) cut in blocks, the task advances after each block"""
+        for start in range(0, n, size):
+            block = range(start, min(n, start + size))
+            yield block
+            self.advance(len(block))
+
+    def batches(self, items: Iterable[T], size: int = BLOCK) -> Iterator[List[T]]:
+        """Items in lists of `size`, the task advances after each list"""
+        iterator = iter(items)
+        while batch := list(islice(iterator, size)):
+            yield batch
+            self.advance(len(batch))
+
+    def _report(self, status: str, now: float):
+        self._reported = True
+        self.sink.emit(ProgressEvent(self, status, now - self.started))
+
+    def finish(self):
+        # Tasks that never reported stay silent
+        if self._reported:
+            self._report("end", time.perf_counter())
+
+    def __enter__(self) -> 'Task':
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+
+    def __repr__(self):
+        return f"<Task {self.name} {self.done}/{self.total} {self.unit}>"
+
+
+NULL = NullSink()
+_sink: ProgressSink = NULL
+
+SINKS = {"none": NullSink, "bar": TerminalBar, "json": JsonLinesSink}
+
+
+def sink() -> ProgressSink:
+    """The sink reports go to (NullSink until an entry point sets one)"""
+    return _sink
+
+
+def set_sink(new_sink: ProgressSink | None):
+    """Send the reports of every following task to a sink (None drops them)"""
+    global _sink
+    _sink = new_sink or NULL
+
+
+def task(name: str, total: int | None = None, unit: str = "items") -> Task:
+    """A task reporting to the current sink"""
+    return _sink.task(name, total, unit)
+
+
+@contextmanager
+def cancellable(event: threading.Event):
+    """Tasks opened by this thread in the block raise Cancelled at their next batch once event is set"""
+    previous = getattr(_local, "cancel", None)
+    _local.cancel = event
+    try:
+        yield
+    finally:
+        _local.cancel = previous
+
+__all__ = ['ProgressEvent', 'ProgressSink', 'NullSink', 'TerminalBar', 'JsonLinesSink', 'Task', 'Cancelled', 'NULL', 'SINKS', 'BLOCK', 'sink', 'set_sink', 'task', 'cancellable']
@@ -0,0 +1,229 @@
+from typing import Dict, Any, Tuple, Callable, Awaitable
+from concurrent.futures import ThreadPoolExecutor
+from src.Config import Config
+from src.Federation import load_repo
+from src.FilterParser import parse_filter, FilterSyntaxError
+from src.Session import Session, SessionError
+from src.utils.Encoder import QuickloadEncoder
+import src.Stat as s
+
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+
+"""
+    Server mode: keeps one loaded package resident and answers queries over HTTP/1.1,
+    either on a localhost TCP port or on a Unix socket (curl --unix-socket ...)
+
+    Endpoints (JSON bodies and responses):
+        GET  /status                                    package and session summary
+        POST /query     {"query": "..."}                natural language Stat query
+        POST /filter    {"filter": "...", "limit": N}   number of matches and the first N messages
+        POST /define    {"name": "...", "filter": "..."}
+        POST /drop      {"name": "..."}
+
+    Identical requests arriving while one is being computed are coalesced: they all await the same result
+    (not across a define or drop, which may change it). Evaluation runs in a thread pool so that the event
+    loop keeps accepting clients while queries run; the Stat engine is pure Python, so the threads overlap
+    waiting, not computing: CPU heavy queries still run one at a time under the GIL. The session guards its
+    own state (see Session), queries only cache results still valid once they are done.
+"""
+
+DEFAULT_PORT = 8999
+MAX_BODY_SIZE = 1 << 20
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """Raised by handlers to answer with an HTTP error status"""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryServer:
+    def __init__(self, session: Session, workers: int | None = None):
+        self.session = session
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count(), thread_name_prefix="f9ql-worker")
+        self.in_flight: Dict[Tuple, asyncio.Future] = {}
+        self.served = 0
+        self.coalesced = 0
+        self.routes: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Awaitable[Any]]] = {
+            ("GET", "/status"): self.handle_status,
+            ("POST", "/query"): self.handle_query,
+            ("POST", "/filter"): self.handle_filter,
+            ("POST", "/define"): self.handle_define,
+            ("POST", "/drop"): self.handle_drop,
+        }
+
+    # ─── Evaluation ──────────────────────────────────────────────────────
+
+    async def coalesce(self, key: Tuple, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn in the worker pool, or join the identical computation already running"""
+        if key in self.in_flight:
+            self.coalesced += 1
+            return await asyncio.shield(self.in_flight[key]), True
+        future = asyncio.get_running_loop().run_in_executor(self.pool, fn)
+        self.in_flight[key] = future
+        try:
+            return await future, False
+        finally:
+            self.in_flight.pop(key, None)
+
+    def _filter(self, expr: str, limit: int) -> Dict[str, Any]:
+        indices = sorted(self.session.engine.get_matching_indices(parse_filter(expr)))
+        return {"count": len(indices), "messages": [self.session.data[i] for i in indices[:limit]]}
+
+    def _define(self, name: str, expr: str) -> int:
+        return len(self.session.define(name, expr))
+
+    def _drop(self, name: str) -> int:
+        return len(self.session.drop(name))
+
+    # ─── Handlers ────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _field(body: Dict[str, Any], name: str) -> Any:
+        if name not in body:
+            raise RequestError(400, f"Missing field '{name}'")
+        return body[name]
+
+    async def handle_status(self, body: Dict[str, Any]) -> Any:
+        with self.session.lock:
+            return {
+                "package": Config.ROOT,
+                "packages": list(Config.MOUNTS) or [Config.ROOT],
+                "messages": self.session.repo.get_n_messages(),
+                "channels": self.session.repo.get_n_channels(),
+                "collections": list(self.session.collections.values()),
+                "cached_stats": len(self.session.stats),
+                "served": self.served,
+                "coalesced": self.coalesced
+            }
+
+    async def handle_query(self, body: Dict[str, Any]) -> Any:
+        query = str(self._field(body, "query"))
+        key = ("query", Session.normalize(query), self.session.generation)
+        result, coalesced = await self.coalesce(key, lambda: self.session.query(query))
+        return {"result": result.to_dict() if isinstance(result, s.Groups) else result, "coalesced": coalesced}
+
+    async def handle_filter(self, body: Dict[str, Any]) -> Any:
+        expr = str(self._field(body, "filter"))
+        limit = int(body.get("limit", 100))
+        result, coalesced = await self.coalesce(("filter", expr, limit), lambda: self._filter(expr, limit))
+        return {**result, "coalesced": coalesced}
+
+    async def handle_define(self, body: Dict[str, Any]) -> Any:
+        name, expr = str(self._field(body, "name")), str(self._field(body, "filter"))
+        size = await asyncio.get_running_loop().run_in_executor(self.pool, self._define, name, expr)
+        return {"name": name, "size": size}
+
+    async def handle_drop(self, body: Dict[str, Any]) -> Any:
+        name = str(self._field(body, "name"))
+        size = await asyncio.get_running_loop().run_in_executor(self.pool, self._drop, name)
+        return {"name": name, "size": size}
+
+    # ─── HTTP ────────────────────────────────────────────────────────────
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, Any]]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) < 2:
+            raise RequestError(400, "Malformed request line")
+        method, path = request_line[0].upper(), request_line[1].split("?")[0]
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", 0) or 0)
+        if length > MAX_BODY_SIZE:
+            raise RequestError(413, "Request body too large")
+        body: Dict[str, Any] = {}
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except json.JSONDecodeError as e:
+                raise RequestError(400, f"Invalid JSON body: {e}")
+            if not isinstance(body, dict):
+                raise RequestError(400, "The request body must be a JSON object")
+        return method, path, body
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        status, payload = 200, None
+        start = time.perf_counter()
+        try:
+            method, path, body = await self.read_request(reader)
+            handler = self.routes.get((method, path))
+            if handler is None:
+                known_path = any(p == path for _, p in self.routes)
+                raise RequestError(405 if known_path else 404, f"No route for {method} {path}")
+            payload = await handler(body)
+        except RequestError as e:
+            status, payload = e.status, {"error": str(e)}
+        except (FilterSyntaxError, SessionError, s.ParseError, ValueError) as e:
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        self.served += 1
+
+        if isinstance(payload, dict):
+            payload["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        data = json.dumps(payload, cls=QuickloadEncoder, ensure_ascii=False).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + data)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: str | None = None):
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=socket_path)
+            where = f"unix:{socket_path}"
+        else:
+            server = await asyncio.start_server(self.handle_client, host=host, port=port)
+            where = f"http://{host}:{port}"
+        print(f"Serving {self.session.repo} on {where}", file=sys.stderr)
+
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, lambda: stop.done() or stop.set_result(None))
+            except (NotImplementedError, RuntimeError):
+                # Windows: CTRL+C still raises KeyboardInterrupt
+                pass
+        async with server:
+            await stop
+
+
+def start(argv: list[str]):
+    socket_path = argv[argv.index("--socket") + 1] if "--socket" in argv and argv.index("--socket") + 1 < len(argv) else None
+    port = int(argv[argv.index("--port") + 1]) if "--port" in argv and argv.index("--port") + 1 < len(argv) else DEFAULT_PORT
+    workers = int(argv[argv.index("--workers") + 1]) if "--workers" in argv and argv.index("--workers") + 1 < len(argv) else None
+
+    session = Session(load_repo())
+    server = QueryServer(session, workers)
+    try:
+        # The session stays in shared scan mode for the whole life of the server
+        with session.shared_scans():
+            asyncio.run(server.serve(port=port, socket_path=socket_path))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.pool.shutdown(wait=False, cancel_futures=True)
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+__all__ = ['QueryServer', 'start']
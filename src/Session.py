@@ -0,0 +1,244 @@
+from typing import Dict, List, Iterable, Any, Set
+from array import array
+from contextlib import contextmanager
+import threading
+
+from src.MessageRepo import MessageRepo, Message
+from src.Filter import Filter
+from src.FilterEngine import FilterEngine, FilterGroup
+from src.FilterParser import parse_filter
+import src.Stat as s
+
+DEFAULT_SOURCE = "default"
+
+
+class SessionError(Exception):
+    """Raised when a session operation cannot be fulfilled (unknown or reserved collection name...)"""
+    pass
+
+
+class Collection:
+    """A named subset of the session's messages, stored as a sorted array of message indices"""
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "filters": self.filters,
+            "expression": self.expression,
+            "size": len(self.indices)
+        }
+
+    def __init__(self, name: str, indices: Iterable[int], filters: Filter | FilterGroup | None = None, expression: str = ""):
+        self.name = name
+        self.filters = filters
+        self.expression = expression
+        self.indices: array = array('I', sorted(indices))
+
+    def messages(self, data: List[Message]) -> List[Message]:
+        return [data[i] for i in self.indices]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __repr__(self):
+        return f"<Collection '{self.name}' of {len(self.indices)} messages>"
+
+
+class Session:
+    """State kept alive between commands: the loaded messages, named collections and cached stat results
+
+    Collections only hold message indices, the Message lists handed to the Stat engine are built
+    on demand for the collections a query actually references.
+
+    A session may be shared by several threads (server mode): the collections and caches are only read
+    and written under `lock`, while queries evaluate outside of it. Every invalidation of a collection
+    bumps its version, a query whose collections changed while it ran returns its result without
+    caching it. Queries evaluate against a private copy of the scan cache, merged back under the lock
+    unless an invalidation happened meanwhile.
+    """
+    def __init__(self, repo: MessageRepo):
+        self.repo = repo
+        self.data: List[Message] = repo.get_messages()
+        self.engine = FilterEngine(self.data)
+        self.collections: Dict[str, Collection] = {}
+        # normalized query -> (result, names of the collections it read)
+        self.stats: Dict[str, tuple[Any, Set[str]]] = {}
+        # Only set inside shared_scans(): materialized collections and Stat scan cache
+        self.sources: Dict[str, List[Message]] | None = None
+        self.scan_cache: dict | None = None
+        self.lock = threading.RLock()
+        # Bumped by every invalidation, _epoch by those of every collection, _versions per collection name
+        self.generation = 0
+        self._epoch = 0
+        self._versions: Dict[str, int] = {}
+
+    # ─── Collections ─────────────────────────────────────────────────────
+
+    @staticmethod
+    def key(name: str) -> str:
+        """Name a collection is stored under: Stat queries are lowercased outside quotes (see Parser.tokenize), so are collection names"""
+        return name.lower()
+
+    def define(self, name: str, filters: Filter | FilterGroup | str | Iterable[int]) -> Collection:
+        """Create (or replace) a named collection from a filter tree, a filter expression or message indices"""
+        name = Session.key(name)
+        if name == DEFAULT_SOURCE or name.startswith('_') or not name:
+            raise SessionError(f"'{name}' is a reserved collection name")
+
+        expression = ""
+        if isinstance(filters, str):
+            expression = filters
+            filters = parse_filter(filters)
+        if isinstance(filters, (Filter, FilterGroup)):
+            collection = Collection(name, self.engine.get_matching_indices(filters), filters, expression)
+        else:
+            collection = Collection(name, filters)
+
+        with self.lock:
+            self.collections[name] = collection
+            self.invalidate(name)
+        return collection
+
+    def drop(self, name: str) -> Collection:
+        name = Session.key(name)
+        with self.lock:
+            if name not in self.collections:
+                raise SessionError(f"Unknown collection '{name}'")
+            self.invalidate(name)
+            return self.collections.pop(name)
+
+    def get(self, name: str) -> Collection | None:
+        return self.collections.get(Session.key(name))
+
+    def messages(self, name: str) -> List[Message]:
+        name = Session.key(name)
+        if name == DEFAULT_SOURCE:
+            return self.data
+        with self.lock:
+            if name not in self.collections:
+                raise SessionError(f"Unknown collection '{name}'")
+            if self.sources is None:
+                return self.collections[name].messages(self.data)
+            if name not in self.sources:
+                self.sources[name] = self.collections[name].messages(self.data)
+            return self.sources[name]
+
+    @contextmanager
+    def shared_scans(self):
+        """Within this block, collections are materialized once and splits/scans are shared between queries"""
+        with self.lock:
+            self.sources = {}
+            self.scan_cache = {}
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.sources = None
+                self.scan_cache = None
+
+    # ─── Stat queries ────────────────────────────────────────────────────
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(s.Parser.tokenize(query))
+
+    @staticmethod
+    def referenced_sources(node: s.ASTNode) -> Set[str]:
+        """Names of the environment entries read by a parsed query"""
+        names: Set[str] = set()
+        for mod in node.modifiers:
+            if mod.fn == s.MODIFIERS.CHANGE_SOURCE:
+                names.update(mod.args)
+        for child in node.children:
+            names |= Session.referenced_sources(child)
+        return names
+
+    def environment(self, names: Iterable[str] = ()) -> s.SourceEnvironment:
+        """Build a Stat environment holding the default source and the given collections"""
+        env: s.SourceEnvironment = {DEFAULT_SOURCE: self.data, "_index": self.engine.index}
+        with self.lock:
+            for name in names:
+                env[Session.key(name)] = self.messages(name)
+            if self.scan_cache is not None:
+                # Evaluation writes to its own copy, see merge_scans()
+                env["_cache"] = dict(self.scan_cache)
+        return env
+
+    def merge_scans(self, env: s.SourceEnvironment, generation: int):
+        """Keep the scans of an evaluation, unless the session was invalidated since its environment was built"""
+        with self.lock:
+            if self.scan_cache is not None and "_cache" in env and self.generation == generation:
+                self.scan_cache.update(env["_cache"])
+
+    def versions(self, names: Iterable[str]) -> tuple:
+        """Versions of the given collections, they change whenever one of them is redefined or dropped"""
+        with self.lock:
+            return (self._epoch, *(self._versions.get(Session.key(name), 0) for name in sorted(names)))
+
+    def query(self, query: str, use_cache: bool = True) -> Any:
+        """Parse and evaluate a natural language Stat query, reusing the cached result when possible"""
+        key = Session.normalize(query)
+        if use_cache:
+            with self.lock:
+                if key in self.stats:
+                    return self.stats[key][0]
+
+        node = s.Parser(query).parse()
+        if node is None:
+            raise s.ParseError(f"Could not parse '{query}'")
+        names = Session.referenced_sources(node)
+        with self.lock:
+            env = self.environment(names)
+            versions = self.versions(names)
+            generation = self.generation
+        result = node.eval(env)
+        self.merge_scans(env, generation)
+        with self.lock:
+            # A collection redefined meanwhile: the result is stale, don't cache it
+            if self.versions(names) == versions:
+                self.stats[key] = (result, names)
+        return result
+
+    def estimate(self, query: str, rate: float | None = None, budget: float | None = None, strata: str = "uniform",
+                 confidence: float = 0.95, seed: int | None = None):
+        """Approximate a query on a sample of the messages (see src.Approximate), results are never cached"""
+        from src.Approximate import estimate
+        node = s.Parser(query).parse()
+        if node is None:
+            raise s.ParseError(f"Could not parse '{query}'")
+        return estimate(node, self.environment(Session.referenced_sources(node)), rate=rate, budget=budget,
+                        strata=strata, confidence=confidence, seed=seed)
+
+    def invalidate(self, name: str | None = None):
+        """Forget the cached stat results depending on a collection (all of them if no name is given)"""
+        with self.lock:
+            self.generation += 1
+            if self.sources is not None:
+                if name is None:
+                    self.sources.clear()
+                else:
+                    self.sources.pop(Session.key(name), None)
+            if self.scan_cache is not None:
+                # Entries keep their source alive, drop them all rather than leaking the old collection
+                self.scan_cache.clear()
+            if name is None:
+                self._epoch += 1
+                self.stats.clear()
+                return
+            name = Session.key(name)
+            self._versions[name] = self._versions.get(name, 0) + 1
+            self.stats = {k: v for k, v in self.stats.items() if name not in v[1]}
+
+    def __iter__(self):
+        return iter(self.collections)
+
+    def __contains__(self, name: str):
+        name = Session.key(name)
+        return name == DEFAULT_SOURCE or name in self.collections
+
+    def __repr__(self):
+        return f"<Session over {len(self.data)} messages with {len(self.collections)} collections and {len(self.stats)} cached stats>"
+
+__all__ = ['Session', 'Collection', 'SessionError']
@@ -1,8 +1,20 @@
 from typing import Callable, List, Tuple, Any, TypedDict, Iterable, Pattern, Dict
 from src.MessageRepo import Message
+from src.Guild import GuildRepo
+from src.Attachments import extension_keys, host_keys
+from src.utils.TermMatcher import term_matcher
+from src.utils.Instrumentation import METRICS, PlanNode, cardinality
+import src.Progress as progress
 
 import re
+import time
 import random
+import calendar
+from array import array
+from collections.abc import Sequence
+from datetime import date
+from itertools import accumulate
+from functools import cache
 
 type Number = int | float
 type SourceObj = List[Message | List[Message]]
@@ -24,6 +36,9 @@ type CallableLayer02 = Callable[[Number, Number, str], Number]
 type CallableLayer3 = Callable[[Number], Number]
 type CallableLayer03 = Callable[[Number, str], Number]
 
+# Time series (Layer 1): Operates on a list of number and the messages they were computed on, returns groups
+type CallableTimeSeries = Callable[[List[Number], SourceObj, str], List[Number]]
+
 # Source alterers (Layer -1): Take a source obj and variadic arguments, return a new source obj
 type CallableAlterSource = Callable[[SourceObj, Iterable], SourceObj]
 
@@ -45,6 +60,47 @@ type CallableLayerAny   =\
 
 USER_MENTION_PATTERN = r"<@\d{17,20}>"
 
+class Groups(list):
+    """A list of groups (or of per-group numbers) remembering the label of each group"""
+    def __init__(self, groups: Iterable = (), labels: Iterable = ()):
+        super().__init__(groups)
+        self.labels: List[Any] = list(labels)
+
+    def to_dict(self):
+        return {str(label): value for label, value in zip(self.labels, self)}
+
+class Weighted(list):
+    """Per-message numbers computed on a sample, along with the weight (1 / inclusion probability) of each message"""
+    def __init__(self, values: Iterable = (), weights: Iterable[float] = ()):
+        super().__init__(values)
+        self.weights: List[float] = list(weights)
+
+class Selection(Sequence):
+    """The messages of a source at some positions, read in place instead of being copied into a new list"""
+    def __init__(self, data: List[Message], positions: Iterable[int]):
+        self.data = data
+        self.positions = array('I', positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.data[p] for p in self.positions[i]]
+        return self.data[self.positions[i]]
+
+    def __iter__(self):
+        return map(self.data.__getitem__, self.positions)
+
+def _weighted_aggregate(fn: CallableLayer1, values: Weighted) -> Number:
+    # Horvitz-Thompson estimates of the totals, the other aggregates don't depend on the scale
+    if fn is STATS.TOTAL:
+        return sum(w * x for w, x in zip(values.weights, values))
+    if fn is STATS.AVERAGE:
+        total_weight = sum(values.weights)
+        return sum(w * x for w, x in zip(values.weights, values)) / total_weight if total_weight else 0
+    return fn(values)
+
 def _split_period(data: List[Message], period: str, combine: bool = False):
     period_map = {
         'month': f'{'%Y-' if not combine else ''}%m',
@@ -55,17 +111,110 @@ def _split_period(data: List[Message], period: str, combine: bool = False):
         'minute': f'{'%Y-W%W-d%d-H%H-M' if not combine else ''}%M',
     }
 
+    if combine and period in HISTOGRAMS:
+        return _histogram(data, period)
+
     if period not in period_map:
         return [data]
 
     groups = {}
-    for message in data:
-        key = message.timestamp.strftime(period_map[period])
-        if key not in groups:
-            groups[key] = []
-        groups[key].append(message)
-        
-    return list(groups.values())
+    with METRICS.phase("stat.split_period"):
+        for message in data:
+            key = message.timestamp.strftime(period_map[period])
+            if key not in groups:
+                groups[key] = []
+            groups[key].append(message)
+        # Buckets are disjoint periods: any of their messages puts them in time order
+        keys = sorted(groups, key=lambda key: groups[key][0].timestamp)
+
+    return Groups((groups[key] for key in keys), keys)
+
+# period -> (bucket of a timestamp, labels of the buckets in order)
+HISTOGRAMS = {
+    'hour': (lambda ts: ts.hour, [f"{h:02}" for h in range(24)]),
+    'weekday': (lambda ts: ts.weekday(), list(calendar.day_name)),
+    'day': (lambda ts: ts.day - 1, [f"{d:02}" for d in range(1, 32)]),
+    'month': (lambda ts: ts.month - 1, list(calendar.month_name)[1:]),
+}
+
+def _histogram(data: List[Message], period: str):
+    """Split on a recurring period (hour of day, day of week...): every bucket is returned, in order, even empty ones"""
+    bucket, labels = HISTOGRAMS[period]
+    groups = [[] for _ in labels]
+    with METRICS.phase("stat.histogram"):
+        for message in data:
+            groups[bucket(message.timestamp)].append(message)
+    return Groups(groups, labels)
+
+# ─── Time series ─────────────────────────────────────────────────────────
+
+# unit -> (bucket index of a timestamp, start of a bucket as a label)
+TIME_UNITS = {
+    'minute': (lambda ts: (ts.toordinal() * 24 + ts.hour) * 60 + ts.minute,
+               lambda i: f"{date.fromordinal(i // 1440).isoformat()} {i // 60 % 24:02}:{i % 60:02}"),
+    'hour': (lambda ts: ts.toordinal() * 24 + ts.hour,
+             lambda i: f"{date.fromordinal(i // 24).isoformat()} {i % 24:02}:00"),
+    'day': (lambda ts: ts.toordinal(),
+            lambda i: date.fromordinal(i).isoformat()),
+    # Ordinal 1 is a Monday
+    'week': (lambda ts: (ts.toordinal() - 1) // 7,
+             lambda i: date.fromordinal(i * 7 + 1).isoformat()),
+    'month': (lambda ts: ts.year * 12 + ts.month - 1,
+              lambda i: f"{i // 12}-{i % 12 + 1:02}"),
+}
+WINDOW_PATTERN = re.compile(r"^(\d+)-?(minute|hour|day|week|month)s?$")
+
+def _parse_window(window: str) -> Tuple[int, str]:
+    """'7-day' -> (7, 'day')"""
+    match = WINDOW_PATTERN.match(window)
+    if match is None or int(match[1]) < 1:
+        raise ValueError(f"Invalid window '{window}' (expected N-minute, N-hour, N-day, N-week or N-month)")
+    return int(match[1]), match[2]
+
+def _bucket_totals(values: List[Number], source: SourceObj, unit: str) -> Tuple[List[float], int]:
+    """Sum per-message values into consecutive time buckets in a single pass, returns (totals, index of the first bucket)"""
+    if isinstance(source, Groups) or len(values) != len(source):
+        raise ValueError("Time series apply to per message statistics, they can't follow a 'per' split")
+    bucket = TIME_UNITS[unit][0]
+    weights = values.weights if isinstance(values, Weighted) else None
+    with METRICS.phase("stat.time_buckets"):
+        indices = [bucket(m.timestamp) for m in source]
+        if not indices:
+            return [], 0
+        first = min(indices)
+        totals = [0.0] * (max(indices) - first + 1)
+        if weights is None:
+            for i, x in zip(indices, values):
+                totals[i - first] += x
+        else:
+            for i, x, w in zip(indices, values, weights):
+                totals[i - first] += w * x
+    return totals, first
+
+def _rolling(values: List[Number], source: SourceObj, window: str, average: bool):
+    """Total (or average per bucket) over the last N buckets, for every bucket between the first and last message"""
+    size, unit = _parse_window(window)
+    totals, first = _bucket_totals(values, source, unit)
+    # prefix[i] = sum of the first i buckets: each window is one subtraction
+    prefix = [0.0, *accumulate(totals)]
+    label = TIME_UNITS[unit][1]
+    result = []
+    for i in range(len(totals)):
+        start = max(0, i + 1 - size)
+        window_total = prefix[i + 1] - prefix[start]
+        result.append(window_total / (i + 1 - start) if average else window_total)
+    return Groups(result, [label(first + i) for i in range(len(totals))])
+
+def _cumulative(values: List[Number], source: SourceObj):
+    """Running total: per day for per message statistics, across the groups (in the order of the split) after a split
+
+    Period splits and histograms emit their groups in time order, so do sessions within a channel.
+    """
+    if isinstance(values, Groups):
+        return Groups(accumulate(values), values.labels)
+    totals, first = _bucket_totals(values, source, 'day')
+    label = TIME_UNITS['day'][1]
+    return Groups(accumulate(totals), [label(first + i) for i in range(len(totals))])
 
 def _split_by_attr(data: List[Message], *args):
     attr_path = args
@@ -88,20 +237,249 @@ def _split_by_attr(data: List[Message], *args):
             split_dict[curr_attr] = [message]
         else:
             split_dict[curr_attr].append(message)
-    return list(split_dict.values())
+    return Groups(split_dict.values(), split_dict.keys())
+
+def _split_guilds(data: List[Message]):
+    # Group on the integer guild id, names are only looked up once per group
+    split_dict = {}
+    for message in data:
+        key = message.channel.guild_key
+        if not key:
+            continue
+        if key not in split_dict:
+            split_dict[key] = [message]
+        else:
+            split_dict[key].append(message)
+    guilds = GuildRepo.default()
+    return Groups(split_dict.values(), [guilds.label(key) for key in split_dict])
+
+def _split_accounts(data: List[Message]):
+    # Accounts of the packages loaded together (see src.Federation), labelled by username
+    from src.Federation import account_label
+    split_dict = {}
+    for message in data:
+        key = message.channel.account
+        if key not in split_dict:
+            split_dict[key] = [message]
+        else:
+            split_dict[key].append(message)
+    return Groups(split_dict.values(), [account_label(key) for key in split_dict])
+
+# ─── Sessions ────────────────────────────────────────────────────────────
+
+# Inactivity gap ending a session when the query doesn't give one
+SESSION_GAP = "30-minute"
+GAP_SECONDS = {'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800}
+
+def _parse_gap(gap: str) -> float:
+    """'30-minute' -> 1800"""
+    size, unit = _parse_window(gap)
+    if unit not in GAP_SECONDS:
+        raise ValueError(f"Invalid session gap '{gap}' (expected N-minute, N-hour, N-day or N-week)")
+    return size * GAP_SECONDS[unit]
+
+def _is_grouped(source: SourceObj) -> bool:
+    return isinstance(source, Groups) or (len(source) > 0 and isinstance(source[0], list))
+
+def _timelines(data: List[Message]) -> List[Tuple[List[Message], List[float]]]:
+    """Messages of each channel in time order, with their timestamps (seconds)"""
+    timelines = []
+    with METRICS.phase("stat.timelines"):
+        channels: Dict[int, List[Message]] = {}
+        for message in data:
+            messages = channels.get(message.channel.key)
+            if messages is None:
+                channels[message.channel.key] = [message]
+            else:
+                messages.append(message)
+        for messages in channels.values():
+            times = [m.timestamp.timestamp() for m in messages]
+            # Exports list a channel newest first: reversed in place, only an unordered source needs a sort
+            if times[0] > times[-1]:
+                messages.reverse()
+                times.reverse()
+            if any(a > b for a, b in zip(times, times[1:])):
+                order = sorted(range(len(times)), key=times.__getitem__)
+                messages = [messages[i] for i in order]
+                times = [times[i] for i in order]
+            timelines.append((messages, times))
+    return timelines
+
+def _session_starts(times: List[float], limit: float) -> List[int]:
+    """Positions starting a session in a timeline, followed by its length: a single pass over consecutive timestamps"""
+    return [0, *(i for i in range(1, len(times)) if times[i] - times[i - 1] > limit), len(times)]
+
+def _sessions(data: List[Message], gap: str = SESSION_GAP) -> List[List[Message]]:
+    """Sessions of the messages (messages of a channel with no inactivity gap longer than gap, in time order), ordered by start"""
+    limit = _parse_gap(gap)
+    sessions = []
+    for messages, times in _timelines(data):
+        starts = _session_starts(times, limit)
+        sessions.extend((times[a], messages[a:b]) for a, b in zip(starts, starts[1:]))
+    sessions.sort(key=lambda session: session[0])
+    return [messages for _, messages in sessions]
+
+def _split_sessions(data: List[Message], gap: str = SESSION_GAP):
+    sessions = _sessions(data, gap)
+    return Groups(sessions, [f"{session[0].channel.name or session[0].channel.id} {session[0].timestamp.isoformat(' ', 'minutes')}" for session in sessions])
+
+def _session_counts(source: SourceObj, gap: str = SESSION_GAP) -> List[int]:
+    """1 per session (the number of sessions of each group after a split)"""
+    if _is_grouped(source):
+        return [sum(_session_counts(group, gap)) for group in source]
+    limit = _parse_gap(gap)
+    return [1] * sum(len(_session_starts(times, limit)) - 1 for _, times in _timelines(source))
+
+def _session_lengths(source: SourceObj, gap: str = SESSION_GAP) -> List[float]:
+    """Minutes between the first and last message of each session (summed per group after a split)"""
+    if _is_grouped(source):
+        return [sum(_session_lengths(group, gap)) for group in source]
+    limit = _parse_gap(gap)
+    lengths = []
+    for _, times in _timelines(source):
+        starts = _session_starts(times, limit)
+        lengths.extend((times[b - 1] - times[a]) / 60 for a, b in zip(starts, starts[1:]))
+    return lengths
+
+def _response_latencies(source: SourceObj, gap: str = SESSION_GAP) -> List[float]:
+    """Seconds between each message and the previous one of its session (averaged per group after a split)"""
+    if _is_grouped(source):
+        latencies = [_response_latencies(group, gap) for group in source]
+        return [sum(group) / len(group) if group else 0 for group in latencies]
+    limit = _parse_gap(gap)
+    # Gaps within the limit are exactly the gaps inside sessions
+    return [delay for _, times in _timelines(source) for delay in (b - a for a, b in zip(times, times[1:])) if delay <= limit]
+
+def _count_characters(messages: SourceObj, chars: str) -> List[int]:
+    # Every character counted in a single pass over each message, case insensitively
+    matcher = term_matcher(tuple(chars), True)
+    counts = []
+    for m in messages:
+        if isinstance(m, Message):
+            counts.append(matcher.count(m.content))
+        else:
+            counts.append(sum(_count_characters(m, chars)))
+    return counts
+
+def _top_terms(source: SourceObj, kind: str, k: str) -> List[Tuple[str, int]] | List[List[Tuple[str, int]]]:
+    """The k most frequent terms of the source and their counts (per group after a split), see src.TopTerms"""
+    from src.TopTerms import top_terms
+    if not k.isdigit() or int(k) < 1:
+        raise ValueError(f"Invalid number of terms '{k}'")
+    if _is_grouped(source):
+        return [_top_terms(group, kind, k) for group in source]
+    with METRICS.phase("stat.top_terms"):
+        return top_terms((m.content for m in source), kind, int(k))
+
+# ─── Near duplicates ─────────────────────────────────────────────────────
+
+def _preview(content: str, width: int = 40) -> str:
+    text = " ".join(content.split())
+    return text if len(text) <= width else text[:width - 1] + "…"
+
+def _split_near_duplicates(env: SourceEnvironment, threshold: str | None = None):
+    """Clusters of near duplicate messages (see src.NearDuplicates), labelled by their first message, messages without duplicates are left out"""
+    from src.NearDuplicates import NearDuplicateIndex, DEFAULT_THRESHOLD
+    source = env.get("_use_source", env.get("default", []))
+    if _is_grouped(source):
+        raise ValueError("Near duplicates are found among messages, not among groups")
+    index = env.get("_index")
+    with METRICS.phase("stat.split_near_duplicates"):
+        # The signatures of the indexed messages are reused, other sources are signed here
+        if index is not None and source is index.data:
+            near = index.near_duplicates
+        elif index is not None and isinstance(source, Selection) and source.data is index.data:
+            near = NearDuplicateIndex(source, index.near_duplicates.table.subset(source.positions))
+        else:
+            near = NearDuplicateIndex(source)
+        clusters = [[source[i] for i in cluster] for cluster in near.clusters(threshold or DEFAULT_THRESHOLD)]
+    labels = []
+    seen = set()
+    for cluster in clusters:
+        label = _preview(cluster[0].content)
+        # Clusters starting alike but too different to be merged keep distinct labels
+        if label in seen:
+            label = f"{label} ({cluster[0].id})"
+        seen.add(label)
+        labels.append(label)
+    return Groups(clusters, labels)
+
+def _count_attachments(messages: SourceObj, column: str, keys) -> List[int]:
+    # Keys are resolved once per query, most messages have no attachment rows and are skipped
+    counts = []
+    for m in messages:
+        if isinstance(m, Message):
+            rows = m.attachment_rows
+            counts.append(m.attachment_table.count_in(rows, column, keys) if rows else 0)
+        else:
+            counts.append(sum(_count_attachments(m, column, keys)))
+    return counts
+
+class Clause:
+    """A filter clause of a query ("after 2023-01-01", "in dms"...), naming the Filter it compiles to
+
+    Calling it with the captured arguments gives the hashable form of the clause. Every clause following
+    a node is attached to it as a single FILTER modifier: the clauses are AND-ed together.
+    args are fixed arguments of the filter, passed before the captured ones ("with images").
+    """
+    def __init__(self, filter_name: str, negate: bool = False, transform: Callable[[str], str] | None = None, args: tuple = ()):
+        self.filter_name = filter_name
+        self.negate = negate
+        self.transform = transform
+        self.args = args
+
+    def __call__(self, *args: str) -> tuple:
+        if self.transform is not None:
+            args = tuple(map(self.transform, args))
+        return ("~" if self.negate else "") + self.filter_name, *self.args, *args
+
+    def __repr__(self):
+        return f"<Clause {'~' if self.negate else ''}{self.filter_name}>"
+
+def _compile_clauses(clauses: Iterable[tuple]):
+    """Filter tree of FILTER modifier arguments"""
+    from src.Filter import Filter, FILTERS
+    tree = Filter(FILTERS.AlwaysTrue)
+    for name, *args in clauses:
+        f = Filter(FILTERS.__dict__[name.lstrip("~")], *args)
+        tree = tree & (~f if name.startswith("~") else f)
+    return tree
+
+def _filter_source(env: SourceEnvironment, clauses: Iterable[tuple]) -> Selection:
+    # The default source is indexed (env["_index"]): its clauses go through the planner, other sources are scanned.
+    # Either way the result is a view over the source, the stat then reads the matching messages in place
+    source = env.get("_use_source", env.get("default", []))
+    if isinstance(source, Groups):
+        raise ValueError("Filter clauses apply to messages, not to groups")
+    tree = _compile_clauses(clauses)
+    index = env.get("_index")
+    if index is not None and index.data is source:
+        from src.Planner import Planner
+        positions = Planner(index).plan(tree).execute()
+    else:
+        positions = tree.compute_matches(source)
+    return Selection(source, sorted(positions))
 
 class MODIFIERS:
     # Source modifiers
     # Receives SourceEnvironment, returns SourceObj (List[Message] or List[List[Message]])
     CHANGE_SOURCE: CallableAlterSource = lambda env, *args: env.get(args[0], [])
+    FILTER: CallableAlterSource = lambda env, *clauses: _filter_source(env, clauses)
     SPLIT_MONTHLY: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "month")
     SPLIT_YEARLY: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "year")
     SPLIT_WEEKLY: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "week")
     SPLIT_DAILY: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "day")
     SPLIT_HOURLY: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "hour")
     SPLIT_MINUTELY: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "minute")
-    SPLIT_GUILDS: CallableAlterSource = lambda env, *args: _split_by_attr(env.get("default", []), "channel", "guild_id")
-    SPLIT_CHANNELS: CallableAlterSource = lambda env, *args: _split_by_attr(env.get("default", []), "channel", "id")
+    SPLIT_GUILDS: CallableAlterSource = lambda env, *args: _split_guilds(env.get("_use_source", env.get("default", [])))
+    SPLIT_CHANNELS: CallableAlterSource = lambda env, *args: _split_by_attr(env.get("_use_source", env.get("default", [])), "channel", "id")
+    SPLIT_ACCOUNTS: CallableAlterSource = lambda env, *args: _split_accounts(env.get("_use_source", env.get("default", [])))
+    SPLIT_SESSIONS: CallableAlterSource = lambda env, *args: _split_sessions(env.get("_use_source", env.get("default", [])), *args)
+    SPLIT_NEAR_DUPLICATES: CallableAlterSource = lambda env, *args: _split_near_duplicates(env, *args)
+    HOUR_OF_DAY: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "hour", combine=True)
+    DAY_OF_WEEK: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "weekday", combine=True)
+    DAY_OF_MONTH: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "day", combine=True)
+    MONTH_OF_YEAR: CallableAlterSource = lambda env, *args: _split_period(env.get("_use_source", env.get("default", [])), "month", combine=True)
 
 
 class STATS:
@@ -111,23 +489,51 @@ class STATS:
     MESSAGE_COUNT: CallableLayer0 = lambda messages: [1 if isinstance(m, Message) else sum(STATS.MESSAGE_COUNT(m)) for m in messages]
 
     COUNT_WORDS: CallableLayer0 = lambda messages: [len(m.content.split()) if isinstance(m, Message) else sum(STATS.COUNT_WORDS(m)) for m in messages]
-    COUNT_ATTACHMENT: CallableLayer0 = lambda messages: [len(m.attachments.split()) if isinstance(m, Message) else sum(STATS.COUNT_ATTACHMENT(m)) for m in messages]
+    COUNT_ATTACHMENT: CallableLayer0 = lambda messages: [len(m.attachment_rows) if isinstance(m, Message) else sum(STATS.COUNT_ATTACHMENT(m)) for m in messages]
+    # Attachments of a media type (image, video...) or extension, attachments from a host
+    COUNT_ATTACHMENT_TYPE: CallableLayer00 = lambda messages, kind: _count_attachments(messages, "extensions", extension_keys(kind))
+    COUNT_ATTACHMENT_HOST: CallableLayer00 = lambda messages, host: _count_attachments(messages, "hosts", host_keys(host))
+    COUNT_IMAGES: CallableLayer0 = lambda messages: STATS.COUNT_ATTACHMENT_TYPE(messages, "image")
+    COUNT_VIDEOS: CallableLayer0 = lambda messages: STATS.COUNT_ATTACHMENT_TYPE(messages, "video")
     COUNT_MENTIONS: CallableLayer0 = lambda messages: [len(re.findall(USER_MENTION_PATTERN, m.content)) if isinstance(m, Message) else sum(STATS.COUNT_MENTIONS(m)) for m in messages]
 
-    COUNT_CHARACTERS: CallableLayer00 = lambda messages, chars: [sum(m.content.lower().count(c) if isinstance(m, Message) else sum(STATS.COUNT_CHARACTERS(sub_msg, chars) for sub_msg in m) for c in chars) for m in messages]
+    COUNT_CHARACTERS: CallableLayer00 = lambda messages, chars: _count_characters(messages, chars)
+
+    # Per session (an optional gap, SESSION_GAP by default), not per message: they read the whole source at once
+    COUNT_SESSIONS: CallableLayer00 = lambda messages, *gap: _session_counts(messages, *gap)
+    SESSION_LENGTH: CallableLayer00 = lambda messages, *gap: _session_lengths(messages, *gap)
+    RESPONSE_LATENCY: CallableLayer00 = lambda messages, *gap: _response_latencies(messages, *gap)
+
+    # Rankings: the (term, count) pairs of the k most frequent terms, not a number per message
+    TOP_WORDS: CallableLayer00 = lambda messages, k: _top_terms(messages, "words", k)
+    TOP_EMOJIS: CallableLayer00 = lambda messages, k: _top_terms(messages, "emojis", k)
+    TOP_MENTIONS: CallableLayer00 = lambda messages, k: _top_terms(messages, "mentions", k)
+    TOP_BIGRAMS: CallableLayer00 = lambda messages, k: _top_terms(messages, "bigrams", k)
+    TOP_TRIGRAMS: CallableLayer00 = lambda messages, k: _top_terms(messages, "trigrams", k)
 
     # Operates on List[Number] or List[List[Number]]
     AVERAGE: CallableLayer1 = lambda array: sum(array) / len(array) if len(array) > 0 else 0
     TOTAL: CallableLayer1 = lambda array: sum(array)
 
+    # Time series: also receive the source the values were computed on, return Groups labelled by period
+    ROLLING_AVERAGE: CallableTimeSeries = lambda array, source, window: _rolling(array, source, window, average=True)
+    ROLLING_TOTAL: CallableTimeSeries = lambda array, source, window: _rolling(array, source, window, average=False)
+    CUMULATIVE: CallableTimeSeries = lambda array, source: _cumulative(array, source)
+
     # Operates on Numbers
     RATIO: CallableLayer2 = lambda l, r: l / r if r != 0 else 0
 
     # Operates on Number
     AS_PERCENTAGE: CallableLayer3 = lambda n: n * 100
 
+TIME_SERIES = {STATS.ROLLING_AVERAGE, STATS.ROLLING_TOTAL, STATS.CUMULATIVE}
+# Layer 0 statistics giving (term, count) pairs instead of numbers: final results, no layer above accepts them
+RANKINGS = {STATS.TOP_WORDS, STATS.TOP_EMOJIS, STATS.TOP_MENTIONS, STATS.TOP_BIGRAMS, STATS.TOP_TRIGRAMS}
+# Layer 0 statistics over the whole source (sessions, rankings): never computed block by block or on samples
+WHOLE_SOURCE = {STATS.COUNT_SESSIONS, STATS.SESSION_LENGTH, STATS.RESPONSE_LATENCY, *RANKINGS}
+
 """
-    This variable defines how the language parser should behave:
+    This grammar defines how the language parser should behave:
         what composition translates to what logic
     
     The structure is the following:
@@ -151,55 +557,129 @@ class STATS:
         # : this references a variable places in the environment, similar to '?' but passes the corresponding key in the env
         {N}: Defines that at this spot should reside a COMPOSABLE of the layer N
 """
-Human = {
-    "layer-1": {
-        # Commands in each groups are mutually exclusives:
-        # Only one command per group allowed
-        # Groups with the lowest index have precedence over groups with higher indexes:
-        # group0 is treated BEFORE group1 even if group1 is mentionned before group0
-        "group0": {
-            "in #": MODIFIERS.CHANGE_SOURCE
+@cache
+def grammar() -> dict:
+    """The Human grammar, built on the first parse"""
+    return {
+        "layer-1": {
+            # Commands in each groups are mutually exclusives:
+            # Only one command per group allowed
+            # Groups with the lowest index have precedence over groups with higher indexes:
+            # group0 is treated BEFORE group1 even if group1 is mentionned before group0
+            "group0": {
+                "in #": MODIFIERS.CHANGE_SOURCE
+            },
+            # Filter clauses: any number of them, combined into one FILTER modifier
+            # Quoted arguments keep their case, text is matched case insensitively
+            "group1": {
+                "in dms": Clause("IsDM"),
+                "in group dms": Clause("IsGroupDM"),
+                "in guilds": Clause("IsGuild"),
+                "in servers": Clause("IsGuild"),
+                "in guild ?": Clause("InGuild"),
+                "in server ?": Clause("InGuild"),
+                "after ?": Clause("SentAfter"),
+                "before ?": Clause("SentBefore"),
+                "between ? and ?": Clause("SentBetween"),
+                "containing ?": Clause("MessageContainsIgnoreCase"),
+                "not containing ?": Clause("MessageContainsIgnoreCase", negate=True),
+                "matching ?": Clause("MessageRegex", transform=lambda pattern: "(?i)" + pattern),
+                "mentioning ?": Clause("MentionsUser"),
+                "with attachments of type ?": Clause("HasAttachmentType"),
+                "with attachments from ?": Clause("HasAttachmentFrom"),
+                "with images": Clause("HasAttachmentType", args=("image",)),
+                "with videos": Clause("HasAttachmentType", args=("video",)),
+                "with attachments": Clause("HasAttachments"),
+                "without attachments": Clause("HasAttachments", negate=True),
+                "with links": Clause("ContainsUrl"),
+                "without links": Clause("ContainsUrl", negate=True),
+                "with mentions": Clause("HasUserMention"),
+                "with user ?": Clause("ChannelRecipients"),
+                "from account ?": Clause("InAccount"),
+                # A message id or a quoted text
+                "near duplicates of ?": Clause("IsNearDuplicateOf")
+            },
+            "group2": {
+                # Recurring periods, before "per _" which would stop at "per hour"
+                "per hour of day": MODIFIERS.HOUR_OF_DAY,
+                "per day of week": MODIFIERS.DAY_OF_WEEK,
+                "per day of month": MODIFIERS.DAY_OF_MONTH,
+                "per month of year": MODIFIERS.MONTH_OF_YEAR,
+                # Sessions ending after an inactivity gap: "per session", "per 2-hour session"
+                "per ? session": MODIFIERS.SPLIT_SESSIONS,
+                # Clusters of near duplicates (copypasta): "per near duplicate", "per 0.9 near duplicate"
+                "per near duplicate": MODIFIERS.SPLIT_NEAR_DUPLICATES,
+                "per ? near duplicate": MODIFIERS.SPLIT_NEAR_DUPLICATES,
+                "per _": {
+                    "year": MODIFIERS.SPLIT_YEARLY,
+                    "month": MODIFIERS.SPLIT_MONTHLY,
+                    "week": MODIFIERS.SPLIT_WEEKLY,
+                    "day": MODIFIERS.SPLIT_DAILY,
+                    "hour": MODIFIERS.SPLIT_HOURLY,
+                    "minute": MODIFIERS.SPLIT_MINUTELY,
+                    "guild": MODIFIERS.SPLIT_GUILDS,
+                    "channel": MODIFIERS.SPLIT_CHANNELS,
+                    "account": MODIFIERS.SPLIT_ACCOUNTS,
+                    "session": MODIFIERS.SPLIT_SESSIONS,
+                    "copypasta": MODIFIERS.SPLIT_NEAR_DUPLICATES
+                },
+            }
         },
-        "group1": {
-            "per _": {
-                "year": MODIFIERS.SPLIT_YEARLY,
-                "month": MODIFIERS.SPLIT_MONTHLY,
-                "week": MODIFIERS.SPLIT_WEEKLY,
-                "day": MODIFIERS.SPLIT_DAILY,
-                "hour": MODIFIERS.SPLIT_HOURLY,
-                "minute": MODIFIERS.SPLIT_MINUTELY,
-                "guild": MODIFIERS.SPLIT_GUILDS,
-                "channel": MODIFIERS.SPLIT_CHANNELS
+        # Each layer treats on a different data set.
+        # Each layer can convert the previous' layer result into the next layer format
+        # Layers with lower indexes are treated first
+        # LayerN cannot be called if layerN-1 is not called (except layer0)
+        "layer0": {
+            "number of ? sessions": STATS.COUNT_SESSIONS,
+            "number of _": {
+                "words": STATS.COUNT_WORDS,
+                "messages": STATS.MESSAGE_COUNT,
+                # Longer patterns first, "attachments" alone would stop before "of type"
+                "attachments of type ?": STATS.COUNT_ATTACHMENT_TYPE,
+                "attachments from ?": STATS.COUNT_ATTACHMENT_HOST,
+                "attachments": STATS.COUNT_ATTACHMENT,
+                "images": STATS.COUNT_IMAGES,
+                "videos": STATS.COUNT_VIDEOS,
+                "mentions": STATS.COUNT_MENTIONS,
+                "sessions": STATS.COUNT_SESSIONS,
+                "characters ?": STATS.COUNT_CHARACTERS
             },
-        }
-    },
-    # Each layer treats on a different data set.
-    # Each layer can convert the previous' layer result into the next layer format
-    # Layers with lower indexes are treated first
-    # LayerN cannot be called if layerN-1 is not called (except layer0)
-    "layer0": {
-        "number of _": {
-            "words": STATS.COUNT_WORDS,
-            "messages": STATS.MESSAGE_COUNT,
-            "attachments": STATS.COUNT_ATTACHMENT,
-            "mentions": STATS.COUNT_MENTIONS,
-            "characters ?": STATS.COUNT_CHARACTERS
+            # Session statistics: minutes per session, seconds between the messages of a session
+            "length of ? sessions": STATS.SESSION_LENGTH,
+            "length of _": {
+                "messages": STATS.MESSAGE_LENGTH,
+                "sessions": STATS.SESSION_LENGTH
+            },
+            "response latency in ? sessions": STATS.RESPONSE_LATENCY,
+            "response latency": STATS.RESPONSE_LATENCY,
+            # Most frequent terms: "top 20 words per year"
+            "top ? words": STATS.TOP_WORDS,
+            "top ? emojis": STATS.TOP_EMOJIS,
+            "top ? mentions": STATS.TOP_MENTIONS,
+            "top ? bigrams": STATS.TOP_BIGRAMS,
+            "top ? trigrams": STATS.TOP_TRIGRAMS
+        },
+        "layer1": {
+            "average {0}": STATS.AVERAGE,
+            "total {0}": STATS.TOTAL,
+            "? rolling average of {0}": STATS.ROLLING_AVERAGE,
+            "? rolling total of {0}": STATS.ROLLING_TOTAL,
+            "cumulative {0}": STATS.CUMULATIVE
         },
-        "length of _": {
-            "messages": STATS.MESSAGE_LENGTH
+        "layer2": {
+            "ratio of the {1} over the {1}": STATS.RATIO
+        },
+        "layer3": {
+            "{2} as percentage": STATS.AS_PERCENTAGE
         }
-    },
-    "layer1": {
-        "average {0}": STATS.AVERAGE,
-        "total {0}": STATS.TOTAL
-    },
-    "layer2": {
-        "ratio of the {1} over the {1}": STATS.RATIO
-    },
-    "layer3": {
-        "{2} as percentage": STATS.AS_PERCENTAGE
     }
-}
+
+def __getattr__(name: str):
+    # Human is built on first access (see grammar())
+    if name == "Human":
+        return grammar()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class ASTNode:
     """Represents a node in the parsed AST"""
@@ -216,25 +696,114 @@ class ASTNode:
         args_repr = f", args={self.args}" if self.args else ""
         return f"ASTNode(layer={self.layer}{args_repr}{child_repr}{mod_repr})"
 
+    @staticmethod
+    def _cached(cache: dict | None, key: tuple, source: Any, compute: Callable[[], Any]) -> Any:
+        """Memoize compute() in the environment cache, entries are only valid for the exact same source object"""
+        if cache is None:
+            return compute()
+        hit = cache.get(key)
+        if hit is not None and hit[0] is source:
+            METRICS.count("stat.cache_hits")
+            return hit[1]
+        result = compute()
+        cache[key] = (source, result)
+        return result
+
+    @property
+    def name(self) -> str:
+        for namespace in (STATS, MODIFIERS):
+            for k, v in namespace.__dict__.items():
+                if v is self.fn:
+                    return k
+        return "unknown"
+
+    def explain_analyze(self, env: SourceEnvironment) -> PlanNode:
+        """Evaluate the node and report the time and output cardinality of each node and modifier"""
+        trace: List[PlanNode] = []
+        self.eval({**env, "_trace": trace})
+        return trace[0]
+
     def eval(self, env: SourceEnvironment) -> Number | List[Number]:
-        """Evaluate this node against the environment"""
-        # Apply modifiers first (layer -1)
-        current_source = env.get("default", [])
+        """Evaluate this node against the environment
+
+        When the environment holds a "_cache" dict, source modifiers and layer 0 scans are memoized in it,
+        so that queries sharing the same source and splits only scan the messages once.
+        When it holds a "_trace" list, a PlanNode recording the time spent in this node is appended to it.
+        When it holds a "_weights" dict (id of a message -> weight), the sources are samples and the
+        aggregates are weighted estimates (see src.Approximate).
+        When it holds an "_index" (MessageIndex of the default source), filter clauses on the default
+        source are planned against it instead of scanning every message.
+        """
+        trace = env.get("_trace")
+        if trace is None:
+            return self._eval(env)
+
+        plan = PlanNode(f"{self.name}{self.args if self.args else ''} (layer {self.layer})")
+        trace.append(plan)
+        start = time.perf_counter()
+        result = self._eval({**env, "_trace": plan.children})
+        plan.seconds = time.perf_counter() - start
+        plan.rows = cardinality(result)
+        if plan.rows == 1 and not isinstance(result, (list, dict)):
+            plan.label += f" = {result}"
+        return result
+
+    def _apply_modifiers(self, env: SourceEnvironment) -> Tuple[SourceEnvironment, tuple]:
+        """Apply the layer -1 modifiers, returns the environment using the modified source and the cache key of that source"""
+        cache = env.get("_cache")
+        trace = env.get("_trace")
+        current_source = env.get("_use_source", env.get("default", []))
+        source_key = (id(current_source),)
         for mod in self.modifiers:
-            current_source = mod.fn(env, *mod.args)
+            source_key = (*source_key, mod.fn, mod.args)
+            start = time.perf_counter()
+            current_source = ASTNode._cached(cache, source_key, env.get(mod.args[0]) if mod.fn == MODIFIERS.CHANGE_SOURCE else current_source, lambda: mod.fn(env, *mod.args))
+            if trace is not None:
+                trace.append(PlanNode(f"{mod.name}{mod.args if mod.args else ''} (modifier)", time.perf_counter() - start, cardinality(current_source)))
             env = {**env, "_use_source": current_source}
+        return env, source_key
+
+    def _scan(self, source: SourceObj) -> List[Number]:
+        """Layer 0 scan, in blocks reported to the progress sink when one listens (see src.Progress)"""
+        if self.fn in WHOLE_SOURCE or not progress.sink().enabled or len(source) <= progress.BLOCK:
+            return self.fn(source, *self.args)
+        result = []
+        with progress.task(f"stat {self.name}", len(source), "groups" if isinstance(source, Groups) else "messages") as task:
+            for block in task.ranges(len(source)):
+                result.extend(self.fn(source[block.start:block.stop], *self.args))
+        return result
+
+    def _eval(self, env: SourceEnvironment) -> Number | List[Number]:
+        cache = env.get("_cache")
+        # Apply modifiers first (layer -1)
+        env, source_key = self._apply_modifiers(env)
 
         # Evaluate based on layer
         if self.layer == 0:
             # Layer 0: source -> List[Number]
             source = env.get("_use_source", env.get("default", []))
-            if self.args:
-                return self.fn(source, *self.args)
-            return self.fn(source)
+            weights = env.get("_weights")
+            if weights is not None:
+                if self.fn in WHOLE_SOURCE:
+                    raise ValueError(f"{self.name} reads its whole source, it can't be estimated on a sample")
+                # Sampled messages stand for `weight` messages each: groups get estimated totals
+                if isinstance(source, Groups):
+                    return Groups([sum(weights[id(m)] * x for m, x in zip(group, self.fn(group, *self.args))) for group in source], source.labels)
+                return Weighted(self.fn(source, *self.args), [weights[id(m)] for m in source])
+            result = ASTNode._cached(cache, (*source_key, self.fn, self.args), source, lambda: self._scan(source))
+            if isinstance(source, Groups):
+                return Groups(result, source.labels)
+            return result
 
         elif self.layer == 1:
             # Layer 1: List[Number] -> Number
             child_result = self.children[0].eval(env)
+            if self.fn in TIME_SERIES:
+                # Time series need the timestamps of the messages the child read
+                child_env, _ = self.children[0]._apply_modifiers({k: v for k, v in env.items() if k != "_trace"})
+                return self.fn(child_result, child_env.get("_use_source", child_env.get("default", [])), *self.args)
+            if isinstance(child_result, Weighted):
+                return _weighted_aggregate(self.fn, child_result)
             return self.fn(child_result)
 
         elif self.layer == 2:
@@ -266,7 +835,10 @@ class Parser:
 
     @staticmethod
     def tokenize(nl_str: str) -> List[str]:
-        """Tokenize input string, handling quoted strings"""
+        """Tokenize input string, handling quoted strings
+
+        Words are lowercased, quoted text keeps its case: a regex like "\\D+" must not become "\\d+".
+        """
         tokens: List[str] = []
         current: str = ""
         in_quotes: bool = False
@@ -279,7 +851,7 @@ class Parser:
                     tokens.append(current)
                     current = ""
             else:
-                current += char
+                current += char if in_quotes else char.lower()
 
         if current:
             tokens.append(current)
@@ -287,9 +859,11 @@ class Parser:
         return tokens
 
     def __init__(self, nl_str: str, context: dict = None):
-        self.tokens: List[str] = Parser.tokenize(nl_str.lower())
+        self.tokens: List[str] = Parser.tokenize(nl_str)
         self.pos = 0
-        self.context = context if context is not None else Human
+        self.context = context if context is not None else grammar()
+        # End of the longest match parse_layer() rejected for leaving tokens unused
+        self._furthest = 0
 
     # ─── Token Navigation ────────────────────────────────────────────────
 
@@ -382,21 +956,36 @@ class Parser:
     # ─── Layer Parsing ───────────────────────────────────────────────────
 
     def parse(self) -> ASTNode | None:
-        """Main entry point: parse from highest layer down"""
+        """Main entry point: parse from highest layer down
+
+        Only a parse using every token is accepted, words left over (a misspelled clause, an unquoted
+        argument of several words) raise a ParseError instead of being ignored.
+        """
         self.skip_filler()
+        start_pos = self.save_pos()
+        furthest = start_pos
 
         # Try layers from highest (3) to lowest (0)
         for layer in [3, 2, 1, 0]:
-            node = self.parse_layer(layer)
+            self.restore_pos(start_pos)
+            node = self.parse_layer(layer, whole=True)
             if node is not None:
                 return node
+            furthest = max(furthest, self._furthest)
 
+        if furthest > start_pos:
+            raise ParseError(f"Unexpected '{' '.join(self.tokens[furthest:])}'")
         return None
 
-    def parse_layer(self, layer: int) -> ASTNode | None:
-        """Parse a specific layer"""
+    def parse_layer(self, layer: int, whole: bool = False) -> ASTNode | None:
+        """Parse a specific layer
+
+        With whole, a match is only accepted if it uses every token, self._furthest holds the end of
+        the longest match rejected.
+        """
         layer_key = f"layer{layer}"
         layer_def = self.context.get(layer_key, {})
+        self._furthest = furthest = self.pos
 
         if not layer_def:
             return None
@@ -417,9 +1006,16 @@ class Parser:
             if result is not None:
                 # Try to attach layer-1 modifiers
                 result = self.attach_modifiers(result)
+                if whole:
+                    self.skip_filler()
+                    if self.peek() is not None:
+                        furthest = max(furthest, self.pos)
+                        continue
                 return result
 
         self.restore_pos(start_pos)
+        # Nested layers parsed meanwhile moved it, set it last
+        self._furthest = furthest
         return None
 
     def resolve_pattern_value(self, value: Any, captures: List[Tuple[str, Any]], layer: int) -> ASTNode | None:
@@ -450,6 +1046,10 @@ class Parser:
             elif cap_type == "node":
                 children.append(cap_value)
 
+        ranking = next((child for child in children if child.fn in RANKINGS), None)
+        if ranking is not None:
+            raise ParseError(f"'top {ranking.args[0]} {ranking.name.removeprefix('TOP_').lower()}' is a ranking of terms, it can't be aggregated (ask for the ranking alone)")
+
         # Value should be a callable at this point
         if callable(value):
             return ASTNode(layer=layer, fn=value, args=tuple(args), children=children)
@@ -485,41 +1085,63 @@ class Parser:
 
         return None
 
-    def attach_modifiers(self, node: ASTNode) -> ASTNode:
-        """Try to parse and attach layer-1 modifiers to a node"""
-        layer_minus1 = self.context.get("layer-1", {})
+    def match_modifier(self, group_patterns: dict) -> ASTNode | None:
+        """Match one modifier of a group at the current position"""
+        start_pos = self.save_pos()
+        for pattern, value in group_patterns.items():
+            self.restore_pos(start_pos)
+            self.skip_filler()
 
-        # Sort groups by key to ensure order (group0 before group1)
-        sorted_groups = sorted(layer_minus1.items(), key=lambda x: x[0])
+            matched, captures = self.match_pattern(pattern)
+            if not matched:
+                continue
+            args = []
+            for cap_type, cap_value in captures:
+                if cap_type == "subkey":
+                    # Nested modifier (e.g., "per _")
+                    if isinstance(value, dict) and cap_value in value:
+                        return ASTNode(layer=-1, fn=value[cap_value])
+                    break
+                elif cap_type in ("arg", "env"):
+                    args.append(cap_value)
+            else:
+                if callable(value):
+                    return ASTNode(layer=-1, fn=value, args=tuple(args))
 
-        for _, group_patterns in sorted_groups:
-            start_pos = self.save_pos()
-            self.skip_filler()
+        self.restore_pos(start_pos)
+        return None
 
-            for pattern, value in group_patterns.items():
-                self.restore_pos(start_pos)
-                self.skip_filler()
+    def attach_modifiers(self, node: ASTNode) -> ASTNode:
+        """Try to parse and attach layer-1 modifiers to a node
+
+        Modifiers can be written in any order, they are applied in group order (group0 before group1).
+        """
+        layer_minus1 = self.context.get("layer-1", {})
+        sorted_groups = sorted(layer_minus1.items(), key=lambda x: x[0])
 
-                matched, captures = self.match_pattern(pattern)
-                if matched:
-                    # Create modifier node
-                    args = []
-                    for cap_type, cap_value in captures:
-                        if cap_type == "subkey":
-                            # Nested modifier (e.g., "per _")
-                            if isinstance(value, dict):
-                                if cap_value in value:
-                                    mod_node = ASTNode(layer=-1, fn=value[cap_value])
-                                    node.modifiers.append(mod_node)
-                                    break
-                        elif cap_type in ("arg", "env"):
-                            args.append(cap_value)
+        found: Dict[str, ASTNode] = {}
+        matched = True
+        while matched:
+            matched = False
+            for group, group_patterns in sorted_groups:
+                # Filter clauses accumulate, other groups allow a single modifier
+                if group in found and found[group].fn != MODIFIERS.FILTER:
+                    continue
+                mod_node = self.match_modifier(group_patterns)
+                if mod_node is None:
+                    continue
+                if isinstance(mod_node.fn, Clause):
+                    clause = mod_node.fn(*mod_node.args)
+                    if group in found:
+                        found[group].args = (*found[group].args, clause)
                     else:
-                        if callable(value):
-                            mod_node = ASTNode(layer=-1, fn=value, args=tuple(args))
-                            node.modifiers.append(mod_node)
-                    break
+                        found[group] = ASTNode(layer=-1, fn=MODIFIERS.FILTER, args=(clause,))
+                else:
+                    found[group] = mod_node
+                matched = True
+                break
 
+        node.modifiers.extend(found[group] for group, _ in sorted_groups if group in found)
         return node
 
 
@@ -0,0 +1,351 @@
+from typing import Dict, List, Sequence, Tuple
+from collections import OrderedDict
+import os
+import time
+import threading
+
+from src.Federation import load_repo
+from src.FilterParser import parse_filter
+from src.MessageRepo import Message
+from src.Channel import Channel
+from src.Guild import GuildRepo
+from src.Session import Session
+from src.Progress import ProgressEvent, ProgressSink, Cancelled, cancellable
+import src.Progress as progress
+
+"""
+    TUI mode: a message browser filtering as the user types (quickload --tui)
+
+    The screen holds a filter expression (the syntax of src.FilterParser), a status line and the matching
+    messages, one per row. The list is virtual: it only keeps the sorted positions of the matches (a range
+    when there is no filter, an array('I') otherwise), each redraw slices the visible page out of them and
+    formats those rows alone, through a small cache of formatted rows. Scrolling costs the same on a
+    hundred matches or on millions.
+
+    Filters run in a background thread (FilterWorker), the screen keeps answering keys meanwhile. Each edit
+    of the expression supersedes the running filter: its Progress tasks are cancelled at their next batch
+    (see src.Progress.cancellable) and only the result of the last expression is shown. An expression that
+    doesn't parse keeps the previous matches on screen, with the error in the status line.
+
+    Keys: Up/Down, PgUp/PgDn, Home/End move in the list, Enter shows the whole selected message,
+    Ctrl-U clears the filter, Esc quits (or leaves the message view).
+"""
+
+# Milliseconds between two polls of the worker when no key is pressed
+POLL_MS = 50
+# Formatted rows kept between redraws
+ROW_CACHE = 4096
+HELP = "Up/Down PgUp/PgDn Home/End move | Enter message | Ctrl-U clear | Esc quit"
+
+
+class StatusSink(ProgressSink):
+    """Keeps the last report of the running tasks, drawn in the status line instead of a terminal bar"""
+    interval = 0.1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Dict[int, ProgressEvent] = {}
+
+    def emit(self, event: ProgressEvent):
+        with self._lock:
+            if event.status == "end":
+                self._active.pop(event.id, None)
+            else:
+                self._active[event.id] = event
+
+    def line(self) -> str:
+        with self._lock:
+            events = list(self._active.values())
+        return " | ".join(f"{e.name} {100 * e.done / e.total:.0f}%" if e.total else e.name for e in events)
+
+
+class FilterResult:
+    """Matches of an expression, or the error it raised"""
+    def __init__(self, generation: int, expression: str, indices: Sequence[int] | None, error: str = "", seconds: float = 0.0):
+        self.generation = generation
+        self.expression = expression
+        self.indices = indices
+        self.error = error
+        self.seconds = seconds
+
+
+class FilterWorker:
+    """Evaluates the last submitted expression in a background thread, superseded ones are cancelled"""
+    def __init__(self, session: Session):
+        self.session = session
+        self.generation = 0
+        self._pending: Tuple[int, str] | None = None
+        self._cancel = threading.Event()
+        self._result: FilterResult | None = None
+        self._condition = threading.Condition()
+        self._closed = False
+        self.busy = False
+        self._thread = threading.Thread(target=self._run, name="tui-filter", daemon=True)
+        self._thread.start()
+
+    def submit(self, expression: str) -> int:
+        """Evaluate an expression instead of whatever runs, returns its generation"""
+        with self._condition:
+            self.generation += 1
+            self._cancel.set()
+            self._pending = (self.generation, expression)
+            self._condition.notify()
+            return self.generation
+
+    def take(self) -> FilterResult | None:
+        """The result of the last expression once it is ready (only once)"""
+        with self._condition:
+            result, self._result = self._result, None
+            return result
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._cancel.set()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                (generation, expression), self._pending = self._pending, None
+                self._cancel = cancel = threading.Event()
+                self.busy = True
+            result = self._evaluate(generation, expression, cancel)
+            with self._condition:
+                self.busy = self._pending is not None
+                # A newer expression was submitted meanwhile: this result is stale
+                if result is not None and generation == self.generation:
+                    self._result = result
+
+    def _evaluate(self, generation: int, expression: str, cancel: threading.Event) -> FilterResult | None:
+        start = time.perf_counter()
+        if not expression.strip():
+            return FilterResult(generation, expression, range(len(self.session.data)))
+        try:
+            with cancellable(cancel):
+                indices = self.session.engine.get_sorted_indices(parse_filter(expression))
+        except Cancelled:
+            return None
+        except Exception as e:
+            # Half typed expressions fail all the time, the error goes to the status line
+            return FilterResult(generation, expression, None, f"{type(e).__name__}: {e}")
+        return FilterResult(generation, expression, indices, seconds=time.perf_counter() - start)
+
+
+class ResultList:
+    """Sorted positions of the matches, formatted a page at a time"""
+    def __init__(self, data: List[Message], labels: Dict[str, str], indices: Sequence[int] = range(0)):
+        self.data = data
+        self.labels = labels
+        self.indices = indices
+        self._rows: OrderedDict[int, str] = OrderedDict()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def channel_label(self, channel: Channel) -> str:
+        name = self.labels.get(channel.id) or channel.name or channel.id
+        if channel.type == Channel.Type.GUILD:
+            return f"{GuildRepo.default().label(channel.guild_id)} #{channel.name or name}"
+        return name
+
+    def format(self, position: int) -> str:
+        """Row of a message (position in data), kept in the row cache"""
+        row = self._rows.get(position)
+        if row is None:
+            message = self.data[position]
+            content = " ".join(message.content.split())
+            if message.attachment_rows:
+                content += f" [{len(message.attachment_rows)} attachment{'s' if len(message.attachment_rows) > 1 else ''}]"
+            row = f"{message.timestamp:%Y-%m-%d %H:%M}  {self.channel_label(message.channel)[:30]:<30}  {content}"
+            self._rows[position] = row
+            if len(self._rows) > ROW_CACHE:
+                self._rows.popitem(last=False)
+        else:
+            self._rows.move_to_end(position)
+        return row
+
+    def page(self, offset: int, count: int) -> List[str]:
+        """Rows offset to offset + count of the matches"""
+        return [self.format(position) for position in self.indices[offset:offset + count]]
+
+    def message(self, offset: int) -> Message:
+        return self.data[self.indices[offset]]
+
+
+class Browser:
+    """State and drawing of the TUI screen"""
+    def __init__(self, session: Session, labels: Dict[str, str]):
+        self.session = session
+        self.results = ResultList(session.data, labels, range(len(session.data)))
+        self.worker = FilterWorker(session)
+        self.status = StatusSink()
+        self.expression = ""
+        self.shown = ""
+        self.error = ""
+        self.seconds = 0.0
+        self.top = 0
+        self.selected = 0
+        self.detail = False
+
+    def _height(self, screen) -> int:
+        # Filter line, status line and help line around the list
+        return max(1, screen.getmaxyx()[0] - 3)
+
+    def _poll(self):
+        result = self.worker.take()
+        if result is None:
+            return
+        self.error = result.error
+        if result.indices is not None:
+            self.results.indices = result.indices
+            self.shown = result.expression
+            self.seconds = result.seconds
+            self.top = self.selected = 0
+            self.detail = False
+
+    def _move(self, delta: int, height: int):
+        self.selected = max(0, min(len(self.results) - 1, self.selected + delta))
+        if self.selected < self.top:
+            self.top = self.selected
+        elif self.selected >= self.top + height:
+            self.top = self.selected - height + 1
+
+    def _edit(self, expression: str):
+        self.expression = expression
+        self.worker.submit(expression)
+
+    def handle(self, key, height: int) -> bool:
+        """Apply a key, False to quit"""
+        import curses
+        if key == "\x1b":
+            if self.detail:
+                self.detail = False
+                return True
+            return False
+        if self.detail:
+            self.detail = key not in ("\n", "\r", curses.KEY_ENTER)
+            return True
+        moves = {
+            curses.KEY_UP: -1, curses.KEY_DOWN: 1,
+            curses.KEY_PPAGE: -height, curses.KEY_NPAGE: height,
+            curses.KEY_HOME: -len(self.results), curses.KEY_END: len(self.results)
+        }
+        if key in moves:
+            self._move(moves[key], height)
+        elif key in ("\n", "\r", curses.KEY_ENTER):
+            self.detail = len(self.results) > 0
+        elif key in (curses.KEY_BACKSPACE, "\x7f", "\b"):
+            if self.expression:
+                self._edit(self.expression[:-1])
+        elif key == "\x15":
+            self._edit("")
+        elif isinstance(key, str) and key.isprintable():
+            self._edit(self.expression + key)
+        return True
+
+    def _status(self) -> str:
+        if self.worker.busy:
+            running = self.status.line()
+            return f"filtering... {running}" if running else "filtering..."
+        if self.error:
+            return self.error
+        matches = f"{len(self.results):,} of {len(self.session.data):,} messages"
+        return f"{matches} ({self.seconds * 1000:.0f} ms)" if self.shown.strip() else matches
+
+    def _draw_detail(self, screen, width: int, height: int):
+        import textwrap
+        message = self.results.message(self.selected)
+        lines = [
+            f"{message.timestamp:%Y-%m-%d %H:%M:%S}  {self.results.channel_label(message.channel)}",
+            f"message {message.id} in channel {message.channel.id}",
+            ""
+        ]
+        for paragraph in message.content.splitlines() or [""]:
+            lines.extend(textwrap.wrap(paragraph, width - 1) or [""])
+        if message.attachments:
+            lines.append("")
+            lines.extend(url[:width - 1] for url in message.attachments.split())
+        for y, line in enumerate(lines[:height]):
+            screen.addnstr(2 + y, 0, line, width - 1)
+
+    def draw(self, screen):
+        import curses
+        screen.erase()
+        rows, width = screen.getmaxyx()
+        height = self._height(screen)
+        if width < 2 or rows < 4:
+            screen.refresh()
+            return
+        prompt = "filter> "
+        screen.addnstr(1, 0, self._status().ljust(width - 1), width - 1, curses.A_REVERSE)
+        if self.detail and len(self.results):
+            self._draw_detail(screen, width, height)
+        else:
+            # Keep the selection visible after a resize
+            self._move(0, height)
+            for y, row in enumerate(self.results.page(self.top, height)):
+                screen.addnstr(2 + y, 0, row.ljust(width - 1), width - 1, curses.A_STANDOUT if self.top + y == self.selected else curses.A_NORMAL)
+        screen.addnstr(rows - 1, 0, HELP, width - 1, curses.A_DIM)
+        # The end of a long expression stays visible, with the cursor after it
+        field = (prompt + self.expression)[-(width - 1):]
+        screen.addnstr(0, 0, field, width - 1)
+        screen.move(0, min(len(field), width - 1))
+        screen.refresh()
+
+    def run(self, screen):
+        import curses
+        try:
+            curses.curs_set(1)
+        except curses.error:
+            pass
+        screen.keypad(True)
+        screen.timeout(POLL_MS)
+        previous = progress.sink()
+        # Nothing may write to the terminal while curses owns it
+        progress.set_sink(self.status)
+        try:
+            while True:
+                self._poll()
+                self.draw(screen)
+                try:
+                    key = screen.get_wch()
+                except curses.error:
+                    continue
+                if not self.handle(key, self._height(screen)):
+                    return
+        finally:
+            progress.set_sink(previous)
+            self.worker.close()
+
+
+def channel_labels(repo) -> Dict[str, str]:
+    """Channel id -> name given by the index.json of the messages folders (DMs are named after the recipient)"""
+    labels: Dict[str, str] = {}
+    for part in getattr(repo, "repos", [repo]):
+        labels.update(getattr(part, "context", {}))
+    return labels
+
+
+def start(argv: List[str]) -> int:
+    try:
+        import curses
+    except ImportError:
+        print("The TUI needs the curses module (pip install windows-curses on Windows)")
+        return 1
+    repo = load_repo()
+    session = Session(repo)
+    browser = Browser(session, channel_labels(repo))
+    # Esc quits right away instead of waiting for an escape sequence
+    os.environ.setdefault("ESCDELAY", "25")
+    try:
+        curses.wrapper(browser.run)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+__all__ = ['Browser', 'ResultList', 'FilterWorker', 'FilterResult', 'StatusSink', 'channel_labels', 'start']
@@ -0,0 +1,155 @@
+from typing import Callable, Dict, Iterable, List, Tuple
+from collections import Counter
+from src.utils.Sketches import SpaceSaving, CountMinSketch
+
+import re
+
+"""
+    Most frequent terms of message contents: words, emojis, mentioned users and word n-grams.
+
+    HeavyHitters counts exactly, in a hash map, until it holds EXACT_LIMIT distinct terms (the words of
+    a few channels never get there). Past that it switches to fixed memory sketches: a Space-Saving
+    summary keeps the candidate heavy hitters, and a Count-Min sketch of every term tightens their counts
+    (both overestimate, the smallest estimate is kept). Large vocabularies and n-grams stay in bounded
+    memory, at the price of approximate counts for the least frequent terms of the top. Terms reach the
+    sketches in batches counted exactly first, so frequent terms cost one sketch update per batch.
+
+    Counters are mergeable, exact or not: each shard of messages, or each worker process (terms are
+    hashed with CRC32, not the per process salted hash()), counts its own and the counters are merged.
+"""
+
+# Distinct terms counted exactly before switching to sketches
+EXACT_LIMIT = 100_000
+# Space-Saving counters kept, at least 10 per term asked for
+CAPACITY = 1000
+# Distinct terms pre-aggregated (exactly) before going into the sketches
+BATCH = 50_000
+
+# Mentions, channel links, custom emojis and URLs aren't words
+NOISE_PATTERN = re.compile(r"<a?:\w+:\d+>|<[@#][!&]?\d+>|https?://\S+|www\.\S+")
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:['\u2019][^\W\d_]+)*")
+MENTION_PATTERN = re.compile(r"<@!?(\d{17,20})>")
+# Discord custom emojis (<:name:id>, <a:name:id> when animated), flags and Unicode emojis, with their skin tones,
+# variation selectors and zero width joined sequences
+_EMOJI = "[\U0001F300-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u3030\u303D\u3297\u3299][\U0001F3FB-\U0001F3FF\uFE0F]*"
+EMOJI_PATTERN = re.compile(rf"<a?:(\w+):\d+>|[\U0001F1E6-\U0001F1FF]{{2}}|{_EMOJI}(?:\u200D{_EMOJI})*")
+
+
+def words(content: str) -> List[str]:
+    """Lowercased words of a message"""
+    return WORD_PATTERN.findall(NOISE_PATTERN.sub(" ", content.lower()))
+
+
+def emojis(content: str) -> List[str]:
+    """Unicode emojis and custom emojis (as :name:) of a message"""
+    return [f":{match[1]}:" if match[1] else match[0] for match in EMOJI_PATTERN.finditer(content)]
+
+
+def mentions(content: str) -> List[str]:
+    """User ids mentioned by a message"""
+    return MENTION_PATTERN.findall(content)
+
+
+def ngrams(n: int) -> Callable[[str], List[str]]:
+    """Sequences of n consecutive words of a message"""
+    def extract(content: str) -> List[str]:
+        tokens = words(content)
+        return [" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)]
+    return extract
+
+
+# Kind of term -> terms of a message content
+TERM_KINDS: Dict[str, Callable[[str], List[str]]] = {
+    "words": words,
+    "emojis": emojis,
+    "mentions": mentions,
+    "bigrams": ngrams(2),
+    "trigrams": ngrams(3)
+}
+
+
+class HeavyHitters:
+    """Frequencies of terms, exact up to exact_limit distinct terms, then in bounded memory (see the module documentation)"""
+    def __init__(self, capacity: int = CAPACITY, exact_limit: int = EXACT_LIMIT, width: int = 1 << 16, depth: int = 4):
+        self.capacity = capacity
+        self.exact_limit = exact_limit
+        self.width = width
+        self.depth = depth
+        self.counts: Counter | None = Counter()
+        self.candidates: SpaceSaving | None = None
+        self.sketch: CountMinSketch | None = None
+        self._pending = Counter()
+
+    @property
+    def exact(self) -> bool:
+        return self.counts is not None
+
+    def _to_sketches(self):
+        self.candidates = SpaceSaving(self.capacity)
+        self.sketch = CountMinSketch(self.width, self.depth)
+        for term, n in self.counts.items():
+            self.candidates.add(term, n)
+            self.sketch.add(term, n)
+        self.counts = None
+
+    def _flush(self):
+        for term, n in self._pending.items():
+            self.candidates.add(term, n)
+            self.sketch.add(term, n)
+        self._pending = Counter()
+
+    def update(self, terms: Iterable[str]):
+        if self.counts is not None:
+            self.counts.update(terms)
+            if len(self.counts) > self.exact_limit:
+                self._to_sketches()
+            return
+        self._pending.update(terms)
+        if len(self._pending) >= BATCH:
+            self._flush()
+
+    def merge(self, other: 'HeavyHitters') -> 'HeavyHitters':
+        if self.counts is not None and other.counts is not None:
+            self.counts.update(other.counts)
+            if len(self.counts) > self.exact_limit:
+                self._to_sketches()
+            return self
+        if self.counts is not None:
+            self._to_sketches()
+        self._flush()
+        if other.counts is not None:
+            for term, n in other.counts.items():
+                self.candidates.add(term, n)
+                self.sketch.add(term, n)
+        else:
+            other._flush()
+            self.candidates.merge(other.candidates)
+            self.sketch.merge(other.sketch)
+        return self
+
+    def most_common(self, n: int | None = None) -> List[Tuple[str, int]]:
+        if self.counts is not None:
+            return self.counts.most_common(n)
+        self._flush()
+        # Both summaries overestimate: the lowest of the two is the closest
+        estimates = [(term, min(count, self.sketch.estimate(term))) for term, count in self.candidates.most_common()]
+        return sorted(estimates, key=lambda x: x[1], reverse=True)[:n]
+
+    def __len__(self):
+        return len(self.counts) if self.counts is not None else len(self.candidates)
+
+    def __repr__(self):
+        return f"<HeavyHitters {'exact' if self.exact else 'approximate'}, {len(self)} terms>"
+
+
+def top_terms(contents: Iterable[str], kind: str, k: int, exact_limit: int = EXACT_LIMIT) -> List[Tuple[str, int]]:
+    """The k most frequent terms of a kind (see TERM_KINDS) in message contents, with their counts"""
+    if kind not in TERM_KINDS:
+        raise ValueError(f"Unknown kind of terms '{kind}', expected one of {', '.join(TERM_KINDS)}")
+    extract = TERM_KINDS[kind]
+    counter = HeavyHitters(max(CAPACITY, 10 * k), exact_limit)
+    for content in contents:
+        counter.update(extract(content))
+    return counter.most_common(k)
+
+__all__ = ['HeavyHitters', 'TERM_KINDS', 'EXACT_LIMIT', 'top_terms', 'words', 'emojis', 'mentions', 'ngrams']
@@ -0,0 +1,181 @@
+from typing import Callable, Dict, List, Any, Tuple
+from src.Config import Config
+from src.MessageRepo import MessageRepo
+from src.Filter import Filter, FILTERS
+from src.Activity import ActivityRepo
+from src.utils.JsonLines import find_jsonl_files
+import src.Stat as s
+
+import gc
+import sys
+import time
+import platform
+import statistics
+import tracemalloc
+
+"""
+    Benchmark runner: times every stage of the pipeline against a package and records
+    throughput and peak memory as JSON, so that two runs can be compared.
+"""
+
+# Arguments used to benchmark each filter, dates fall inside SyntheticPackage's default period
+FILTER_ARGS: Dict[str, Tuple] = {
+    "SentAfter": ("2021-06-01",),
+    "SentBefore": ("2021-06-01",),
+    "SentBetween": ("2020-01-01", "2022-01-01"),
+    "ChannelRecipients": ("0",),
+    "MentionsUser": ("0",),
+    "HasUserMentionCountGt": ("0",),
+    "HasUserMentionCountLt": ("1",),
+    "HasUserMentionCountEq": ("1",),
+    "MentionsChannel": ("0",),
+    "HasChannemMentionCountGt": ("0",),
+    "HasChannemMentionCountLt": ("1",),
+    "HasChannemMentionCountEq": ("1",),
+    "MessageContains": ("lol", "mdr", "gg"),
+    "MessageLengthGt": ("40",),
+    "MessageLengthLt": ("10",),
+    "MessageLengthEq": ("0",),
+    "MessageRegex": (r"\bthe\b", r"\bgood\b"),
+    "AttachmentCountGt": ("1",),
+    "AttachmentCountLt": ("1",),
+    "AttachmentCountEq": ("1",),
+}
+
+QUERIES: List[str] = [
+    "the total number of messages",
+    "the average number of words",
+    "the total number of words per month",
+    "the average number of messages per day",
+    "the average length of messages per channel",
+    "the total number of attachments per guild",
+    "the total number of mentions per year",
+    "the ratio of the total number of attachments over the total number of messages as percentage",
+]
+
+
+class Benchmark:
+    def __init__(self, root: str, lang: str = "en", repeat: int = 3, measure_memory: bool = True):
+        self.root = root
+        self.lang = lang
+        self.repeat = max(1, repeat)
+        self.measure_memory = measure_memory
+        self.results: List[Dict[str, Any]] = []
+        self.n_messages = 0
+
+    def measure(self, group: str, name: str, fn: Callable[[], Any], items: int | None = None) -> Any:
+        """Time fn (best and median of `repeat` runs), then record its peak memory in a separate traced run"""
+        timings = []
+        result = None
+        for _ in range(self.repeat):
+            gc.collect()
+            start = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - start)
+
+        peak = None
+        if self.measure_memory:
+            gc.collect()
+            tracemalloc.start()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        items = self.n_messages if items is None else items
+        best = min(timings)
+        self.results.append({
+            "group": group,
+            "name": name,
+            "best_s": round(best, 6),
+            "median_s": round(statistics.median(timings), 6),
+            "items": items,
+            "items_per_s": round(items / best, 1) if best > 0 else None,
+            "peak_bytes": peak
+        })
+        print(f"{group:<8} {name:<60.60} {best * 1000:>10.2f} ms{f'  {peak / 2**20:>8.2f} MiB' if peak is not None else ''}", file=sys.stderr)
+        return result
+
+    def run(self) -> Dict[str, Any]:
+        Config.init(self.root, self.lang)
+
+        repo = self.measure("load", "MessageRepo", lambda: MessageRepo(Config.MESSAGES), items=0)
+        data = repo.get_messages()
+        self.n_messages = len(data)
+        self.results[-1]["items"] = self.n_messages
+        self.results[-1]["items_per_s"] = round(self.n_messages / self.results[-1]["best_s"], 1) if self.results[-1]["best_s"] else None
+
+        # Use ids that exist in the package for the id based filters
+        some_dm = next((c for c in repo.channels if c.recipients), None)
+        args = dict(FILTER_ARGS)
+        if some_dm is not None:
+            args["ChannelRecipients"] = (some_dm.recipients[0],)
+            args["MentionsUser"] = (some_dm.recipients[0],)
+        if repo.channels:
+            args["MentionsChannel"] = (repo.channels[0].id,)
+
+        for name, func in FILTERS.__dict__.items():
+            if name.startswith('_') or not callable(func) or func == FILTERS.AlwaysTrue:
+                continue
+            f = Filter(func, *args.get(name, ()))
+            self.measure("filter", name, lambda: f.compute_matches(data))
+
+        groups = {
+            "IsDM & SentAfter": Filter(FILTERS.IsDM) & Filter(FILTERS.SentAfter, *args["SentAfter"]),
+            "IsGuild | HasAttachments": Filter(FILTERS.IsGuild) | Filter(FILTERS.HasAttachments),
+            "~MessageContains": ~Filter(FILTERS.MessageContains, *args["MessageContains"]),
+            "(IsDM | IsGroupDM) & ~ContainsUrl & SentBetween": (Filter(FILTERS.IsDM) | Filter(FILTERS.IsGroupDM)) & ~Filter(FILTERS.ContainsUrl) & Filter(FILTERS.SentBetween, *args["SentBetween"]),
+        }
+        for name, tree in groups.items():
+            self.measure("group", name, lambda: tree.compute_matches(data))
+
+        env: s.SourceEnvironment = {"default": data}
+        for query in QUERIES:
+            node = s.Parser(query).parse()
+            self.measure("query", query, lambda: node.eval(env))
+
+        events = find_jsonl_files(Config.ACTIVITY, Config.ACTIVITIES)
+        if events:
+            activity = self.measure("load", "ActivityRepo (1 worker)", lambda: ActivityRepo(events, workers=1), items=0)
+            self.measure("load", "ActivityRepo (process pool, 4 MiB chunks)", lambda: ActivityRepo(events, chunk_size=4 * 2**20), items=len(activity))
+            self.results[-2]["items"] = len(activity)
+
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "package": self.root,
+            "lang": self.lang,
+            "messages": self.n_messages,
+            "repeat": self.repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": self.results
+        }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Pair the results of two reports and compute the speedup of each stage (> 1 means new is faster)"""
+    previous = {(r["group"], r["name"]): r for r in old.get("results", [])}
+    rows = []
+    for r in new.get("results", []):
+        before = previous.get((r["group"], r["name"]))
+        if before is None:
+            continue
+        rows.append({
+            "group": r["group"],
+            "name": r["name"],
+            "old_s": before["best_s"],
+            "new_s": r["best_s"],
+            "speedup": round(before["best_s"] / r["best_s"], 3) if r["best_s"] else None,
+            "old_peak_bytes": before.get("peak_bytes"),
+            "new_peak_bytes": r.get("peak_bytes")
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]]):
+    for row in rows:
+        print(f"{row['group']:<8} {row['name']:<60.60} {row['old_s'] * 1000:>10.2f} ms -> {row['new_s'] * 1000:>10.2f} ms  x{row['speedup']}", file=sys.stderr)
+
+__all__ = ['Benchmark', 'compare', 'print_comparison', 'FILTER_ARGS', 'QUERIES']
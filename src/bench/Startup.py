@@ -0,0 +1,71 @@
+from typing import Any, Dict, List
+
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+"""
+    Startup benchmark: runs quickload in fresh processes, the way scripts call it, and times
+        - the interpreter alone (python -c pass), the floor of the other measures
+        - the time to first prompt: until the CLI shows its first "> " prompt
+        - the time to first result: a single query inline run, until the process exits with the result
+
+    Results use the same format as Benchmark's, so reports can be merged and compared.
+"""
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+QUICKLOAD = os.path.join(REPO_DIR, "quickload")
+PROMPT = b"> "
+
+
+class StartupBenchmark:
+    def __init__(self, root: str, lang: str = "en", repeat: int = 5, query: str = "the total number of messages"):
+        self.root = os.path.abspath(root)
+        self.lang = lang
+        self.repeat = max(1, repeat)
+        self.query = query
+        self.results: List[Dict[str, Any]] = []
+
+    def _run(self, args: List[str], stdin: bytes = b"", until: bytes | None = None) -> float:
+        """Seconds until the process printed `until` (until it exited when None)"""
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, *args], cwd=REPO_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if until is None:
+            process.communicate(stdin)
+            return time.perf_counter() - start
+        output = b""
+        while until not in output:
+            chunk = os.read(process.stdout.fileno(), 4096)
+            if not chunk:
+                break
+            output += chunk
+        elapsed = time.perf_counter() - start
+        process.communicate(stdin)
+        if until not in output:
+            raise RuntimeError(f"'{until.decode()}' never showed up in the output of {' '.join(args)}")
+        return elapsed
+
+    def measure(self, name: str, args: List[str], stdin: bytes = b"", until: bytes | None = None):
+        timings = [self._run(args, stdin, until) for _ in range(self.repeat)]
+        best = min(timings)
+        self.results.append({
+            "group": "startup",
+            "name": name,
+            "best_s": round(best, 6),
+            "median_s": round(statistics.median(timings), 6),
+            "items": None,
+            "items_per_s": None,
+            "peak_bytes": None
+        })
+        print(f"{'startup':<8} {name:<60.60} {best * 1000:>10.2f} ms", file=sys.stderr)
+
+    def run(self) -> List[Dict[str, Any]]:
+        package = ["--root", self.root, "--lang", self.lang]
+        self.measure("interpreter", ["-c", "pass"])
+        self.measure("time to first prompt (cli)", [QUICKLOAD, "--cli", *package], stdin=b"quit\n", until=PROMPT)
+        self.measure("time to first result (inline)", [QUICKLOAD, *package], stdin=f"{self.query}\n".encode())
+        return self.results
+
+__all__ = ['StartupBenchmark']
@@ -0,0 +1,201 @@
+from typing import List, Dict, Tuple
+from datetime import datetime, timedelta
+
+import os
+import json
+import math
+import random
+
+"""
+    Generates fake Discord data packages with the same layout as the real exports,
+    used as fixtures for benchmarks and for trying the tool without a real package.
+"""
+
+LOCALE_DIR = "locale"
+
+WORDS = (
+    "the be to of and a in that have i it for not on with he as you do at this but his by from they we say her she "
+    "or an will my one all would there their what so up out if about who get which go me when make can like time no "
+    "just him know take people into year your good some could them see other than then now look only come its over "
+    "think also back after use two how our work first well way even new want because any these give day most us "
+    "lol mdr ptdr ok oui non bonjour salut merci gg wp bruh yeah nah omg wtf idk tbh imo btw afk brb gn gm"
+).split()
+EMOJIS = ["😂", "😭", "❤️", "👍", "🔥", "💀", "😅", "🥺", ":kekw:", ":pepega:"]
+URL_HOSTS = ["https://youtu.be/", "https://www.youtube.com/watch?v=", "https://twitter.com/i/status/", "https://github.com/", "https://tenor.com/view/", "https://www.reddit.com/r/"]
+ATTACHMENT_EXTENSIONS = ["png", "png", "png", "jpg", "jpg", "gif", "mp4", "webp", "pdf", "txt", "zip", "mp3"]
+ATTACHMENT_HOSTS = ["https://cdn.discordapp.com/attachments", "https://media.discordapp.net/attachments"]
+EVENT_TYPES = ["app_opened", "channel_opened", "guild_viewed", "message_sent", "message_edited", "add_reaction", "session_start", "session_end", "notification_clicked", "voice_connected"]
+EVENT_WEIGHTS = [5, 30, 10, 25, 2, 8, 4, 4, 3, 2]
+DEVICES = [("Windows", "Discord Client", "Desktop"), ("Android", "Discord Android", "Pixel 6"), ("iOS", "Discord iOS", "iPhone13,2"), ("Linux", "Firefox", "Desktop")]
+
+
+class SyntheticPackage:
+    """A reproducible fake Discord package
+
+    Args:
+        root (str): Directory the package is written to
+        lang (str): Locale of the folder names ("en", "fr"...), read from the locale files
+        channels (int): Number of channels
+        messages (int): Total number of messages, spread over channels with a Zipf-like distribution
+        mix (Tuple[float, float, float]): Weights of DM, group DM and guild channels
+        guilds (int): Number of guilds the guild channels belong to
+        words_mu, words_sigma (float): Log-normal distribution of the number of words per message
+        mention_rate, url_rate, attachment_rate, emoji_rate (float): Probability for a message to contain one of those
+        start, end (str): Period the message timestamps are drawn from
+        events (int): Number of Activity analytics events, none by default
+        seed (int): Random seed, the same parameters and seed always produce the same package
+    """
+    def __init__(self, root: str, lang: str = "en", channels: int = 50, messages: int = 100_000,
+                 mix: Tuple[float, float, float] = (0.5, 0.15, 0.35), guilds: int = 5,
+                 words_mu: float = 1.8, words_sigma: float = 0.9,
+                 mention_rate: float = 0.05, url_rate: float = 0.03, attachment_rate: float = 0.05, emoji_rate: float = 0.1,
+                 start: str = "2018-01-01", end: str = "2025-01-01", events: int = 0, seed: int = 0):
+        self.root = os.path.realpath(root)
+        self.lang = lang
+        self.n_channels = max(1, channels)
+        self.n_messages = messages
+        self.mix = mix
+        self.n_guilds = max(1, guilds)
+        self.words_mu = words_mu
+        self.words_sigma = words_sigma
+        self.mention_rate = mention_rate
+        self.url_rate = url_rate
+        self.attachment_rate = attachment_rate
+        self.emoji_rate = emoji_rate
+        self.start = datetime.fromisoformat(start)
+        self.end = datetime.fromisoformat(end)
+        self.n_events = events
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.user_id = self._snowflake()
+        self.friends: List[str] = [self._snowflake() for _ in range(max(8, self.n_channels))]
+        self.guild_ids: List[str] = [self._snowflake() for _ in range(self.n_guilds)]
+        self.channel_ids: List[str] = []
+
+    def _snowflake(self) -> str:
+        return str(self.rng.randint(10**17, 10**19 - 1))
+
+    def _folders(self) -> Dict[str, str]:
+        return json.loads(open(os.path.join(LOCALE_DIR, f"{self.lang}.json"), "r").read())
+
+    def _message_counts(self) -> List[int]:
+        weights = [1 / (rank + 1) ** 0.8 for rank in range(self.n_channels)]
+        total = sum(weights)
+        counts = [int(self.n_messages * w / total) for w in weights]
+        counts[0] += self.n_messages - sum(counts)
+        return counts
+
+    def _content(self) -> str:
+        rng = self.rng
+        n_words = int(rng.lognormvariate(self.words_mu, self.words_sigma))
+        words = rng.choices(WORDS, k=n_words)
+        if rng.random() < self.emoji_rate:
+            words.insert(rng.randint(0, len(words)), rng.choice(EMOJIS))
+        if rng.random() < self.mention_rate:
+            words.insert(rng.randint(0, len(words)), f"<@{rng.choice(self.friends)}>")
+        if self.channel_ids and rng.random() < self.mention_rate / 4:
+            words.insert(rng.randint(0, len(words)), f"<#{rng.choice(self.channel_ids)}>")
+        if rng.random() < self.url_rate:
+            words.append(rng.choice(URL_HOSTS) + "".join(rng.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=11)))
+        return " ".join(words)
+
+    def _attachments(self, channel_id: str) -> str:
+        rng = self.rng
+        if rng.random() >= self.attachment_rate:
+            return ""
+        return " ".join(
+            f"{rng.choice(ATTACHMENT_HOSTS)}/{channel_id}/{self._snowflake()}/file_{rng.randint(0, 9999)}.{rng.choice(ATTACHMENT_EXTENSIONS)}"
+            for _ in range(1 if rng.random() < 0.85 else rng.randint(2, 4)))
+
+    def _channel(self, channel_id: str, rank: int) -> Dict:
+        rng = self.rng
+        kind = rng.choices(["DM", "GROUP_DM", "GUILD_TEXT"], weights=self.mix)[0]
+        if kind == "DM":
+            return {"id": channel_id, "type": "DM", "recipients": [self.user_id, self.friends[rank % len(self.friends)]]}
+        if kind == "GROUP_DM":
+            members = rng.sample(self.friends, k=min(len(self.friends), rng.randint(2, 9)))
+            return {"id": channel_id, "type": "GROUP_DM", "name": f"group {rank}", "recipients": [self.user_id, *members]}
+        guild = rng.randrange(self.n_guilds)
+        return {"id": channel_id, "type": rng.choice(["GUILD_TEXT", "GUILD_TEXT", "PUBLIC_THREAD"]), "name": f"channel-{rank}",
+                "guild": {"id": self.guild_ids[guild], "name": f"Guild {guild}"}}
+
+    def _events(self, path: str):
+        rng = self.rng
+        span = (self.end - self.start).total_seconds()
+        with open(path, "w") as file:
+            for _ in range(self.n_events):
+                os_name, browser, device = rng.choice(DEVICES)
+                event = {
+                    "event_type": rng.choices(EVENT_TYPES, weights=EVENT_WEIGHTS)[0],
+                    "event_id": self._snowflake(),
+                    "user_id": self.user_id,
+                    "channel_id": rng.choice(self.channel_ids) if rng.random() < 0.6 else None,
+                    "guild_id": rng.choice(self.guild_ids) if rng.random() < 0.3 else None,
+                    "os": os_name, "browser": browser, "device": device,
+                    "country_code": rng.choice(["FR", "FR", "FR", "BE", "CA"]),
+                    "city": rng.choice(["Paris", "Lyon", "Bruxelles", "Montreal"]),
+                    "client_send_timestamp": None,
+                    # Exports quote the timestamps twice
+                    "timestamp": json.dumps((self.start + timedelta(seconds=rng.random() * span)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"),
+                }
+                file.write(json.dumps({k: v for k, v in event.items() if v is not None}) + "\n")
+
+    def generate(self) -> str:
+        """Write the package to disk and return its root"""
+        folders = self._folders()
+        messages_dir = os.path.join(self.root, folders["messages"])
+        account_dir = os.path.join(self.root, folders["account"])
+        guilds_dir = os.path.join(self.root, folders["guilds"])
+        for path in (messages_dir, account_dir, guilds_dir):
+            os.makedirs(path, exist_ok=True)
+
+        with open(os.path.join(account_dir, "user.json"), "w") as file:
+            json.dump({"id": self.user_id, "username": "synthetic", "global_name": "Synthetic User", "discriminator": "0"}, file)
+
+        guild_index = {}
+        for i, guild_id in enumerate(self.guild_ids):
+            guild_index[guild_id] = f"Guild {i}"
+            os.makedirs(os.path.join(guilds_dir, guild_id), exist_ok=True)
+            with open(os.path.join(guilds_dir, guild_id, "guild.json"), "w") as file:
+                json.dump({"id": guild_id, "name": f"Guild {i}"}, file)
+        with open(os.path.join(guilds_dir, "index.json"), "w") as file:
+            json.dump(guild_index, file, ensure_ascii=False)
+
+        self.channel_ids = [self._snowflake() for _ in range(self.n_channels)]
+        span = (self.end - self.start).total_seconds()
+        index = {}
+        for rank, (channel_id, count) in enumerate(zip(self.channel_ids, self._message_counts())):
+            channel = self._channel(channel_id, rank)
+            index[channel_id] = channel.get("name") or f"Direct Message with friend{rank}"
+
+            # Conversations are bursty: messages cluster around a few active periods
+            centers = [self.rng.random() * span for _ in range(max(1, int(math.sqrt(count) / 4)))]
+            offsets = sorted((min(span, max(0.0, self.rng.choice(centers) + self.rng.gauss(0, span / 200))) for _ in range(count)), reverse=True)
+
+            messages = [{
+                "ID": self._snowflake(),
+                "Timestamp": (self.start + timedelta(seconds=int(offset))).strftime("%Y-%m-%d %H:%M:%S"),
+                "Contents": self._content(),
+                "Attachments": self._attachments(channel_id)
+            } for offset in offsets]
+
+            channel_dir = os.path.join(messages_dir, f"c{channel_id}")
+            os.makedirs(channel_dir, exist_ok=True)
+            with open(os.path.join(channel_dir, "channel.json"), "w") as file:
+                json.dump(channel, file, ensure_ascii=False)
+            with open(os.path.join(channel_dir, "messages.json"), "w") as file:
+                json.dump(messages, file, ensure_ascii=False)
+
+        with open(os.path.join(messages_dir, "index.json"), "w") as file:
+            json.dump(index, file, ensure_ascii=False)
+
+        if self.n_events:
+            analytics_dir = os.path.join(self.root, folders["activity"], "analytics")
+            os.makedirs(analytics_dir, exist_ok=True)
+            self._events(os.path.join(analytics_dir, "events-2021-00000-of-00001.json"))
+        return self.root
+
+    def __repr__(self):
+        return f"<SyntheticPackage {self.n_messages} messages in {self.n_channels} channels ({self.lang}) at {self.root}>"
+
+__all__ = ['SyntheticPackage']
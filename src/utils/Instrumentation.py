@@ -0,0 +1,160 @@
+from typing import Dict, List, Any
+from contextlib import contextmanager
+from collections.abc import Sequence
+
+import sys
+import time
+
+"""
+    Hot path instrumentation: per-phase timers and counters, switched off by default.
+
+    Instrumented code calls METRICS.phase("...") / METRICS.count("...") around whole loops, never per message,
+    so the cost when disabled is one attribute check per call site.
+"""
+
+
+class _NoopPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_PHASE = _NoopPhase()
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled: bool = False
+        self.timers: Dict[str, List[float]] = {}  # name -> [total seconds, calls]
+        self.counters: Dict[str, int] = {}
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+
+    @contextmanager
+    def _timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timer = self.timers.setdefault(name, [0.0, 0])
+            timer[0] += time.perf_counter() - start
+            timer[1] += 1
+
+    def phase(self, name: str):
+        """Context manager accumulating the time spent in a phase"""
+        if not self.enabled:
+            return _NOOP_PHASE
+        return self._timed(name)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        return {
+            "timers": {name: {"seconds": round(t[0], 6), "calls": t[1]} for name, t in self.timers.items()},
+            "counters": dict(self.counters)
+        }
+
+    def report(self) -> str:
+        lines = ["phases:"]
+        for name, (total, calls) in sorted(self.timers.items(), key=lambda x: -x[1][0]):
+            lines.append(f"\t{name:<40} {total * 1000:>12.3f} ms {calls:>10} calls")
+        lines.append("counters:")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"\t{name:<40} {value:>12}")
+        return "\n".join(lines)
+
+
+METRICS = Metrics()
+
+
+class Profiler:
+    """Wraps a whole run in cProfile and tracemalloc and dumps both when stopped
+
+    Writes <prefix>.prof (load it with pstats or snakeviz) and <prefix>.tracemalloc
+    (tracemalloc.Snapshot.load), and prints the phase metrics to stderr.
+    """
+    def __init__(self, prefix: str = "f9ql"):
+        # Imported here, every module imports METRICS but only profiled runs need these
+        import cProfile
+        self.prefix = prefix
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        import tracemalloc
+        METRICS.enable()
+        tracemalloc.start()
+        self.profile.enable()
+
+    def stop(self):
+        import tracemalloc
+        self.profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.profile.dump_stats(f"{self.prefix}.prof")
+        snapshot.dump(f"{self.prefix}.tracemalloc")
+
+        print(METRICS.report(), file=sys.stderr)
+        print(f"peak traced memory: {peak / 2**20:.2f} MiB", file=sys.stderr)
+        print("top allocations still alive:", file=sys.stderr)
+        for stat in snapshot.statistics("lineno")[:10]:
+            print(f"\t{stat}", file=sys.stderr)
+        print(f"profile written to {self.prefix}.prof and {self.prefix}.tracemalloc", file=sys.stderr)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+# ─── EXPLAIN ANALYZE ─────────────────────────────────────────────────────
+
+class PlanNode:
+    """One line of an EXPLAIN ANALYZE report"""
+    def to_dict(self):
+        return {
+            "label": self.label,
+            "ms": round(self.seconds * 1000, 3),
+            "self_ms": round(self.self_seconds * 1000, 3),
+            "rows": self.rows,
+            "children": self.children
+        }
+
+    def __init__(self, label: str, seconds: float = 0.0, rows: Any = None, children: List['PlanNode'] | None = None):
+        self.label = label
+        self.seconds = seconds
+        self.rows = rows
+        self.children = children or []
+
+    @property
+    def self_seconds(self) -> float:
+        return max(0.0, self.seconds - sum(c.seconds for c in self.children))
+
+    def render(self, depth: int = 0) -> str:
+        rows = f"  rows={self.rows}" if self.rows is not None else ""
+        line = f"{'  ' * depth}{'-> ' if depth else ''}{self.label}  (time={self.seconds * 1000:.3f} ms, self={self.self_seconds * 1000:.3f} ms{rows})"
+        return "\n".join([line, *(c.render(depth + 1) for c in self.children)])
+
+    def __str__(self):
+        return self.render()
+
+
+def cardinality(value: Any) -> int:
+    """Number of rows of an intermediate result: its length for collections, 1 for a single number"""
+    if isinstance(value, (list, set, tuple, dict, Sequence)) and not isinstance(value, str):
+        return len(value)
+    return 1
+
+__all__ = ['METRICS', 'Metrics', 'Profiler', 'PlanNode', 'cardinality']
@@ -0,0 +1,58 @@
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+from threading import Lock
+
+class Interner:
+    """Dense integer ids for string ids: the n-th distinct string interned gets n
+
+    Ids are interned at load time, predicates then compare small ints (or test set membership)
+    instead of strings. Packages may be loaded by several threads at once (see src.Federation):
+    new ids are added under a lock, lookups of known ids don't take it.
+    """
+    def __init__(self):
+        self.keys: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self._key_sets: Dict[Tuple[str, ...], FrozenSet[int]] = {}
+        self._lock = Lock()
+
+    def intern(self, id: str) -> int:
+        key = self.keys.get(id)
+        if key is None:
+            with self._lock:
+                key = self.keys.get(id)
+                if key is None:
+                    self.ids.append(id)
+                    key = self.keys[id] = len(self.ids) - 1
+                    # Cached sets may hold -1 for this id
+                    self._key_sets.clear()
+        return key
+
+    def get(self, id: str) -> int:
+        """Key of an id, -1 when it was never interned"""
+        return self.keys.get(id, -1)
+
+    def key_set(self, ids: Tuple[str, ...]) -> FrozenSet[int]:
+        """Keys of several ids, cached per tuple (unknown ids become -1, which no interned set contains)"""
+        keys = self._key_sets.get(ids)
+        if keys is None:
+            keys = self._key_sets[ids] = frozenset(self.get(id) for id in ids)
+        return keys
+
+    def __getitem__(self, key: int) -> str:
+        return self.ids[key]
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.keys
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f"<Interner {len(self.ids)} ids>"
+
+# Shared by every repo so that keys stay comparable between packages
+USERS = Interner()
+CHANNELS = Interner()
+# User ids of the package owners, see Channel.account
+ACCOUNTS = Interner()
+
+__all__ = ['Interner', 'USERS', 'CHANNELS', 'ACCOUNTS']
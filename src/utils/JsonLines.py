@@ -0,0 +1,89 @@
+from typing import Iterator, List, Tuple
+from src.PackageSource import DirectorySource, resolve
+
+import os
+
+"""
+    Helpers for the newline-delimited JSON files of the package (Activity event logs...):
+    one JSON object per line, no parent array, sometimes several GB per file.
+
+    Files are handed to workers as chunks: a line aligned byte range (path, start, end) that the worker
+    reads itself for regular files, the bytes themselves for members of a ZIP archive (compressed members
+    can't be read from an offset, they are streamed once and cut on line boundaries).
+"""
+
+# Bytes handed to each worker, large enough to amortize the process round trip
+CHUNK_SIZE = 32 * 2**20
+
+type Chunk = Tuple[str, int, int] | bytes
+
+
+def find_jsonl_files(*roots: str) -> List[str]:
+    """Every .json file under the given directories (missing directories are ignored), sorted"""
+    files = []
+    for root in roots:
+        source, inner = resolve(root)
+        if not source.exists(inner):
+            continue
+        if not source.is_dir(inner):
+            files.append(source.full_path(inner))
+            continue
+        files.extend(source.full_path(path) for path in source.walk_files(inner) if path.endswith(".json"))
+    return sorted(files)
+
+
+def file_size(path: str) -> int:
+    source, inner = resolve(path)
+    return source.size(inner)
+
+
+def chunk_ranges(path: str, chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """Split a file into [start, end) byte ranges of about chunk_size bytes, each one ending on a line boundary"""
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as file:
+        start = 0
+        while start < size:
+            file.seek(min(size, start + chunk_size))
+            file.readline()
+            end = min(size, file.tell()) if start + chunk_size < size else size
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Chunk]:
+    """Line aligned chunks of a file, ZIP members are decompressed as the chunks are consumed"""
+    source, inner = resolve(path)
+    if isinstance(source, DirectorySource):
+        yield from ((path, start, end) for start, end in chunk_ranges(path, chunk_size))
+        return
+    with source.open(inner) as file:
+        while block := file.read(chunk_size):
+            yield block + file.readline()
+
+
+def read_lines(path: str, start: int = 0, end: int | None = None) -> List[bytes]:
+    """Non empty lines of a byte range returned by chunk_ranges"""
+    with open(path, "rb") as file:
+        file.seek(start)
+        raw = file.read(-1 if end is None else end - start)
+    return [line for line in raw.split(b"\n") if line.strip()]
+
+
+def chunk_lines(chunk: Chunk) -> List[bytes]:
+    """Non empty lines of a chunk returned by chunks"""
+    if isinstance(chunk, bytes):
+        return [line for line in chunk.split(b"\n") if line.strip()]
+    return read_lines(*chunk)
+
+
+def iter_lines(path: str) -> Iterator[bytes]:
+    """Non empty lines of a whole file, without loading it"""
+    source, inner = resolve(path)
+    with source.open(inner) as file:
+        for line in file:
+            if line.strip():
+                yield line
+
+__all__ = ['CHUNK_SIZE', 'find_jsonl_files', 'file_size', 'chunk_ranges', 'chunks', 'read_lines', 'chunk_lines', 'iter_lines']
@@ -0,0 +1,23 @@
+from typing import Callable, Iterable, Iterator, TypeVar
+from concurrent.futures import Executor
+from collections import deque
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def ordered_map(executor: Executor, fn: Callable[[T], R], items: Iterable[T], window: int) -> Iterator[R]:
+    """Like executor.map, but only submits `window` items ahead of the consumer
+
+    Executor.map submits every item upfront, which holds the whole input (and output) in memory
+    when the items are produced lazily, like the blocks of a streamed file.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+__all__ = ['ordered_map']
@@ -0,0 +1,165 @@
+from typing import Any, Dict, Iterable, List, Tuple
+from hashlib import blake2b
+from array import array
+from zlib import crc32
+
+import math
+
+"""
+    Fixed memory summaries of large streams, mergeable so that each worker can build its own
+    and the results can be combined afterwards.
+"""
+
+
+def stable_hash(value: Any) -> int:
+    """64 bit hash of a value, identical across processes (the builtin hash() of str is salted per process)"""
+    return int.from_bytes(blake2b(repr(value).encode(), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    """Approximate number of distinct values, standard error ~1.04 / sqrt(2 ** precision)
+
+    Args:
+        precision (int): log2 of the number of registers (14 -> 16 KiB, ~0.8% error)
+    """
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: Any):
+        h = stable_hash(value)
+        index = h & ((1 << self.precision) - 1)
+        rest = h >> self.precision
+        # Position of the lowest set bit of the remaining bits
+        rank = (rest & -rest).bit_length() if rest else 64 - self.precision + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values: Iterable[Any]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precisions")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def __len__(self):
+        return round(self.estimate())
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return raw
+
+    def __repr__(self):
+        return f"<HyperLogLog ~{len(self)} distinct values ({len(self.registers)} registers)>"
+
+
+class SpaceSaving:
+    """Approximate most frequent values, keeping about `capacity` counters
+
+    Batched variant of Space-Saving: counters accumulate up to twice the capacity, then only the
+    `capacity` largest are kept and the largest dropped count becomes the floor new values start from.
+    A kept count overestimates the true one by at most its error, and every value more frequent
+    than the floor is kept.
+    """
+    def __init__(self, capacity: int = 1000):
+        self.capacity = max(1, capacity)
+        self.counts: Dict[Any, int] = {}
+        self.errors: Dict[Any, int] = {}
+        self.floor = 0
+
+    def add(self, value: Any, n: int = 1):
+        if value in self.counts:
+            self.counts[value] += n
+            return
+        self.counts[value] = self.floor + n
+        self.errors[value] = self.floor
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        ranked = sorted(self.counts, key=self.counts.__getitem__, reverse=True)
+        for value in ranked[self.capacity:]:
+            self.floor = max(self.floor, self.counts.pop(value))
+            self.errors.pop(value)
+
+    def update(self, values: Iterable[Any]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        # A value missing from one summary occurred at most `floor` times in its stream
+        counts, errors = {}, {}
+        for value in self.counts.keys() | other.counts.keys():
+            counts[value] = self.counts.get(value, self.floor) + other.counts.get(value, other.floor)
+            errors[value] = self.errors.get(value, self.floor) + other.errors.get(value, other.floor)
+        self.counts, self.errors = counts, errors
+        self.floor += other.floor
+        if len(self.counts) > self.capacity:
+            self._prune()
+        return self
+
+    def most_common(self, n: int | None = None) -> List[Tuple[Any, int]]:
+        return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:n]
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __repr__(self):
+        return f"<SpaceSaving {len(self.counts)}/{self.capacity} counters>"
+
+class CountMinSketch:
+    """Approximate count of every value in depth rows of width counters, never below the true count
+
+    With N values added, an estimate exceeds its true count by more than e * N / width with
+    probability at most e ** -depth. Values are strings (terms), hashed with CRC32 so that sketches
+    built by different processes can be merged.
+    """
+    def __init__(self, width: int = 1 << 16, depth: int = 4):
+        if width < 1 or depth < 1:
+            raise ValueError("width and depth must be positive")
+        self.width = width
+        self.depth = depth
+        self.rows = [array('Q', bytes(8 * width)) for _ in range(depth)]
+        self.total = 0
+
+    def _columns(self, value: str) -> List[int]:
+        # Double hashing: the depth columns of a value from two 32 bit hashes
+        data = value.encode()
+        h1 = crc32(data)
+        h2 = crc32(data, 0x9E3779B9) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, value: str, n: int = 1):
+        for row, column in zip(self.rows, self._columns(value)):
+            row[column] += n
+        self.total += n
+
+    def update(self, values: Iterable[str]):
+        for value in values:
+            self.add(value)
+
+    def estimate(self, value: str) -> int:
+        return min(row[column] for row, column in zip(self.rows, self._columns(value)))
+
+    def merge(self, other: 'CountMinSketch') -> 'CountMinSketch':
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("Cannot merge sketches of different dimensions")
+        self.rows = [array('Q', map(int.__add__, mine, theirs)) for mine, theirs in zip(self.rows, other.rows)]
+        self.total += other.total
+        return self
+
+    def __repr__(self):
+        return f"<CountMinSketch {self.depth}x{self.width}, {self.total} values>"
+
+__all__ = ['HyperLogLog', 'SpaceSaving', 'CountMinSketch', 'stable_hash']
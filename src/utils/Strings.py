@@ -1,20 +1,51 @@
 from typing import Tuple, List
 
-def tokenize(s: str, quotes: Tuple[str] = ('"'), seps: Tuple[str] = (" ")) -> List[str]:
+
+class Tokens(list):
+    """Tokens of a command line, remembering where each one starts in the line"""
+    def __init__(self, line: str, tokens: List[str], starts: List[int]):
+        super().__init__(tokens)
+        self.line = line
+        self.starts = starts
+
+    def text(self, start: int) -> str:
+        """The line from token start on, as it was typed (quotes kept)"""
+        if start >= len(self):
+            return ""
+        return self.line[self.starts[start]:].strip()
+
+
+def tokenize(s: str, quotes: Tuple[str] = ('"'), seps: Tuple[str] = (" ")) -> Tokens:
     tokens: List[str] = []
+    starts: List[int] = []
     curr_tok: str = ""
+    curr_start: int | None = None
     in_quotes: bool = False
 
-    for c in s:
+    for i, c in enumerate(s):
         if c in seps and not in_quotes:
             if curr_tok:
                 tokens.append(curr_tok)
+                starts.append(curr_start)
                 curr_tok = ""
-        elif c in quotes:
+            curr_start = None
+            continue
+        if curr_start is None:
+            curr_start = i
+        if c in quotes:
             in_quotes = not in_quotes
         else:
             curr_tok += c
     if curr_tok:
         tokens.append(curr_tok)
-    
-    return tokens
+        starts.append(curr_start)
+
+    return Tokens(s, tokens, starts)
+
+
+def join_args(args: List[str], start: int) -> str:
+    """The arguments from start on as one string: the typed text when known (quoted arguments stay
+    quoted for the parsers), the tokens joined with spaces otherwise"""
+    if isinstance(args, Tokens):
+        return args.text(start)
+    return " ".join(args[start:])
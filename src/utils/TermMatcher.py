@@ -0,0 +1,100 @@
+from typing import Dict, Iterable, Pattern, Tuple
+from functools import lru_cache
+
+import re
+
+"""
+    Literal terms (a moderation word list, the characters of a query...) found or counted in a single pass.
+
+    The terms are merged into a trie, whose shared prefixes are written out as one regular expression:
+    "gg", "gm" and "good" become g(?:g|m|ood). At each position of a text the regex engine (C code) walks
+    down the trie at most once, instead of trying every term in turn like an alternation of the terms
+    does: the cost of a search barely grows with the number of terms. This is the goto function of an
+    Aho-Corasick automaton without its failure links, run by re instead of a Python loop over characters,
+    which would be slower than the backtracking it replaces for any realistic message length.
+
+    A few single characters (up to CHAR_COUNT_LIMIT) are counted with str.count instead, one C loop per
+    character beats the regex engine building a list of every match until there are about ten of them.
+
+    Matchers are built once per term set and cached (term_matcher()).
+"""
+
+# Term sets whose matcher is kept
+CACHE_SIZE = 256
+# Single character terms counted with str.count up to this many
+CHAR_COUNT_LIMIT = 8
+
+
+def _trie(terms: Iterable[str]) -> dict:
+    root: dict = {}
+    for term in terms:
+        node = root
+        for char in term:
+            node = node.setdefault(char, {})
+        # "" marks the end of a term
+        node[""] = {}
+    return root
+
+
+def _pattern(node: dict) -> str:
+    """Regex matching the terms below a trie node, the longest one first"""
+    branches = [re.escape(char) + _pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    if "" in node:
+        # A term ends here, the longer ones go on: greedy optional group
+        return f"(?:{pattern})?"
+    return pattern
+
+
+class TermMatcher:
+    """Finds or counts any of a set of literal terms, see the module documentation
+
+    ignore_case matches the terms case insensitively. Terms overlapping each other in a text are counted
+    once, as the longest one starting at the leftmost position.
+    """
+    def __init__(self, terms: Iterable[str], ignore_case: bool = False):
+        self.terms: Tuple[str, ...] = tuple(dict.fromkeys(term.lower() if ignore_case else term for term in terms))
+        self.ignore_case = ignore_case
+        # An empty term is in every text
+        self.matches_all = "" in self.terms
+        words = [term for term in self.terms if term]
+        self.regex: Pattern | None = re.compile(_pattern(_trie(words)), re.IGNORECASE if ignore_case else 0) if words else None
+        self._chars: Tuple[str, ...] | None = tuple(words) if len(words) <= CHAR_COUNT_LIMIT and all(len(term) == 1 for term in words) else None
+
+    def search(self, text: str) -> bool:
+        """Whether one of the terms is in text"""
+        if self.matches_all:
+            return True
+        return self.regex is not None and self.regex.search(text) is not None
+
+    def count(self, text: str) -> int:
+        """Occurrences of the terms in text"""
+        if self.regex is None:
+            return 0
+        if self._chars is not None:
+            if self.ignore_case:
+                text = text.lower()
+            return sum(text.count(char) for char in self._chars)
+        return len(self.regex.findall(text))
+
+    def counts(self, text: str) -> Dict[str, int]:
+        """Occurrences of each term found in text"""
+        found: Dict[str, int] = {}
+        if self.regex is not None:
+            for match in self.regex.findall(text):
+                key = match.lower() if self.ignore_case else match
+                found[key] = found.get(key, 0) + 1
+        return found
+
+    def __repr__(self):
+        return f"<TermMatcher {len(self.terms)} terms{', ignoring case' if self.ignore_case else ''}>"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def term_matcher(terms: Tuple[str, ...], ignore_case: bool = False) -> TermMatcher:
+    """The matcher of a term set, built on its first use"""
+    return TermMatcher(terms, ignore_case)
+
+__all__ = ['TermMatcher', 'term_matcher']
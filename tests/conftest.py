@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+"""
+    Fixtures shared by the tests: a small synthetic package (see src.bench.SyntheticPackage), generated once
+    per run, and the repo and session loaded from it.
+
+    Config and the package generator read the locale files relative to the working directory, the tests run
+    from the root of the repository whatever directory pytest was started from.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from src.Config import Config
+from src.MessageRepo import MessageRepo
+from src.Session import Session
+from src.bench.SyntheticPackage import SyntheticPackage
+
+LANG = "en"
+MESSAGES = 3000
+
+
+@pytest.fixture(scope="session")
+def package(tmp_path_factory) -> str:
+    """Root of the synthetic package, the same one on every run"""
+    return SyntheticPackage(str(tmp_path_factory.mktemp("package")), lang=LANG, channels=12, messages=MESSAGES,
+                            attachment_rate=0.2, url_rate=0.1, seed=7).generate()
+
+
+@pytest.fixture
+def repo(package) -> MessageRepo:
+    Config.init(package, LANG)
+    return MessageRepo(Config.MESSAGES)
+
+
+@pytest.fixture
+def session(repo) -> Session:
+    return Session(repo)
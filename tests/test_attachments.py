@@ -0,0 +1,28 @@
+from src.Attachments import extension_keys
+from src.Config import Config
+from src.Filter import FILTERS, Filter
+from src.Index import MessageIndex
+from src.MessageRepo import MessageRepo
+
+"""
+    Parsed attachments: one table per repo, and the index answering like the scan.
+"""
+
+
+def test_one_table_per_repo(repo):
+    again = MessageRepo(Config.MESSAGES)
+    assert again.attachments is not repo.attachments
+    rows = sum(len(m.attachment_rows) for m in repo.messages)
+    assert rows > 0
+    assert len(repo.attachments.hosts) == len(again.attachments.hosts) == rows
+    assert all(m.attachment_table is repo.attachments for m in repo.messages)
+
+
+def test_index_matches_scan(repo):
+    index = MessageIndex(repo.messages)
+    assert index.attachment_types("image") == Filter(FILTERS.HasAttachmentType, "image").compute_matches(repo.messages)
+    assert index.attachment_hosts("discordapp.com") == Filter(FILTERS.HasAttachmentFrom, "discordapp.com").compute_matches(repo.messages)
+
+
+def test_extension_keys_by_type():
+    assert extension_keys("png") <= extension_keys("image")
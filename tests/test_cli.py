@@ -0,0 +1,58 @@
+import re
+
+import pytest
+
+import src.CLI.CLI as cli
+from src.Config import Config
+from src.utils.Strings import tokenize, join_args
+from conftest import LANG
+
+"""
+    The CLI driven like a user would, one typed line after the other.
+"""
+
+
+def _run(monkeypatch, capsys, lines) -> str:
+    """Output of the lines typed at the prompt, ending the session with CTRL+D"""
+    typed = iter(lines)
+
+    def prompt(_):
+        try:
+            return next(typed)
+        except StopIteration:
+            raise EOFError
+    monkeypatch.setattr("builtins.input", prompt)
+    capsys.readouterr()
+    cli.start()
+    return capsys.readouterr().out.split("type 'help' for the help page", 1)[1]
+
+
+@pytest.fixture
+def package_config(package):
+    Config.init(package, LANG)
+
+
+def test_tokens_keep_the_typed_text():
+    tokens = tokenize('query the total number of messages matching "\\D+"  ')
+    assert tokens[-2:] == ["matching", "\\D+"]
+    assert join_args(tokens, 1) == 'the total number of messages matching "\\D+"'
+    assert join_args(["query", "a", "b"], 1) == "a b"
+
+
+def test_query_keeps_the_case_of_quoted_arguments(repo, package_config, monkeypatch, capsys):
+    output = _run(monkeypatch, capsys, [
+        'query the total number of messages matching "\\D+"',
+        'query the total number of messages matching "\\d+"',
+        'query the total number of messages containing "To The"',
+    ])
+    upper, lower, phrase = map(int, re.findall(r"^(\d+)$", output, re.M))
+    assert upper == sum(1 for m in repo.messages if re.search(r"\D+", m.content))
+    assert lower == sum(1 for m in repo.messages if re.search(r"\d+", m.content))
+    assert phrase == sum(1 for m in repo.messages if "to the" in m.content.lower())
+    assert upper != lower
+
+
+def test_define_takes_quoted_filter_arguments(repo, package_config, monkeypatch, capsys):
+    output = _run(monkeypatch, capsys, ['define phrase MessageContains("to the")'])
+    expected = sum(1 for m in repo.messages if "to the" in m.content)
+    assert f"phrase: {expected} messages" in output
@@ -0,0 +1,54 @@
+import pytest
+
+from src.Config import Config
+from src.Federation import FederatedRepo, load_repo
+from src.Filter import FILTERS, Filter
+from src.Guild import GuildRepo
+from src.MessageRepo import MessageRepo
+from src.Session import Session
+from src.bench.SyntheticPackage import SyntheticPackage
+from conftest import LANG
+
+"""
+    Several packages loaded together: their messages one after the other, each channel knowing its account.
+"""
+
+
+@pytest.fixture
+def alt(tmp_path_factory) -> str:
+    """A second package, in another language and owned by another user"""
+    return SyntheticPackage(str(tmp_path_factory.mktemp("alt")), lang="fr", channels=5, messages=800, seed=11).generate()
+
+
+@pytest.fixture
+def federation(package, alt):
+    Config.init(package, LANG, mounts=[package, alt])
+    repo = load_repo()
+    yield repo
+    # The merged guilds are mounted as the default GuildRepo
+    GuildRepo.mount(None)
+
+
+def test_messages_of_every_package(federation, package, alt):
+    assert isinstance(federation, FederatedRepo)
+    assert federation.get_n_accounts() == 2
+    Config.init(package, LANG)
+    first = MessageRepo(Config.MESSAGES)
+    Config.init(alt, "fr")
+    second = MessageRepo(Config.MESSAGES)
+    assert [m.id for m in federation.messages] == [m.id for m in first.messages + second.messages]
+    assert federation.get_n_channels() == first.get_n_channels() + second.get_n_channels()
+
+
+def test_accounts(federation):
+    owners = [config.USER_ID for config in federation.configs]
+    sizes = [repo.get_n_messages() for repo in federation.repos]
+    for owner, size in zip(owners, sizes):
+        assert len(Filter(FILTERS.InAccount, owner).compute_matches(federation.messages)) == size
+    session = Session(federation)
+    assert session.query(f'the total number of messages from account "{owners[1]}"') == sizes[1]
+
+
+def test_same_account_twice(package):
+    with pytest.raises(ValueError):
+        FederatedRepo([package, package])
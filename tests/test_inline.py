@@ -0,0 +1,37 @@
+from src.Inline import parse_script, run
+
+"""
+    Inline (batch) scripts: statements run in order over a single session, each one reporting its own error.
+"""
+
+SCRIPT = """
+# comments and blank lines are skipped
+
+define dms IsDM
+the total number of messages in #dms
+the total number of messages
+the total number of messages in #dms
+"""
+
+
+def test_parse_script():
+    statements = parse_script(SCRIPT.splitlines(keepends=True))
+    assert [s["kind"] for s in statements] == ["define", "query", "query", "query"]
+    assert statements[0]["name"] == "dms" and statements[0]["statement"] == "IsDM"
+    assert statements[1]["line"] == 5
+
+
+def test_run_matches_single_queries(session):
+    results = run(session, parse_script(SCRIPT.splitlines(keepends=True)))
+    assert all(result["error"] is None for result in results)
+    defined = results[0]["result"]
+    assert defined == len(session.get("dms"))
+    assert [result["result"] for result in results[1:]] == [defined, len(session.data), defined]
+    assert results[3]["cached"]
+
+
+def test_errors_stay_in_their_statement(session):
+    results = run(session, parse_script(["the number of 5-parsec sessions\n", "the top 0 words\n", "drop nothing\n", "the total number of messages\n"]))
+    assert all(result["error"] for result in results[:-1])
+    assert results[-1]["error"] is None
+    assert results[-1]["result"] == len(session.data)
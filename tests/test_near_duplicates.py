@@ -0,0 +1,39 @@
+import pytest
+
+from src.NearDuplicates import MIN_SHINGLES, NearDuplicateIndex, _shingles
+
+"""
+    Message id references of "near duplicates of" are looked up in the messages being filtered.
+"""
+
+
+def _reference(session):
+    return next(m for m in session.data if m.channel.type.name == "DM" and len(_shingles(m.content)) >= MIN_SHINGLES)
+
+
+def test_id_resolved_in_a_collection(session):
+    reference = _reference(session)
+    session.define("everything", range(len(session.data)))
+    query = f"the total number of messages near duplicates of {reference.id}"
+    matches = session.query(query)
+    assert matches >= 1
+    assert session.query(f"{query} in #everything") == matches
+
+
+def test_id_outside_of_the_filtered_messages(session):
+    reference = _reference(session)
+    session.define("guilds", "IsGuild")
+    with pytest.raises(ValueError):
+        session.query(f"the total number of messages near duplicates of {reference.id} in #guilds")
+
+
+def test_unknown_id(session):
+    with pytest.raises(ValueError):
+        session.query("the total number of messages near duplicates of 99999999999999999999")
+
+
+def test_clusters_hold_their_members(repo):
+    index = NearDuplicateIndex(repo.messages)
+    for cluster in index.clusters():
+        assert len(cluster) >= 2
+        assert len(set(cluster)) == len(cluster)
@@ -0,0 +1,43 @@
+import os
+import zipfile
+
+import pytest
+
+from src.Config import Config
+from src.MessageRepo import MessageRepo
+from src.PackageSource import is_archived
+from conftest import LANG
+
+"""
+    A package loads the same from its folder and from the export ZIP, whether the archive holds the package
+    folders at its root or inside a top level folder.
+"""
+
+
+def _zip(package: str, path: str, prefix: str = "") -> str:
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for folder, _, files in os.walk(package):
+            for name in files:
+                full = os.path.join(folder, name)
+                archive.write(full, prefix + os.path.relpath(full, package).replace(os.sep, "/"))
+    return path
+
+
+def _signature(repo: MessageRepo) -> list:
+    return [(m.id, m.timestamp, m.content, m.attachments, m.channel.id, m.channel.type, m.channel.guild_key) for m in repo.messages]
+
+
+@pytest.mark.parametrize("prefix", ["", "package/"])
+def test_zip_matches_folder(package, tmp_path, prefix):
+    Config.init(package, LANG)
+    folder = MessageRepo(Config.MESSAGES)
+    user = Config.USER_ID
+
+    Config.init(_zip(package, str(tmp_path / "package.zip"), prefix), LANG)
+    assert is_archived(Config.MESSAGES)
+    archive = MessageRepo(Config.MESSAGES)
+
+    assert _signature(archive) == _signature(folder)
+    assert archive.context == folder.context
+    assert [c.id for c in archive.channels] == [c.id for c in folder.channels]
+    assert Config.USER_ID == user
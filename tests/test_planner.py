@@ -0,0 +1,56 @@
+import pytest
+
+from src.FilterEngine import FilterEngine
+from src.FilterParser import parse_filter
+from src.Planner import normalize
+
+"""
+    The planner (normalization, index lookups, scans over candidates) must match exactly what the plain
+    evaluation of the tree (FilterGroup.compute_matches, every leaf scanned over every message) gives.
+"""
+
+TREES = [
+    "IsDM",
+    "~IsDM",
+    "IsDM | IsGroupDM",
+    "IsGuild & SentAfter(2021-01-01)",
+    "SentBetween(2019-06-01, 2022-06-01) & ~IsGuild",
+    "InGuild(\"Guild 0\") | InGuild(\"Guild 1\")",
+    "HasAttachments & ~HasAttachmentType(image)",
+    "HasAttachmentType(png, video) | HasAttachmentFrom(\"discordapp.net\")",
+    "MessageContains(lol, gg) & ~MessageContainsIgnoreCase(\"THE\")",
+    "MessageRegex(\"\\d\") | ContainsUrl",
+    "MessageLengthGt(40) & (IsDM | SentBefore(2020-01-01))",
+    # Negations pushed down to the leaves (De Morgan) and double negations
+    "~(IsDM | HasAttachments)",
+    "~(IsGuild & MessageContains(lol))",
+    "~~(HasUserMention | SentAfter(2023-01-01))",
+    "~(~IsDM & ~(HasAttachments | MessageLengthLt(5)))",
+    # Redundant and contradictory trees, folded by normalization
+    "IsDM & IsDM & (IsDM | HasAttachments)",
+    "IsDM & ~IsDM",
+    "AlwaysTrue | IsGuild",
+    "~AlwaysTrue",
+]
+
+
+@pytest.mark.parametrize("expr", TREES)
+def test_planner_matches_plain_evaluation(repo, expr):
+    data = repo.messages
+    engine = FilterEngine(data)
+    # Trees are parsed twice: combining groups reuses them, the plain evaluation must not see the planner's tree
+    assert engine.get_matching_indices(parse_filter(expr)) == parse_filter(expr).compute_matches(data)
+
+
+@pytest.mark.parametrize("expr", TREES)
+def test_normalization_keeps_matches(repo, expr):
+    data = repo.messages
+    assert normalize(parse_filter(expr)).compute_matches(data) == parse_filter(expr).compute_matches(data)
+
+
+def test_index_reused_between_plans(repo):
+    engine = FilterEngine(repo.messages)
+    first = engine.get_matching_indices(parse_filter("IsDM & HasAttachments"))
+    index = engine.index
+    assert engine.get_matching_indices(parse_filter("HasAttachments & IsDM")) == first
+    assert engine.index is index
@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import LANG, ROOT
+
+"""
+    quickload run the way scripts call it: a fresh process, the statements on stdin, the results on stdout.
+"""
+
+
+def _quickload(*args: str, script: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, os.path.join(ROOT, "quickload"), *args], input=script, capture_output=True, text=True, cwd=ROOT, timeout=120)
+
+
+def test_inline_run(package):
+    run = _quickload("--root", package, "--lang", LANG, script="the total number of messages\n")
+    assert run.returncode == 0, run.stderr
+    report = json.loads(run.stdout)
+    assert report["results"][0]["error"] is None
+    assert report["results"][0]["result"] > 0
+
+
+def test_signature_cache(package, repo, tmp_path):
+    cache = str(tmp_path / "signatures")
+    reference = next(m for m in repo.messages if len(m.content.split()) > 8)
+    script = f"the total number of messages near duplicates of {reference.id}\n"
+    for _ in range(2):
+        # The first run writes the signatures, the second one reads them back
+        run = _quickload("--root", package, "--lang", LANG, "--signature-cache", cache, script=script)
+        assert run.returncode == 0, run.stderr
+        result = json.loads(run.stdout)["results"][0]
+        assert result["error"] is None and result["result"] >= 1
+        assert os.listdir(cache)
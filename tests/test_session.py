@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+import src.Stat as s
+from src.Session import SessionError
+
+"""
+    Collections and cached results of a Session.
+"""
+
+
+def test_collection_names_ignore_case(session):
+    defined = len(session.define("DMs", "IsDM"))
+    assert "dms" in session and "DMS" in session
+    assert len(session.get("dMs")) == defined
+    assert session.query("the total number of messages in #DMs") == defined
+    assert session.query("the total number of messages in #dms") == defined
+    session.drop("DMS")
+    assert "DMs" not in session
+
+
+def test_redefinition_invalidates_cached_results(session):
+    session.define("picked", "IsDM")
+    assert session.query("the total number of messages in #picked") == len(session.get("picked"))
+    session.define("picked", "IsGuild")
+    assert session.query("the total number of messages in #picked") == len(session.get("picked"))
+
+
+def test_unknown_collection(session):
+    with pytest.raises(SessionError):
+        session.drop("missing")
+
+
+def test_concurrent_queries_and_redefinitions(session):
+    errors = []
+
+    def query():
+        try:
+            for _ in range(20):
+                session.query("the total number of messages in #picked")
+        except Exception as e:
+            errors.append(e)
+
+    session.define("picked", "IsDM")
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for expr in ("IsGuild", "IsDM", "HasAttachments") * 5:
+        session.define("picked", expr)
+    for thread in threads:
+        thread.join()
+    assert not errors
+    # Whatever the interleaving, the cached result is the one of the last definition
+    assert session.query("the total number of messages in #picked") == len(session.get("picked"))
+
+
+def test_scans_of_an_invalidated_query_are_dropped(session):
+    session.define("picked", "IsDM")
+    with session.shared_scans():
+        env = session.environment(["picked"])
+        generation = session.generation
+        s.Parser("the total number of messages in #picked").parse().eval(env)
+        assert env["_cache"] and not session.scan_cache
+        session.define("picked", "IsGuild")
+        session.merge_scans(env, generation)
+        assert not session.scan_cache
+        # Without an invalidation in between, the scans are kept for the next queries
+        env = session.environment(["picked"])
+        s.Parser("the total number of messages in #picked").parse().eval(env)
+        session.merge_scans(env, session.generation)
+        assert session.scan_cache == env["_cache"]
@@ -0,0 +1,86 @@
+from collections import Counter
+from datetime import date, timedelta
+from itertools import accumulate
+import re
+
+import pytest
+
+import src.Stat as s
+from src.Session import Session
+
+"""
+    Natural language Stat queries, checked against the messages themselves.
+"""
+
+
+@pytest.mark.parametrize("split", ["day of week", "month of year", "hour", "year"])
+def test_cumulative_keeps_the_split_order(session, split):
+    counts = session.query(f"the number of messages per {split}")
+    cumulative = session.query(f"cumulative number of messages per {split}")
+    assert list(cumulative.labels) == list(counts.labels)
+    assert list(cumulative) == list(accumulate(counts))
+    if split in ("day of week", "month of year"):
+        # Periods of a cycle follow the calendar, not the alphabet
+        assert list(cumulative.labels) != sorted(cumulative.labels)
+
+
+def test_rolling_window(session):
+    per_day = Counter(m.timestamp.date() for m in session.data)
+    rolling = session.query("3-day rolling total of the number of messages")
+    # Every day of the period has a bucket, days without messages included
+    assert len(rolling) == (max(per_day) - min(per_day)).days + 1
+    for label, total in zip(rolling.labels, rolling):
+        day = date.fromisoformat(label)
+        assert total == sum(per_day[day - timedelta(days=k)] for k in range(3))
+
+
+@pytest.mark.parametrize("pattern", [r"\d+", r"\D+", r"\W\w", r"\S{12}", r"^GG\b"])
+def test_regex_keeps_its_case(session, pattern):
+    # "matching" ignores the case of letters, not the one of escapes (\D is not \d)
+    expected = sum(1 for m in session.data if re.search(pattern, m.content, re.IGNORECASE))
+    assert session.query(f'the total number of messages matching "{pattern}"') == expected
+
+
+def test_tokenize_lowercases_keywords_only():
+    assert s.Parser.tokenize('The TOTAL of "AbC d"') == s.Parser.tokenize('the total of "AbC d"')
+    assert "AbC d" in " ".join(s.Parser.tokenize('the total of "AbC d"'))
+    assert Session.normalize('matching "\\D"') != Session.normalize('matching "\\d"')
+
+
+def test_clauses_match_filters(session):
+    expected = sum(1 for m in session.data if m.channel.type.name == "DM" and "lol" in m.content.lower())
+    assert session.query('the total number of messages in dms containing "LOL"') == expected
+
+
+@pytest.mark.parametrize("query", [
+    "the total number of messages in dm",
+    "the total number of messages containing good night",
+    "the total number of messages foo",
+    "the number of messages per day of weeks",
+])
+def test_unused_words_are_rejected(session, query):
+    with pytest.raises(s.ParseError):
+        session.query(query)
+
+
+def test_quoted_arguments_are_one_token(session):
+    expected = sum(1 for m in session.data if "to the" in m.content.lower())
+    assert expected
+    assert session.query('the total number of messages containing "To The"') == expected
+    assert session.query("the total number of messages the") == len(session.data)
+
+
+@pytest.mark.parametrize("query", ["average top 5 words", "total top 5 words", "the ratio of the total top 5 words over the total number of words"])
+def test_aggregates_of_rankings_are_rejected(session, query):
+    with pytest.raises(s.ParseError):
+        s.Parser(query).parse()
+    with pytest.raises(s.ParseError):
+        session.query(query)
+
+
+def test_rankings(session):
+    top = session.query("the top 3 words")
+    assert len(top) == 3
+    counts = Counter(word for m in session.data for word in m.content.lower().split())
+    assert [count for _, count in top] == sorted((count for _, count in top), reverse=True)
+    assert top[0][1] == counts[top[0][0]]
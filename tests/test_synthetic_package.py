@@ -0,0 +1,44 @@
+import json
+import os
+
+from src.Config import Config
+from src.MessageRepo import MessageRepo
+from src.bench.SyntheticPackage import SyntheticPackage
+
+"""
+    The generated packages have the layout of a real export and only depend on their parameters and seed.
+"""
+
+
+def _files(root: str) -> dict:
+    contents = {}
+    for folder, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(folder, name)
+            with open(path, "rb") as file:
+                contents[os.path.relpath(path, root)] = file.read()
+    return contents
+
+
+def test_same_seed_same_package(tmp_path):
+    first = SyntheticPackage(str(tmp_path / "a"), messages=500, channels=5, seed=3).generate()
+    second = SyntheticPackage(str(tmp_path / "b"), messages=500, channels=5, seed=3).generate()
+    other = SyntheticPackage(str(tmp_path / "c"), messages=500, channels=5, seed=4).generate()
+    assert _files(first) == _files(second)
+    assert _files(first) != _files(other)
+
+
+def test_folders_follow_the_locale(tmp_path):
+    root = SyntheticPackage(str(tmp_path / "fr"), lang="fr", messages=100, channels=3).generate()
+    with open(os.path.join("locale", "fr.json")) as file:
+        folders = json.load(file)
+    assert os.path.isdir(os.path.join(root, folders["messages"]))
+    assert os.path.isfile(os.path.join(root, folders["account"], "user.json"))
+
+
+def test_loads_every_message(tmp_path):
+    root = SyntheticPackage(str(tmp_path / "en"), messages=1234, channels=7, seed=1).generate()
+    Config.init(root, "en")
+    repo = MessageRepo(Config.MESSAGES)
+    assert repo.get_n_messages() == 1234
+    assert repo.get_n_channels() == 7
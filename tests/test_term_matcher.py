@@ -0,0 +1,40 @@
+import re
+
+import pytest
+
+from src.utils.TermMatcher import TermMatcher
+
+"""
+    TermMatcher against the naive search: any(term in text) for every term, and the leftmost longest count.
+"""
+
+TERM_SETS = [
+    ("lol",),
+    ("gg", "gm", "good", "go"),
+    ("a", "e", "!"),
+    ("the", "they", "their", "then"),
+    ("c++", "(x)", "a.b"),
+    ("", "never"),
+]
+
+
+def _naive_count(terms, text: str) -> int:
+    words = sorted((t for t in terms if t), key=len, reverse=True)
+    return len(re.findall("|".join(map(re.escape, words)), text)) if words else 0
+
+
+@pytest.mark.parametrize("terms", TERM_SETS)
+@pytest.mark.parametrize("ignore_case", [False, True])
+def test_search_and_count_match_naive(repo, terms, ignore_case):
+    matcher = TermMatcher(terms, ignore_case)
+    texts = [m.content for m in repo.messages] + ["GG Good GOOD", "c++ and (x) or a.b", "Their THEN"]
+    for text in texts:
+        haystack = text.lower() if ignore_case else text
+        wanted = [t.lower() if ignore_case else t for t in terms]
+        assert matcher.search(text) == any(t in haystack for t in wanted)
+        assert matcher.count(text) == _naive_count(wanted, haystack)
+
+
+def test_counts_per_term():
+    matcher = TermMatcher(("gg", "good"), ignore_case=True)
+    assert matcher.counts("GG gg Good goods") == {"gg": 2, "good": 2}